@@ -1,24 +1,37 @@
-import random
 import numpy as np
 
 import gymnasium as gym
 from gymnasium import spaces
 from gymnasium.error import InvalidAction
 
-from objects_v3 import Car, Obstacle, Circle
-import pygame
+from objects_v3 import Car, ObjectPool, EMPTY, OBSTACLE, CIRCLE
 
 # Define game params.
 STATE_W = 96
 STATE_H = 96
+STACK_W = 84  ## Frame size of obs_type="gray_stack", as ResizeObservation(84)
+STACK_H = 84
 VIDEO_W = 400
 VIDEO_H = 600
 FPS = 45  ## Frames per second
+SCORE_H = 40  ## Height of the score strip cropped out of observations
 
 CAR_WIDTH = VIDEO_W*3//40
 CAR_HEIGHT = VIDEO_H*3//40
+CAR_BOTTOM = VIDEO_H - 10  ## Car.rect.bottom
+CAR_TOP = CAR_BOTTOM - CAR_HEIGHT
 OBSTACLE_WIDTH = VIDEO_W//20
 OBSTACLE_HEIGHT = VIDEO_W//20
+## Objects whose rect.y is at most this can't touch a car, be missed or be
+## killed in this tick
+SAFE_Y = CAR_TOP - OBSTACLE_HEIGHT
+
+# Gameplay params
+GAME_SPEED = 19  ## Pixels moved by the non-car objects per step
+MAX_SCORE = 200  ## Episode is truncated once the score reaches this
+SPAWN_GAPS, GAP_WEIGHTS = [150, 250], [0.2, 0.8]   # gap between objects
+LANE_WEIGHTS = [0.2, 0.8]   # [same lane, other lane] for the next object
+OBJECT_WEIGHTS = [0.55, 0.45]   # [obstacle, circle] for the next object
 
 # Colors
 WHITE = (255, 255, 255)
@@ -26,7 +39,41 @@ RED = (245, 30, 80)
 PURPLE = (28, 46, 121)
 TURQUOISE = (51, 204, 204)
 BLUE_VIOLET = (150, 156, 230)
-colors = [RED, TURQUOISE]
+GOLD = (250, 190, 40)
+LIME = (120, 220, 80)
+colors = [RED, TURQUOISE, GOLD, LIME]  # one per car
+GRAY_WEIGHTS = np.array([0.299, 0.587, 0.114])  # RGB -> luma, as GrayScaleObservation
+
+
+def object_slots(n_cars):
+    # Slots the objects of `n_cars` cars can fill: those of a car are more
+    # than the shortest spawn gap apart from above the screen to its bottom
+    return n_cars * ((VIDEO_H + OBSTACLE_HEIGHT) // min(SPAWN_GAPS) + 2)
+
+
+def object_colours(n_cars):
+    # {kind: colour} of the obstacles and circles of every car: turquoise
+    # obstacles and red circles for one car, and with several (as in the
+    # 2 Cars game) the colour of the car whose lanes they are in
+    if n_cars == 1:
+        return [{OBSTACLE: TURQUOISE, CIRCLE: RED}]
+    return [{OBSTACLE: colors[i], CIRCLE: colors[i]} for i in range(n_cars)]
+
+
+def start_lane(i):
+    # Car i drives in lanes 2i+1 and 2i+2. Cars start in pairs next to the
+    # line between them: lanes 2 and 3, then 6 and 7, ...
+    return 2*i + 1 + (i % 2 == 0)
+
+
+def car_action_space(n_cars, continuous):
+    # One action per car. Continuous: -1 for left, 0 for nothing, 1 for
+    # right; discrete: 1 for left, 0 for nothing, 2 for right
+    if continuous:
+        return spaces.Box(low=-1, high=1, shape=(n_cars,))
+    if n_cars == 1:
+        return spaces.Discrete(3)
+    return spaces.MultiDiscrete([3] * n_cars)
 
 
 class OneCarEnv(gym.Env):
@@ -41,122 +88,229 @@ class OneCarEnv(gym.Env):
         "render_fps": FPS
     }
 
-    def __init__(self, render_mode=None, continuous=True):
+    def __init__(self, render_mode=None, continuous=True, renderer="pygame",
+                 obs_type="pixels", n_nearest=2, stack_frames=4, profile=False,
+                 n_cars=1, frame_skip=1, obs_cache=0, channels_first=False, obs_out=None,
+                 engine="python"):
         assert render_mode is None or render_mode in self.metadata["render_modes"]
+        assert 1 <= n_cars <= len(colors)
+        assert frame_skip >= 1
+        assert renderer in ["pygame", "numpy"]
+        assert engine in ["python", "numba"]
+        assert obs_type in ["pixels", "features", "gray_stack"]
+        assert not channels_first or obs_type == "pixels"
         self.render_mode = render_mode
-
-        pygame.init()
-        random.seed(random.randint(0, 100))
-
-        self.n_cars = 1
+        self.renderer = renderer
+        self.obs_type = obs_type
+        self.n_nearest = n_nearest
+        self.stack_frames = stack_frames
+        self.frame_skip = frame_skip   # game ticks per step; only the last is drawn
+        self.channels_first = channels_first   # pixels as (3, H, W)
+
+        # Pixel observations of recently seen game states, see _state_pixels
+        self.obs_cache = None
+        if obs_cache and obs_type == "pixels":
+            from obs_cache import ObsCache
+            self.obs_cache = ObsCache(obs_cache)
+
+        # Per-stage step timings, see profiling.py and stage_times()
+        self.timer = None
+        if profile:
+            from profiling import StageTimer
+            self.timer = StageTimer()
+
+        self.n_cars = n_cars
         self.lane_width = VIDEO_W // (2*self.n_cars)   # There are 2n_cars lanes in total
         self.screen_w = 2 * self.lane_width * self.n_cars
         self.screen_h = VIDEO_H
 
         self.continuous = continuous
         self.isopen = True
+        # pygame is imported on the first frame drawn, and the display is
+        # only opened for render_mode="human"
+        self.screen = None
         self.clock = None
-
-        self.all_sprites = pygame.sprite.Group()
-        self.cars = pygame.sprite.Group()
-        self.obstacles = pygame.sprite.Group()
-        self.circles = pygame.sprite.Group()
-
-        self.last_obj = []    # last_obj: last object introduced onto the field
+        self.font = None
+        # Frames are drawn in place on one canvas, see _draw_canvas
+        self.surf = None
+        self._background = None
+        self._drawn = {}            # (id(image), x, y) -> Rect of the sprites on self.surf
+        self._score_text = None     # (score, its rendered text)
+        self._screen_dirty = None   # Rects of self.surf not yet on the display; None: all
+        self._scaled = {}           # size -> Surface of the scaled frame
+
+        self.cars = []
+        # Obstacles and circles live in a fixed-size pool, see objects_v3
+        capacity = object_slots(self.n_cars)
+        self.objects = ObjectPool(capacity, object_colours(self.n_cars),
+                                  self.lane_width)
+
+        self.last_obj = []    # last_obj: pool slot of the last object introduced onto the field
         self.spawn_lane = []  # spawn_lane: lane in which the next object will be introduced
 
         for i in range(self.n_cars):
-            car = Car(2*i+1, 2*i+2, colors[i])
-            self.cars.add(car)
-            self.all_sprites.add(car)
-            car.set_lane(2 + i)
+            car = Car(2*i+1, 2*i+2, colors[i], self.lane_width)
+            self.cars.append(car)
+            car.set_lane(start_lane(i))
 
             self.last_obj.append(None)
-            self.spawn_lane.append(random.randint(2*i+1, 2*i+2))
+            self.spawn_lane.append(2*i+1 + int(self.np_random.random() < 0.5))
 
         self.score = 0
         self.prev_score = 0
-        self.game_speed = 19
+        self.game_speed = GAME_SPEED
+
+        # Array copy of the game for the rasterizer
+        self._car_lane = np.zeros((1, self.n_cars), dtype=np.int32)
+        self._obj_kind = np.zeros((1, capacity), dtype=np.int8)
+        self._obj_lane = np.ones((1, capacity), dtype=np.int32)
+        self._obj_y = np.zeros((1, capacity), dtype=np.int32)
+
+        # "numba" plays the ticks on these arrays with a compiled kernel (or
+        # plain Python without Numba), see numba_engine.py
+        self.engine = engine
+        self._engine_tick = None
+        if engine == "numba":
+            import numba_engine
+            self._engine_tick = numba_engine.tick
+            self._engine_features = numba_engine.features
+            self._spawn_lane = np.zeros(self.n_cars, dtype=np.int32)
+            self._last_y = np.zeros(self.n_cars, dtype=np.int32)
+
+        # "numpy" draws state_pixels without pygame Surfaces, see raster.py
+        self.rasterizer = None
+        if self.renderer == "numpy":
+            from raster import Rasterizer
+            if self.obs_type == "gray_stack":
+                self.rasterizer = Rasterizer(self.n_cars, (STACK_W, STACK_H), grayscale=True)
+            else:
+                self.rasterizer = Rasterizer(self.n_cars)
+                self._frame = np.zeros((1, STATE_H, STATE_W, 3), dtype=np.uint8)
+
+        # Lanes and nearby objects instead of an image, see features.py and
+        # features(); the observation with obs_type="features"
+        from features import feature_space
+        self._feature_shape = feature_space(self.n_cars, self.n_nearest).shape
+        if self.obs_type == "features":
+            self.observation_space = feature_space(self.n_cars, self.n_nearest)
+        elif self.obs_type == "gray_stack":
+            # What the notebook's ResizeObservation(84), GrayScaleObservation
+            # and FrameStack(stack_frames) make of the frames, in one pass:
+            # every frame is downsampled once from the full canvas into a
+            # ring of the last `stack_frames` frames.
+            self.observation_space = spaces.Box(
+                low=0, high=255, shape=(stack_frames, STACK_H, STACK_W), dtype=np.uint8
+                )
+            self._stack = np.zeros(self.observation_space.shape, dtype=np.uint8)
+            self._head = 0   # slot of the newest frame
+        else:
+            shape = (3, STATE_H, STATE_W) if channels_first else (STATE_H, STATE_W, 3)
+            self.observation_space = spaces.Box(low=0, high=255, shape=shape, dtype=np.uint8)
 
-        self.observation_space = spaces.Box(
-            low=0, high=255, shape=(STATE_H, STATE_W, 3), dtype=np.uint8
-            )
+        # Observations are written into obs_out instead of new arrays:
+        # True for a buffer owned by the env, or any array of the
+        # observation's shape and dtype, e.g. a row of a batch.
+        self.obs_out = None
+        if obs_out is True:
+            obs_out = np.zeros(self.observation_space.shape, self.observation_space.dtype)
+        if obs_out is not None:
+            self.set_obs_out(obs_out)
 
-        if self.continuous:
-            # -1 for left, 0 for nothing, 1 for right
-            self.action_space = spaces.Box(low=-1, high=1)
-        else:
-            # 1 for left, 0 for nothing, 2 for right
-            self.action_space = spaces.Discrete(3)
+        self.action_space = car_action_space(self.n_cars, self.continuous)
 
     def reset(self, *, seed = None, options=None):
         super().reset(seed=seed)
 
-        self.all_sprites.empty()
-        self.obstacles.empty()
-        self.circles.empty()
+        self.objects.clear()
 
         i = 0
         for car in self.cars:
-            self.all_sprites.add(car)
-            car.set_lane(2 + i)
+            car.set_lane(start_lane(i))
             i += 1
 
         self.score = 0
         self.prev_score = 0
-        self.game_speed = 19
+        self.game_speed = GAME_SPEED
 
         # Initialize last object and spawn lane for each car
         self.last_obj = [None] * self.n_cars
-        self.spawn_lane = [random.randint(2*i+1, 2*i+2) for i in range(self.n_cars)]
+        self.spawn_lane = [2*i+1 + int(u < 0.5)
+                           for i, u in enumerate(self.np_random.random(self.n_cars))]
+        if self._engine_tick is not None:
+            self._car_lane[0] = [start_lane(i) for i in range(self.n_cars)]
+            self._obj_kind[0] = EMPTY
+            self._spawn_lane[:] = self.spawn_lane
+            self._last_y[:] = VIDEO_H   # as if the last object had left the field
 
-        self.screen = pygame.display.set_mode((VIDEO_W, VIDEO_H))
         if self.render_mode == "human":
+            if self.screen is None:
+                import pygame
+                pygame.display.init()
+                self.screen = pygame.display.set_mode((VIDEO_W, VIDEO_H))
+                self.clock = pygame.time.Clock()
+                self._screen_dirty = None
             self.render()
-        if self.continuous:
-            return self.step(action=[0.0])[0], {}  # Gym's LunarLander env
-        else:
-            return self.step(action=0)[0], {}
+        # A do-nothing tick (Gym's LunarLander env), whatever the frame_skip
+        if self.timer:
+            self.timer.start()
+        obs = self._step([0] * self.n_cars, ticks=1)[0]
+        if self.obs_type == "gray_stack":
+            # Like FrameStack, start with the first frame repeated
+            self._stack[:] = self._stack[self._head]
+            if self.obs_out is None:
+                obs = self.state = self._stack.copy()
+            else:
+                self.obs_out[...] = self._stack
+        return obs, {}
+
+    def set_obs_out(self, out):
+        """
+        Write the next observations into `out`, e.g. the env's slot of a
+        vector batch or the next row of a replay buffer; None for new
+        arrays. `step` and `reset` then return `out` itself.
+        """
+        if out is not None and (out.shape != self.observation_space.shape
+                                or out.dtype != self.observation_space.dtype):
+            raise ValueError(f"obs_out must be a {self.observation_space.dtype} array "
+                             f"of shape {self.observation_space.shape}, not {out.dtype} "
+                             f"{out.shape}")
+        self.obs_out = out
 
     def _hit_obstacle(self):
         # Check for collisions for either car
+        kind = self.objects.kind
         for car in self.cars:
-            if pygame.sprite.spritecollide(car, self.obstacles, False):
-                return True
+            for i in self.objects.colliding(car):
+                if kind[i] == OBSTACLE:
+                    return True
 
     def _update_score(self):
         # Check for collection of circles
         for car in self.cars:
-            for circle in pygame.sprite.spritecollide(car, self.circles, False):
-                self.score += 1
-                circle.kill()
+            for i in self.objects.colliding(car):
+                if self.objects.kind[i] == CIRCLE:
+                    self.score += 1
+                    self.objects.kill(i)
 
     def _has_missed_circles(self):
         # Check for missed circles
-        for circle in self.circles:
-            if circle.rect.y > self.screen_h - CAR_HEIGHT:
+        kind = self.objects.kind
+        for i in self.objects.below(self.screen_h - CAR_HEIGHT):
+            if kind[i] == CIRCLE:
                 return True
 
     def _spawn_objects(self):
-        # Spawn new objects
+        # Spawn new objects. Every car draws three uniforms per step (gap, lane
+        # and type), in the same order as OneCarVectorEnv, from self.np_random.
+        u = self.np_random.random((self.n_cars, 3))
         for i in range(self.n_cars):
-            gap = random.choices([150, 250], [0.2, 0.8])[0]   # gap between objects
-
-            if self.last_obj[i] == None or self.last_obj[i].rect.y > gap:
-                self.spawn_lane[i] = random.choices([self.spawn_lane[i], 4*i-self.spawn_lane[i] + 3],
-                                                    [0.2, 0.8])[0]   # lane of the next object
-                obj = random.choices(['obstacle', 'circle'], [0.55, 0.45])[0]   # type of the next object   
-
-                if obj == 'obstacle':
-                    obstacle = Obstacle(self.spawn_lane[i], TURQUOISE)
-                    self.all_sprites.add(obstacle)
-                    self.obstacles.add(obstacle)
-                    self.last_obj[i] = obstacle
-                else:
-                    circle = Circle(self.spawn_lane[i], RED)
-                    self.all_sprites.add(circle)
-                    self.circles.add(circle)
-                    self.last_obj[i] = circle
+            gap = SPAWN_GAPS[0] if u[i, 0] < GAP_WEIGHTS[0] else SPAWN_GAPS[1]   # gap between objects
+
+            if self.last_obj[i] == None or self.objects.y[self.last_obj[i]] > gap:
+                if u[i, 1] >= LANE_WEIGHTS[0]:   # lane of the next object
+                    self.spawn_lane[i] = 4*i-self.spawn_lane[i] + 3
+                obj = OBSTACLE if u[i, 2] < OBJECT_WEIGHTS[0] else CIRCLE   # type of the next object
+                self.last_obj[i] = self.objects.spawn(obj, self.spawn_lane[i])
 
     def step(self, action):
         """
@@ -165,50 +319,162 @@ class OneCarEnv(gym.Env):
             a. The amount to move is pre-determined by the game field's dimensions.
         2. Existing non-car objects move in the field.
         3. New non-car objects might be introduced onto the field.
+        With frame_skip=k this is played k times with the same action
+        (stopping early if the episode ends) and only the last frame is drawn.
         """
+        timer = self.timer
+        if timer:
+            timer.start()
+
         # Check if the action is a valid action
         if self.continuous:
-            self.cars.update(action[0], self.continuous)
+            actions = action
         else:
-            if not self.action_space.contains(action):
+            if self.n_cars == 1:
+                valid = self.action_space.contains(action)
+                actions = [action]
+            else:
+                # MultiDiscrete.contains, without its overhead
+                actions = np.asarray(action)
+                valid = (actions.shape == self.action_space.shape and actions.dtype.kind in "iu"
+                         and 0 <= actions.min() and actions.max() < 3)
+            if not valid:
                 raise InvalidAction(
                     f"You passed the invalid action `{action}`. " 
                     f"The supported action_space is `{self.action_space}`"  
                 )
-            self.cars.update(action, self.continuous)
+        if timer:
+            timer.lap("validate")
+        return self._step(actions, self.frame_skip)
+
+    def _step(self, actions, ticks):
+        # Play `ticks` game ticks with the same actions, then observe
+        timer = self.timer
+        step_reward = 0
+        tick = self._tick
+        if self._engine_tick is not None:
+            tick = self._engine_step
+            actions = np.asarray(actions, dtype=np.float64)
+        for _ in range(ticks):
+            reward, terminated, truncated = tick(actions)
+            step_reward += reward
+            if terminated or truncated:
+                break
+        if self._engine_tick is not None and (
+                self.render_mode is not None or self.obs_cache is not None
+                or (self.rasterizer is None and self.obs_type != "features")):
+            self._load_engine_state()
+
+        if self.obs_type == "features":
+            self.state = self._features(self.obs_out)
+            if timer:
+                timer.lap("render.features")
+        elif self.obs_type == "gray_stack":
+            self.state = self._push_frame(self.obs_out)
+        else:
+            self.state = self._state_pixels(self.obs_out)
+
+        if self.render_mode == "human":
+            self.render()
+        if timer:
+            return self.state, step_reward, terminated, truncated, {"stage_times": timer.last}
+        return self.state, step_reward, terminated, truncated, {}
+
+    def _tick(self, actions):
+        # One tick of the game; returns (reward, terminated, truncated)
+        timer = self.timer
+        for car, car_action in zip(self.cars, actions):
+            car.update(car_action, self.continuous)
+        if timer:
+            timer.lap("cars")
 
         # Introduce new non-car objects
         self._spawn_objects()
+        if timer:
+            timer.lap("spawn")
 
         # Which direction does the car want to move? Then move.
-        self.circles.update(self.game_speed)
-        self.obstacles.update(self.game_speed)
+        self.objects.update(self.game_speed)
         # self.cars.update(action)
-
-        for obstacle in self.obstacles:  # Kill the obstacles we have dodged
-            if obstacle.rect.y > self.screen_h - OBSTACLE_HEIGHT:
-                obstacle.kill()
+        if timer:
+            timer.lap("move")
 
         step_reward = 0
         terminated = False
         truncated = False
+        if self.objects.lowest() <= SAFE_Y:
+            # Nothing is level with the cars yet: no kills, hits, misses or points
+            if timer:
+                timer.skip("kill", "hit_obstacle", "missed_circles", "score")
+            return step_reward, terminated, truncated
+
+        # Kill the obstacles we have dodged
+        kind = self.objects.kind
+        for i in self.objects.below(self.screen_h - OBSTACLE_HEIGHT):
+            if kind[i] == OBSTACLE:
+                self.objects.kill(i)
+        if timer:
+            timer.lap("kill")
+
         # Check for collisions or missed circles
-        if(self._hit_obstacle() or self._has_missed_circles()):
+        hit = self._hit_obstacle()
+        if timer:
+            timer.lap("hit_obstacle")
+        if(hit or self._has_missed_circles()):
             step_reward = -10  # New addition
             terminated = True
+        if timer:
+            timer.lap("missed_circles")
 
         # Update the score
         self.prev_score = self.score
         self._update_score()  # Check if circles have been collected
         step_reward = self.score - self.prev_score
-        if self.score >= 200:
+        if self.score >= MAX_SCORE:
             truncated = True
+        if timer:
+            timer.lap("score")
+        return step_reward, terminated, truncated
+
+    def _engine_step(self, actions):
+        # One tick with the numba engine; returns (reward, terminated, truncated)
+        collected, terminated, checked = self._engine_tick(
+            actions, self.continuous, self.np_random.random((self.n_cars, 3)),
+            self._car_lane[0], self._spawn_lane, self._last_y,
+            self._obj_kind[0], self._obj_lane[0], self._obj_y[0], self.game_speed)
+        self.prev_score = self.score
+        self.score += collected
+        if self.timer:
+            self.timer.lap("engine")
+        return collected, terminated, checked and self.score >= MAX_SCORE
+
+    def _load_engine_state(self):
+        # Copy the numba engine's arrays into the cars and objects, to draw them
+        for car, lane in zip(self.cars, self._car_lane[0].tolist()):
+            if car.lane != lane:
+                car.set_lane(lane)
+        self.objects.load(self._obj_kind[0], self._obj_lane[0], self._obj_y[0])
+
+    def features(self):
+        """
+        The `obs_type="features"` observation of the game as it is now, as a
+        new array, whatever this env's obs_type; e.g. for scripted policies.
+        """
+        return self._features()
 
-        self.state = self._render("state_pixels")  # From CarRacing L561
+    def object_count(self):
+        """Non-car objects on the field."""
+        if self._engine_tick is not None:
+            return int(np.count_nonzero(self._obj_kind[0] != EMPTY))
+        return sum(len(queue) for queue in self.objects.lanes)
 
-        if self.render_mode == "human":
-            self.render()
-        return self.state, step_reward, terminated, truncated, {}
+    def stage_times(self):
+        """
+        Time spent in every stage of `step` since the env was built (or
+        `self.timer.reset()`), slowest first. Needs `profile=True`.
+        """
+        assert self.timer is not None, "Build the env with profile=True"
+        return self.timer.summary()
 
     def render(self):
         if self.render_mode is None:
@@ -219,44 +485,33 @@ class OneCarEnv(gym.Env):
             )
             return
         else:
+            if self.timer:
+                self.timer.mark()
             return self._render(self.render_mode)
 
     def _render(self, mode):
         assert mode in self.metadata["render_modes"]
+        if mode == "state_pixels" and self.rasterizer is not None:
+            return self._rasterize()
 
-        if self.clock is None:
-            self.clock = pygame.time.Clock()
-        self.surf = pygame.Surface((VIDEO_W, VIDEO_H))
-
-        # draw the canvas and objects
-        self.surf.fill(PURPLE)  # Earlier self.screen
-        self.all_sprites.draw(self.surf)  # Earlier self.screen
-
-        # display score
-        font = pygame.font.SysFont(None, 50)
-        text = font.render(f"{self.score}", True, WHITE)
-        self.surf.blit(text, (self.screen_w - 40, 10))  # Earlier self.screen
-
-        # Draw lanes
-        for i in range(1, 2*self.n_cars):
-            pygame.draw.line(self.surf, BLUE_VIOLET,
-                             (self.lane_width * i, 0),
-                             (self.lane_width * i, VIDEO_H), 2)
-
-        # self.surf = pygame.transform.flip(self.surf, False, True)
-        # pygame.display.flip()  # Earlier uncommented
-
-        # increase game speed with time proportional to score
-        # self.game_speed += (self.score * 0.00001)
+        self._draw_canvas()
 
         if mode == "human":
+            import pygame
             pygame.event.pump()
             self.clock.tick(self.metadata["render_fps"])
             assert self.screen is not None
 
-            self.screen.fill(0)
-            self.screen.blit(self.surf, (0, 0))
-            pygame.display.flip()
+            dirty = self._screen_dirty
+            if dirty is None:
+                self.screen.blit(self.surf, (0, 0))
+                pygame.display.flip()
+            elif dirty:
+                self.screen.blits([(self.surf, rect, rect) for rect in dirty], doreturn=False)
+                pygame.display.update(dirty)
+            self._screen_dirty = []
+            if self.timer:
+                self.timer.lap("render.display")
         elif mode == "rgb_array":
             return self._create_image_array(self.surf, (VIDEO_W, VIDEO_H))
         elif mode == "state_pixels":
@@ -264,25 +519,204 @@ class OneCarEnv(gym.Env):
         else:
             return self.isopen
 
-    def _create_image_array(self, screen, size):
-        # Crop the screen to remove the score
-        cropped = pygame.Surface((self.screen_w, self.screen_h - 40))
-        cropped.blit(screen, (0, 0), (0, 40, self.screen_w, self.screen_h))
-
-        # Resize the screen
-        scaled_screen = pygame.transform.smoothscale(cropped, size)
-        return np.transpose(
-            np.array(pygame.surfarray.pixels3d(scaled_screen)), axes=(1, 0, 2)
-        )
+    def _draw_canvas(self):
+        # Draw the game on the full resolution self.surf, in place: only the
+        # sprites (cars, objects, score) that changed since the last frame
+        # are erased with the background and drawn again, along with any
+        # sprite they overlap. The lane lines are part of the background;
+        # no sprite ever crosses them.
+        import pygame
+        if self.font is None:
+            pygame.font.init()
+            self.font = pygame.font.Font(None, 50)   # what SysFont(None, 50) loads
+            self._score_text = None
+        if self.surf is None:
+            self._background = pygame.Surface((VIDEO_W, VIDEO_H))
+            self._background.fill(PURPLE)
+            for i in range(1, 2*self.n_cars):
+                pygame.draw.line(self._background, BLUE_VIOLET,
+                                 (self.lane_width * i, 0),
+                                 (self.lane_width * i, VIDEO_H), 2)
+            self.surf = self._background.copy()
+            self._drawn = {}
+            self._screen_dirty = None
+
+        if self._score_text is None or self._score_text[0] != self.score:
+            self._score_text = (self.score, self.font.render(f"{self.score}", True, WHITE))
+
+        # Sprites bottom to top, as they were drawn on a fresh canvas
+        sprites = [(car.image, (car.left, car.top)) for car in self.cars]
+        sprites += self.objects.sprites()
+        sprites.append((self._score_text[1], (self.screen_w - 40, 10)))
+        new = {(id(image), *pos): pygame.Rect(pos, image.get_size()) for image, pos in sprites}
+
+        drawn = self._drawn
+        erase = [rect for key, rect in drawn.items() if key not in new]
+        redraw = set()
+        grown = True
+        while grown:
+            grown = False
+            for key, rect in new.items():
+                if key not in redraw and (key not in drawn or rect.collidelist(erase) != -1):
+                    redraw.add(key)
+                    erase.append(rect)
+                    grown = True
+
+        background = self._background
+        self.surf.blits([(background, rect, rect) for rect in erase], doreturn=False)
+        self.surf.blits([sprite for sprite, key in zip(sprites, new) if key in redraw],
+                        doreturn=False)
+        self._drawn = new
+        if self._screen_dirty is not None and self.screen is not None:
+            self._screen_dirty += erase
+        if self.timer:
+            self.timer.lap("render.draw")
+
+    def _push_frame(self, out=None):
+        # Draw a grayscale frame into the oldest slot of the ring and return
+        # the stack, oldest frame first (in `out` if given)
+        self._head = (self._head + 1) % self.stack_frames
+        frame = self._stack[self._head]
+        if self.rasterizer is not None:
+            self._sync_arrays()
+            self.rasterizer.draw(frame[None], self._car_lane, self._obj_y,
+                                 self._obj_lane, self._obj_kind)
+            if self.timer:
+                self.timer.lap("render.raster")
+        else:
+            self._draw_canvas()
+            rgb = self._create_image_array(self.surf, (STACK_W, STACK_H))
+            frame[...] = np.rint(rgb @ GRAY_WEIGHTS)
+            if self.timer:
+                self.timer.lap("render.gray")
+        order = np.arange(self._head + 1, self._head + 1 + self.stack_frames) % self.stack_frames
+        # mode="raise" would fill a temporary copy of `out`
+        stack = self._stack.take(order, axis=0, out=out, mode="clip")
+        if self.timer:
+            self.timer.lap("render.stack")
+        return stack
+
+    def _features(self, out=None):
+        # Same layout as features.encode_features, built in plain Python
+        if self._engine_tick is not None:
+            obs = np.empty(self._feature_shape, np.float32) if out is None else out
+            return self._engine_features(obs, self._car_lane[0], self._obj_kind[0], self._obj_lane[0],
+                            self._obj_y[0], self.game_speed, self.n_nearest)
+        lanes = [[] for _ in range(2*self.n_cars)]
+        objects = self.objects
+        for i, kind in objects:
+            lanes[objects.lane[i] - 1].append((objects.y[i], 1.0 if kind == OBSTACLE else -1.0))
+
+        obs = [car.get_lane() - (2*i+1) for i, car in enumerate(self.cars)]
+        for objects in lanes:
+            objects.sort(reverse=True)   # nearest first
+            for y, kind in objects[:self.n_nearest]:
+                obs += [(CAR_TOP - OBSTACLE_HEIGHT - y) / VIDEO_H, kind]
+            obs += [1.0, 0.0] * (self.n_nearest - len(objects[:self.n_nearest]))
+        obs.append(self.game_speed / VIDEO_H)
+        if out is None:
+            return np.array(obs, dtype=np.float32)
+        out[:] = obs
+        return out
+
+    def _state_pixels(self, out=None):
+        # The state_pixels observation, in the observation layout, from the
+        # cache when the same score, car lanes and objects were drawn
+        # before. Cached frames are read-only.
+        cache = self.obs_cache
+        if cache is None:
+            return self._draw_pixels(out)
+        objects = self.objects
+        key = (self.score, *[car.lane for car in self.cars],
+               *sorted((kind, objects.lane[i], objects.y[i]) for i, kind in objects))
+        frame = cache.get(key)
+        if frame is None:
+            frame = cache.put(key, self._draw_pixels())
+        if out is not None:
+            out[...] = frame
+            frame = out
+        if self.timer:
+            self.timer.lap("render.cache")
+        return frame
+
+    def _draw_pixels(self, out=None):
+        # From CarRacing L561
+        if self.rasterizer is not None:
+            return self._rasterize(out, self.channels_first)
+        self._draw_canvas()
+        return self._create_image_array(self.surf, (STATE_W, STATE_H), out, self.channels_first)
+
+    def _sync_arrays(self):
+        # Copy the game into the rasterizer's batch-of-one arrays (where the
+        # numba engine keeps it already)
+        if self._engine_tick is not None:
+            return
+        for i, car in enumerate(self.cars):
+            self._car_lane[0, i] = car.get_lane()
+        self._obj_kind[0] = self.objects.kind
+        self._obj_lane[0] = self.objects.lane
+        self._obj_y[0] = self.objects.y
+
+    def _rasterize(self, out=None, channels_first=False):
+        self._sync_arrays()
+        state = (self._car_lane, self._obj_y, self._obj_lane, self._obj_kind)
+        if out is not None and not channels_first:
+            self.rasterizer.draw(out[None], *state)
+            frame = out
+        else:
+            frame = self._to_array(self.rasterizer.draw(self._frame, *state)[0],
+                                   out, channels_first)
+        if self.timer:
+            self.timer.lap("render.raster")
+        return frame
+
+    @staticmethod
+    def _to_array(frame, out, channels_first):
+        # Copy an (H, W, 3) view once, into `out` or a new C-contiguous array
+        if channels_first:
+            frame = frame.transpose(2, 0, 1)
+        if out is None:
+            return np.array(frame, order="C")
+        out[...] = frame
+        return out
+
+    def _create_image_array(self, screen, size, out=None, channels_first=False):
+        import pygame
+        # Crop the screen to remove the score (a view, no copy)
+        cropped = screen.subsurface((0, SCORE_H, self.screen_w, self.screen_h - SCORE_H))
+        if self.timer:
+            self.timer.lap("render.crop")
+
+        # Resize the screen into a Surface kept for the size
+        scaled_screen = self._scaled.get(size)
+        if scaled_screen is None:
+            scaled_screen = self._scaled[size] = pygame.Surface(size)
+        pygame.transform.smoothscale(cropped, size, scaled_screen)
+        if self.timer:
+            self.timer.lap("render.scale")
+        # pixels3d is a (W, H, 3) view of the Surface
+        pixels = pygame.surfarray.pixels3d(scaled_screen).transpose(1, 0, 2)
+        image = self._to_array(pixels, out, channels_first)
+        del pixels   # unlocks the Surface
+        if self.timer:
+            self.timer.lap("render.copy")
+        return image
 
     def close(self):
         if self.screen is not None:
+            import pygame
             pygame.display.quit()
             self.isopen = False
             pygame.quit()
+            self.screen = None
+            self.font = None
+            self.surf = None
+            self._scaled = {}
 
 
 if __name__ == "__main__":
+    import pygame
+
     env = OneCarEnv(render_mode="human")
     action = np.array([0.0])  # following CarRacing
 
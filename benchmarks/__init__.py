@@ -0,0 +1,9 @@
+"""
+Throughput and latency benchmarks for OneCarEnv.
+
+    python -m benchmarks --out results.json
+    python -m benchmarks --baseline results.json
+"""
+from .env_bench import CONFIGS, bench_config, compare, make_env
+
+__all__ = ["CONFIGS", "bench_config", "compare", "make_env"]
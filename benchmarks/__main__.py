@@ -0,0 +1,82 @@
+import argparse
+import json
+import multiprocessing as mp
+import sys
+
+from .env_bench import CONFIGS, bench_config, compare, environment
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Measure OneCarEnv reset/step latency, steps/sec and memory.")
+    parser.add_argument("-c", "--config", action="append", default=None,
+                        help="config to run, or a substring of config names "
+                             "(repeatable; default: all)")
+    parser.add_argument("--list", action="store_true", help="list the configs and exit")
+    parser.add_argument("--steps", type=int, default=2000, help="timed steps per config")
+    parser.add_argument("--resets", type=int, default=50, help="timed resets per config")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file of a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="relative slowdown that counts as a regression (default: 0.1)")
+    parser.add_argument("--in-process", action="store_true",
+                        help="run every config in this process instead of a fresh one "
+                             "(peak RSS then accumulates)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.list:
+        print("\n".join(CONFIGS))
+        return 0
+
+    names = [n for n in CONFIGS
+             if args.config is None or any(c in n for c in args.config)]
+    if not names:
+        sys.exit(f"No config matches {args.config}; see --list")
+
+    results = {}
+    width = max(len(n) for n in names) + 2
+    print(f"{'config':<{width}}{'steps/s':>10}{'p50 us':>10}{'p99 us':>10}"
+          f"{'reset us':>10}{'KiB/step':>10}{'RSS MiB':>9}")
+    for name in names:
+        kwargs = dict(steps=args.steps, resets=args.resets, seed=args.seed)
+        if args.in_process:
+            res = bench_config(name, **kwargs)
+        else:
+            # A fresh process per config, so peak RSS is that config's own
+            with mp.get_context("spawn").Pool(1) as pool:
+                res = pool.apply(bench_config, (name,), kwargs)
+        results[name] = res
+        if "skipped" in res:
+            print(f"{name:<{width}}skipped: {res['skipped']}")
+            continue
+        rss = res["peak_rss_mib"]
+        print(f"{name:<{width}}{res['steps_per_sec']:>10.0f}{res['step_us']['p50']:>10.1f}"
+              f"{res['step_us']['p99']:>10.1f}{res['reset_us']['p50']:>10.0f}"
+              f"{res['step_alloc_kib']:>10.1f}{'' if rss is None else f'{rss:>9.0f}'}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"environment": environment(), "args": vars(args),
+                       "results": results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        rows, regressed = compare(results, baseline, args.tolerance)
+        print(f"\n{'config':<{width}}{'metric':<16}{'baseline':>10}{'current':>10}{'change':>9}")
+        for name, metric, old, new, change in rows:
+            flag = "  <-" if (name, metric, old, new, change) in regressed else ""
+            print(f"{name:<{width}}{metric:<16}{old:>10.1f}{new:>10.1f}{change:>+9.1%}{flag}")
+        if regressed:
+            print(f"\n{len(regressed)} metric(s) regressed by more than {args.tolerance:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
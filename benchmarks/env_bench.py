@@ -0,0 +1,176 @@
+import platform
+import time
+import tracemalloc
+
+import numpy as np
+import gymnasium as gym
+
+
+# name: OneCarEnv keyword arguments, plus "wrappers" for the notebook's stack
+CONFIGS = {}
+for _mode in (None, "state_pixels", "rgb_array"):
+    for _continuous in (True, False):
+        CONFIGS[f"{_mode or 'none'}-{'continuous' if _continuous else 'discrete'}"] = dict(
+            render_mode=_mode, continuous=_continuous)
+CONFIGS["none-discrete-numpy"] = dict(continuous=False, renderer="numpy")
+CONFIGS["none-discrete-features"] = dict(continuous=False, obs_type="features")
+CONFIGS["none-discrete-gray_stack"] = dict(continuous=False, obs_type="gray_stack")
+CONFIGS["none-discrete-gray_stack-numpy"] = dict(
+    continuous=False, obs_type="gray_stack", renderer="numpy")
+for _n in (2, 4):
+    CONFIGS[f"none-discrete-numpy-{_n}cars"] = dict(
+        continuous=False, renderer="numpy", n_cars=_n)
+CONFIGS["none-discrete-frame_skip4"] = dict(continuous=False, frame_skip=4)
+CONFIGS["none-discrete-obs_cache"] = dict(continuous=False, obs_cache=4096)
+CONFIGS["none-discrete-numpy-obs_out"] = dict(continuous=False, renderer="numpy", obs_out=True)
+CONFIGS["none-discrete-features-numba"] = dict(continuous=False, obs_type="features", engine="numba")
+CONFIGS["notebook-wrappers"] = dict(continuous=False, wrappers=True)
+CONFIGS["none-discrete-features-telemetry"] = dict(continuous=False, obs_type="features", telemetry=True)
+
+# Metrics where a larger value is better, for `compare`
+HIGHER_IS_BETTER = {"steps_per_sec"}
+
+
+def make_env(render_mode=None, wrappers=False, telemetry=False, **kwargs):
+    """
+    OneCarEnv for a config; `wrappers` adds the notebook's observation
+    stack, `telemetry` a TelemetryWrapper.
+    """
+    from OneCar_v3 import OneCarEnv
+
+    env = OneCarEnv(render_mode=render_mode, **kwargs)
+    if wrappers:
+        env = gym.wrappers.ResizeObservation(env, shape=84)
+        env = gym.wrappers.GrayScaleObservation(env)
+        env = gym.wrappers.FrameStack(env, num_stack=4)
+    if telemetry:
+        from telemetry import TelemetryWrapper
+        env = TelemetryWrapper(env)
+    return env
+
+
+def _percentiles(ns):
+    us = np.asarray(ns) / 1e3
+    return {f"p{q}": float(np.percentile(us, q)) for q in (50, 90, 99)} | {
+        "mean": float(us.mean()), "max": float(us.max())}
+
+
+def _peak_rss_mib():
+    from telemetry import peak_rss_bytes
+
+    rss = peak_rss_bytes()
+    return None if rss is None else rss / 2**20
+
+
+def bench_config(name, steps=2000, resets=50, warmup=100, seed=0):
+    """
+    Time `resets` resets and `steps` steps of config `name` with random
+    actions, calling `render()` after every step when a render mode is set.
+    Then run another `steps // 10` steps under tracemalloc for the memory
+    allocated per step. Latencies are in microseconds.
+    """
+    kwargs = dict(CONFIGS[name])
+    env = make_env(**kwargs)
+    try:
+        return _bench(env, kwargs.get("render_mode") is not None,
+                      steps, resets, warmup, seed)
+    except gym.error.DependencyNotInstalled as e:
+        # e.g. the notebook's wrappers without opencv
+        return {"skipped": str(e)}
+    finally:
+        env.close()
+
+
+def _bench(env, render, steps, resets, warmup, seed):
+    env.action_space.seed(seed)
+    clock = time.perf_counter_ns
+
+    def step():
+        _, _, terminated, truncated, _ = env.step(env.action_space.sample())
+        if render:
+            env.render()
+        return terminated or truncated
+
+    reset_ns = []
+    for i in range(resets):
+        start = clock()
+        env.reset(seed=seed + i)
+        reset_ns.append(clock() - start)
+
+    env.reset(seed=seed)
+    for _ in range(warmup):
+        if step():
+            env.reset()
+
+    step_ns = np.empty(steps, dtype=np.int64)
+    episodes = 0
+    total = clock()
+    for i in range(steps):
+        start = clock()
+        done = step()
+        step_ns[i] = clock() - start
+        if done:
+            episodes += 1
+            env.reset()
+    total = clock() - total
+
+    # Peak memory allocated during each step, as seen by tracemalloc:
+    # Python objects and NumPy buffers, but not SDL surfaces.
+    tracemalloc.start()
+    alloc = []
+    for _ in range(max(1, steps // 10)):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        if step():
+            env.reset()
+        alloc.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+
+    return {
+        "reset_us": _percentiles(reset_ns),
+        "step_us": _percentiles(step_ns),
+        # includes the resets at the end of episodes
+        "steps_per_sec": steps / (total / 1e9),
+        "episodes": episodes,
+        "step_alloc_kib": float(np.mean(alloc) / 2**10),
+        "peak_rss_mib": _peak_rss_mib(),
+    }
+
+
+def environment():
+    import pygame
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "numpy": np.__version__,
+        "gymnasium": gym.__version__,
+        "pygame": pygame.version.ver,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def compare(results, baseline, tolerance=0.1):
+    """
+    Relative change of steps/sec and step latency (p50, p99) against a
+    baseline, per config. Returns (rows, regressed) where each row is
+    (config, metric, baseline, current, change) and `regressed` lists the
+    rows that got worse by more than `tolerance`.
+    """
+    rows, regressed = [], []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None or "skipped" in current or "skipped" in base:
+            continue
+        pairs = [("steps_per_sec", base["steps_per_sec"], current["steps_per_sec"])]
+        pairs += [(f"step_us.{q}", base["step_us"][q], current["step_us"][q])
+                  for q in ("p50", "p99")]
+        for metric, old, new in pairs:
+            change = (new - old) / old
+            row = (name, metric, old, new, change)
+            rows.append(row)
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            if worse > tolerance:
+                regressed.append(row)
+    return rows, regressed
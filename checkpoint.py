@@ -0,0 +1,206 @@
+import glob
+import json
+import os
+import random
+import time
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+
+MANIFEST = "manifest.json"
+# FrameReplayBuffer storage, one .npy per array in a directory per buffer
+REPLAY_ARRAYS = ("frames", "newest", "start", "actions", "rewards", "dones")
+
+
+def _ring(start, n, size):
+    # Indices of n writes to a ring of `size` slots, from slot `start` on
+    if n >= size:
+        return slice(None)
+    return (start + np.arange(n)) % size
+
+
+def _replace(path, write, mode="wb"):
+    # Write a file through a temporary one, so it is never seen half written
+    tmp = path + ".tmp"
+    with open(tmp, mode) as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+def _to_json(x):
+    if isinstance(x, np.ndarray):
+        return {"ndarray": x.tolist(), "dtype": x.dtype.str}
+    if isinstance(x, (tuple, list)):
+        return [_to_json(v) for v in x]
+    if isinstance(x, dict):
+        return {k: _to_json(v) for k, v in x.items()}
+    return x
+
+
+def _from_json(x):
+    if isinstance(x, dict):
+        if "ndarray" in x:
+            return np.array(x["ndarray"], dtype=x["dtype"])
+        return {k: _from_json(v) for k, v in x.items()}
+    if isinstance(x, list):
+        return tuple(_from_json(v) for v in x)
+    return x
+
+
+class Checkpointer:
+    """
+    Full training state in the directory `path`, saved and resumed in one
+    call each:
+        <buffer>/<array>.npy:     the storage of every `FrameReplayBuffer`
+        <buffer>/state-<id>.npz:  its positions and last stacks
+        envs-<id>.npz:            the `state_dict` of every `OneCarVectorEnv`
+        torch-<id>.pt:            the `state_dict` of every module and optimizer
+        manifest.json:            step, `extra`, buffer positions, RNG states
+                                  and the names of the files above
+
+    Only the first save writes the whole replay storage. Later saves only
+    write the transitions and frames added since, into the same files.
+    `load` maps the storage read-only and copy-on-write, so it returns as
+    soon as the manifest and small files are read; the pages are read from
+    disk when sampled. What the buffer writes after that is private memory
+    of the process, so every save maps the storage again from the files
+    it has just written, which frees it.
+
+    The small files get new names at every save and the manifest is
+    replaced last, so an interrupted save leaves the previous checkpoint
+    loadable, except that some of its replay rows may hold newer
+    transitions. The files of older saves are deleted after the manifest.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._saved = {}   # buffer name: (pos, adds, frame_count) at the last save or load
+
+    def exists(self):
+        return os.path.exists(os.path.join(self.path, MANIFEST))
+
+    def save(self, step, buffers=None, envs=None, modules=None, extra=None):
+        """
+        Save everything: `buffers`, `envs` and `modules` are dicts of name:
+        object, `extra` anything JSON (schedule position, counters...).
+        Returns the seconds it took.
+        """
+        start = time.perf_counter()
+        os.makedirs(self.path, exist_ok=True)
+        save_id = f"{time.time_ns():x}"
+        manifest = {
+            "step": step,
+            "time": time.time(),
+            "extra": extra or {},
+            "buffers": {name: self._save_buffer(name, rb, save_id)
+                        for name, rb in (buffers or {}).items()},
+            "rng": {"random": _to_json(random.getstate()),
+                    "numpy": _to_json(np.random.get_state())},
+            "files": {},
+        }
+        if envs:
+            arrays = {f"{name}/{k}": v for name, env in envs.items()
+                      for k, v in env.state_dict().items()}
+            manifest["files"]["envs"] = f"envs-{save_id}.npz"
+            _replace(os.path.join(self.path, manifest["files"]["envs"]),
+                     lambda f: np.savez(f, **arrays))
+        if modules:
+            import torch
+            states = {name: m.state_dict() for name, m in modules.items()}
+            states["torch_rng"] = torch.get_rng_state()
+            manifest["files"]["torch"] = f"torch-{save_id}.pt"
+            _replace(os.path.join(self.path, manifest["files"]["torch"]),
+                     lambda f: torch.save(states, f))
+        _replace(os.path.join(self.path, MANIFEST), lambda f: json.dump(manifest, f), "w")
+        self._delete_stale(manifest)
+        return time.perf_counter() - start
+
+    def _delete_stale(self, manifest):
+        # Small files of earlier saves, which the manifest no longer names
+        keep = {os.path.join(self.path, f) for f in manifest["files"].values()}
+        keep |= {os.path.join(self.path, name, meta["state"])
+                 for name, meta in manifest["buffers"].items()}
+        for pattern in ("envs-*.npz", "torch-*.pt", "*/state-*.npz"):
+            for file in glob.glob(os.path.join(self.path, pattern)):
+                if file not in keep:
+                    os.remove(file)
+
+    def _save_buffer(self, name, rb, save_id):
+        folder = os.path.join(self.path, name)
+        os.makedirs(folder, exist_ok=True)
+        saved = self._saved.get(name)
+        for array in REPLAY_ARRAYS:
+            data = getattr(rb, array)
+            file = os.path.join(folder, array + ".npy")
+            if saved is None or not os.path.exists(file):
+                out = open_memmap(file, mode="w+", dtype=data.dtype, shape=data.shape)
+                out[:] = data
+            else:
+                pos, adds, frame_count = saved
+                out = open_memmap(file, mode="r+")
+                if array == "frames":
+                    for env, (old, new) in enumerate(zip(frame_count, rb.frame_count)):
+                        ids = _ring(old % rb.n_frames, new - old, rb.n_frames)
+                        out[env, ids] = data[env, ids]
+                else:
+                    rows = _ring(pos, rb.adds - adds, rb.buffer_size)
+                    out[rows] = data[rows]
+            out.flush()
+            del out
+            if isinstance(data, np.memmap) and data.mode == "c":
+                # Loaded copy-on-write: drop the private pages, the file has them now
+                setattr(rb, array, np.load(file, mmap_mode="c"))
+        state = f"state-{save_id}.npz"
+        _replace(os.path.join(folder, state), lambda f: np.savez(
+            f, frame_count=rb.frame_count, last=rb._last,
+            episode_start=rb._episode_start, ended=rb._ended))
+        self._saved[name] = (rb.pos, rb.adds, rb.frame_count.copy())
+        return {"pos": rb.pos, "full": rb.full, "adds": rb.adds,
+                "rng": rb.rng.bit_generator.state, "state": state}
+
+    def load(self, buffers=None, envs=None, modules=None, map_location=None):
+        """
+        Restore the last save into `buffers`, `envs` and `modules`, built
+        with the same arguments as the saved ones, and the global RNGs.
+        Returns the manifest: `step`, `extra` and the rest.
+        """
+        with open(os.path.join(self.path, MANIFEST)) as f:
+            manifest = json.load(f)
+        for name, rb in (buffers or {}).items():
+            self._load_buffer(name, rb, manifest["buffers"][name])
+        if envs:
+            with np.load(os.path.join(self.path, manifest["files"]["envs"])) as arrays:
+                for name, env in envs.items():
+                    prefix = name + "/"
+                    env.load_state_dict({k[len(prefix):]: arrays[k] for k in arrays.files
+                                         if k.startswith(prefix)})
+        if modules:
+            import torch
+            states = torch.load(os.path.join(self.path, manifest["files"]["torch"]),
+                                map_location=map_location)
+            for name, m in modules.items():
+                m.load_state_dict(states[name])
+            torch.set_rng_state(states["torch_rng"])
+        random.setstate(_from_json(manifest["rng"]["random"]))
+        np.random.set_state(_from_json(manifest["rng"]["numpy"]))
+        return manifest
+
+    def _load_buffer(self, name, rb, meta):
+        folder = os.path.join(self.path, name)
+        for array in REPLAY_ARRAYS:
+            data = np.load(os.path.join(folder, array + ".npy"), mmap_mode="c")
+            if data.shape != getattr(rb, array).shape:
+                raise ValueError(f"{name}/{array} is {data.shape} in the checkpoint, "
+                                 f"{getattr(rb, array).shape} in the buffer")
+            setattr(rb, array, data)
+        if rb._file is not None:   # the buffer's own frames file is no longer used
+            rb._file.close()
+            rb._file = None
+        with np.load(os.path.join(folder, meta["state"])) as state:
+            rb.frame_count[:] = state["frame_count"]
+            rb._last[:] = state["last"]
+            rb._episode_start[:] = state["episode_start"]
+            rb._ended[:] = state["ended"] if "ended" in state.files else False
+        rb.pos, rb.full, rb.adds = meta["pos"], meta["full"], meta["adds"]
+        rb.rng.bit_generator.state = meta["rng"]
+        self._saved[name] = (rb.pos, rb.adds, rb.frame_count.copy())
@@ -0,0 +1,375 @@
+import argparse
+import json
+import mmap
+import multiprocessing as mp
+import os
+import time
+import zlib
+
+import numpy as np
+
+from frame_replay import Samples
+
+
+INDEX = "index.json"
+COLUMNS = ("obs", "action", "reward", "terminated", "truncated")
+# The observation after every transition that ends an episode, one per such
+# row of a chunk, as that row's next obs is the reset observation
+FINAL = "final_obs"
+
+
+def scripted_policy(features, n_cars, n_nearest=2, reach=0.35):
+    """
+    Actions of a simple driver from a `features` observation: leave a lane
+    whose nearest object is an obstacle within `reach` (screen heights)
+    unless the other lane is worse, and go for a circle in the other lane.
+    """
+    actions = np.zeros(n_cars, dtype=np.int64)
+    for i in range(n_cars):
+        right = features[i] == 1
+        lanes = features[n_cars:-1].reshape(2*n_cars, n_nearest, 2)
+        own, other = lanes[2*i + right, 0], lanes[2*i + (not right), 0]
+        own_danger = own[1] == 1 and -0.05 < own[0] < reach
+        other_danger = other[1] == 1 and -0.05 < other[0] < reach
+        if (own_danger and not (other_danger and other[0] < own[0])) or \
+                (other[1] == -1 and not own_danger and own[1] != -1 and not other_danger):
+            actions[i] = 1 if right else 2
+    return actions
+
+
+def _make_policy(policy, env, env_kwargs, epsilon, rng, model_path=None, model=None):
+    # act(obs) for one env
+    n_cars = env.unwrapped.n_cars
+    if policy == "random":
+        act = lambda obs: env.action_space.sample()
+    elif policy == "scripted":
+        def act(obs):
+            actions = scripted_policy(env.unwrapped.features(), n_cars, env.unwrapped.n_nearest)
+            if env.unwrapped.continuous:
+                return np.select([actions == 1, actions == 2], [-1.0, 1.0], 0.0).astype(np.float32)
+            return actions[0] if n_cars == 1 else actions
+    elif policy == "checkpoint":
+        import importlib
+        import torch
+        from evaluate import q_policy
+        from vector_env import OneCarVectorEnv
+
+        module, name = model.split(":")
+        Model = getattr(importlib.import_module(module), name)
+        net = Model(OneCarVectorEnv(1, **{k: v for k, v in env_kwargs.items()
+                                          if k in ("continuous", "obs_type", "n_cars")}))
+        net.load_state_dict(torch.load(model_path, map_location="cpu"))
+        net.eval()
+        greedy = q_policy(net)
+        act = lambda obs: greedy(obs[None])[0]
+    else:
+        raise ValueError(f"unknown policy {policy!r}")
+    if not epsilon:
+        return act
+    return lambda obs: env.action_space.sample() if rng.random() < epsilon else act(obs)
+
+
+def _encode(array, compression):
+    data = np.ascontiguousarray(array).tobytes()
+    return zlib.compress(data, compression) if compression else data
+
+
+def _write_shard(task):
+    # Play one env until the shard has `length` transitions, writing them
+    # chunk by chunk; returns the shard's index entry
+    (folder, shard, length, seed, env_kwargs, policy, epsilon, chunk_size, compression,
+     model_path, model) = task
+    from OneCar_v3 import OneCarEnv
+
+    env = OneCarEnv(**env_kwargs)
+    env.action_space.seed(seed)
+    rng = np.random.default_rng(seed)
+    act = _make_policy(policy, env, env_kwargs, epsilon, rng, model_path, model)
+    columns = _columns(env)
+    file = f"shard-{shard:05d}.bin"
+    entry = {"file": file, "length": length, "episodes": 0, "chunks": []}
+    chunk = {k: np.empty((chunk_size,) + tuple(shape), dtype) for k, (dtype, shape) in columns.items()
+             if k != FINAL}
+
+    obs, _ = env.reset(seed=seed)
+    offset = 0
+    with open(os.path.join(folder, file), "wb") as f:
+        for start in range(0, length, chunk_size):
+            n = min(chunk_size, length - start)
+            finals = []
+            for t in range(n):
+                action = act(obs)
+                chunk["obs"][t] = obs
+                chunk["action"][t] = action
+                obs, chunk["reward"][t], terminated, truncated, _ = env.step(action)
+                # The last transition of a shard ends its episode there
+                truncated = truncated or start + t == length - 1
+                chunk["terminated"][t], chunk["truncated"][t] = terminated, truncated
+                if terminated or truncated:
+                    finals.append(np.array(obs))
+                    entry["episodes"] += 1
+                    obs, _ = env.reset()
+            chunk[FINAL] = np.array(finals, dtype=chunk["obs"].dtype).reshape(
+                (len(finals),) + chunk["obs"].shape[1:])
+            offsets = {}
+            for k in COLUMNS + (FINAL,):
+                data = _encode(chunk[k] if k == FINAL else chunk[k][:n], compression)
+                f.write(data)
+                offsets[k] = [offset, len(data)]
+                offset += len(data)
+            entry["chunks"].append({"length": n, "offsets": offsets})
+    env.close()
+    return entry
+
+
+def _columns(env):
+    space = env.observation_space
+    action_space = env.action_space
+    return {
+        "obs": (space.dtype.str, list(space.shape)),
+        "action": (action_space.dtype.str, list(action_space.shape)),
+        "reward": (np.dtype(np.float32).str, []),
+        "terminated": (np.dtype(np.bool_).str, []),
+        "truncated": (np.dtype(np.bool_).str, []),
+        FINAL: (space.dtype.str, list(space.shape)),
+    }
+
+
+def generate(folder, transitions, policy="random", shard_size=100_000, chunk_size=1024,
+             workers=None, seed=0, epsilon=0.0, compression=6, model_path=None, model=None,
+             **env_kwargs):
+    """
+    Write a dataset of `transitions` OneCarEnv transitions (obs, action,
+    reward, terminated, truncated) to `folder`, as shards of `shard_size`
+    transitions played by a pool of `workers` processes, one env per
+    shard. Every shard holds chunks of `chunk_size` transitions, one zlib
+    block (level `compression`, 0 for raw bytes) per column, and
+    index.json says where every block is. A chunk's `final_obs` block
+    holds the observation that follows each of its transitions that end
+    an episode (terminated or truncated), in order.
+
+    `policy` is "random", "scripted" (`scripted_policy`) or "checkpoint",
+    the greedy policy of a Q-network: `model` "module:Class" built like
+    the notebook's `QNetwork(envs)`, weights from `model_path`. With
+    `epsilon`, that share of the actions is random.
+    """
+    from OneCar_v3 import OneCarEnv
+
+    os.makedirs(folder, exist_ok=True)
+    probe = OneCarEnv(**env_kwargs)
+    columns = _columns(probe)
+    probe.close()
+    lengths = [min(shard_size, transitions - s) for s in range(0, transitions, shard_size)]
+    tasks = [(folder, i, n, seed + i, env_kwargs, policy, epsilon, chunk_size, compression,
+              model_path, model) for i, n in enumerate(lengths)]
+
+    start = time.perf_counter()
+    with mp.get_context("spawn").Pool(workers or os.cpu_count()) as pool:
+        shards = pool.map(_write_shard, tasks)
+    seconds = time.perf_counter() - start
+
+    index = {
+        "length": transitions,
+        "chunk_size": chunk_size,
+        "compression": compression,
+        "columns": columns,
+        "env_kwargs": env_kwargs,
+        "policy": {"name": policy, "epsilon": epsilon, "seed": seed, "model": model,
+                   "model_path": model_path},
+        "shards": shards,
+    }
+    with open(os.path.join(folder, INDEX), "w") as f:
+        json.dump(index, f)
+    return {"transitions": transitions, "shards": len(shards), "seconds": seconds,
+            "steps_per_sec": transitions / seconds,
+            "episodes": sum(s["episodes"] for s in shards),
+            "bytes": sum(os.path.getsize(os.path.join(folder, s["file"])) for s in shards)}
+
+
+class OfflineDataset:
+    """
+    Reader of a dataset written by `generate`. Shard files are memory-mapped
+    and only the chunks a read touches are decompressed (with compression
+    0 they are NumPy views of the map), so any slice is cheap to read
+    without loading the files.
+    """
+    def __init__(self, folder):
+        self.folder = folder
+        with open(os.path.join(folder, INDEX)) as f:
+            self.index = json.load(f)
+        self.columns = {k: (np.dtype(dtype), tuple(shape))
+                        for k, (dtype, shape) in self.index["columns"].items()}
+        self.compression = self.index["compression"]
+        # (shard, chunk) of every chunk, and the index of its first transition
+        self._chunks = [(s, c) for s, shard in enumerate(self.index["shards"])
+                        for c in range(len(shard["chunks"]))]
+        lengths = [self.index["shards"][s]["chunks"][c]["length"] for s, c in self._chunks]
+        self._starts = np.concatenate([[0], np.cumsum(lengths)])
+        self._maps = {}
+
+    def __len__(self):
+        return self.index["length"]
+
+    def _map(self, shard):
+        if shard not in self._maps:
+            with open(os.path.join(self.folder, self.index["shards"][shard]["file"]), "rb") as f:
+                self._maps[shard] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._maps[shard]
+
+    def chunk(self, i, columns=COLUMNS):
+        """
+        Columns of chunk i (of all the shards' chunks, in order). `final_obs`
+        has one row per transition of the chunk that ends an episode.
+        """
+        s, c = self._chunks[i]
+        entry = self.index["shards"][s]["chunks"][c]
+        buffer = self._map(s)
+        out = {}
+        for k in columns:
+            offset, size = entry["offsets"][k]
+            data = memoryview(buffer)[offset:offset + size]
+            if self.compression:
+                data = zlib.decompress(data)
+            dtype, shape = self.columns[k]
+            out[k] = np.frombuffer(data, dtype).reshape(
+                (-1 if k == FINAL else entry["length"],) + shape)
+        return out
+
+    def n_chunks(self):
+        return len(self._chunks)
+
+    def read(self, start, stop, columns=COLUMNS):
+        """Transitions start to stop (global indices) of `columns` (not `final_obs`)."""
+        first = np.searchsorted(self._starts, start, side="right") - 1
+        last = np.searchsorted(self._starts, stop, side="left")
+        parts = {k: [] for k in columns}
+        for i in range(first, last):
+            chunk = self.chunk(i, columns)
+            lo = max(start - self._starts[i], 0)
+            hi = min(stop, self._starts[i + 1]) - self._starts[i]
+            for k in columns:
+                parts[k].append(chunk[k][lo:hi])
+        return {k: v[0] if len(v) == 1 else np.concatenate(v) for k, v in parts.items()}
+
+    def batches(self, batch_size, chunks_in_memory=8, swap_every=64, seed=None, device=None):
+        """
+        Endless random batches of `Samples`, as from FrameReplayBuffer, for
+        training. They are drawn from `chunks_in_memory` decompressed chunks,
+        one of which is swapped for a random other every `swap_every`
+        batches. The next observation of a transition that ends an episode
+        is its `final_obs`, and dones are `terminated`, so truncated
+        transitions bootstrap. The last transition of a chunk that doesn't
+        end an episode has its next observation in the next chunk and is
+        not drawn.
+
+        Datasets written before `final_obs` was kept draw neither truncated
+        transitions nor the last of a chunk, and the next observation of a
+        terminated one is the reset observation after it: only masked by
+        its done.
+        """
+        rng = np.random.default_rng(seed)
+        columns = COLUMNS + (FINAL,) if FINAL in self.columns else COLUMNS
+        # Without final_obs a chunk of one row (the end of a shard) has nothing to draw
+        candidates = np.flatnonzero(np.diff(self._starts) > (0 if FINAL in columns else 1))
+        loaded, pool = [], []
+        for i in rng.permutation(candidates):
+            if len(pool) == chunks_in_memory:
+                break
+            usable = self._usable(self.chunk(i, columns))
+            if usable[1].size:
+                loaded.append(i)
+                pool.append(usable)
+        if not pool:
+            raise ValueError("no transition in the dataset has a next observation")
+        pool_size = len(pool)
+        n = 0
+        while True:
+            which = rng.integers(pool_size, size=batch_size)
+            obs, action, next_obs, dones, rewards = [], [], [], [], []
+            for p in np.unique(which):
+                chunk, valid, final = pool[p]
+                rows = valid[rng.integers(len(valid), size=(which == p).sum())]
+                obs.append(chunk["obs"][rows])
+                if final is None:
+                    next_obs.append(chunk["obs"][rows + 1])
+                else:
+                    # The next row, or the final observation of an ended episode
+                    nxt = chunk["obs"][np.minimum(rows + 1, len(final) - 1)]
+                    ended = np.flatnonzero(final[rows] >= 0)
+                    nxt[ended] = chunk[FINAL][final[rows[ended]]]
+                    next_obs.append(nxt)
+                action.append(chunk["action"][rows])
+                dones.append(chunk["terminated"][rows])
+                rewards.append(chunk["reward"][rows])
+            action = np.concatenate(action)
+            data = (np.concatenate(obs),
+                    action.reshape(batch_size, -1) if action.ndim == 1 else action,
+                    np.concatenate(next_obs),
+                    np.concatenate(dones).astype(np.float32).reshape(-1, 1),
+                    np.concatenate(rewards).reshape(-1, 1))
+            if device is not None:
+                import torch
+                data = tuple(torch.as_tensor(a, device=device) for a in data)
+            yield Samples(*data)
+
+            n += 1
+            if swap_every and n % swap_every == 0 and len(candidates) > pool_size:
+                p = rng.integers(pool_size)
+                i = candidates[rng.integers(len(candidates))]
+                if i not in loaded:
+                    usable = self._usable(self.chunk(i, columns))
+                    if usable[1].size:
+                        loaded[p] = i
+                        pool[p] = usable
+
+    @staticmethod
+    def _usable(chunk):
+        # Rows with a next observation in the chunk, and for every row the
+        # index of its final_obs (-1 when it doesn't end an episode)
+        if FINAL not in chunk:
+            return chunk, np.flatnonzero(~chunk["truncated"][:-1]), None
+        ended = chunk["terminated"] | chunk["truncated"]
+        final = np.where(ended, np.cumsum(ended) - 1, -1)
+        valid = np.flatnonzero(ended | (np.arange(len(ended)) < len(ended) - 1))
+        return chunk, valid, final
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Generate an offline OneCar dataset, or describe one.")
+    parser.add_argument("command", choices=["generate", "info"])
+    parser.add_argument("folder")
+    gen = parser.add_argument_group("generate")
+    gen.add_argument("--transitions", type=int, default=1_000_000)
+    gen.add_argument("--policy", default="random", choices=["random", "scripted", "checkpoint"])
+    gen.add_argument("--epsilon", type=float, default=0.0)
+    gen.add_argument("--model", help="module:Class of the Q-network, for --policy checkpoint")
+    gen.add_argument("--model-path", help="its weights")
+    gen.add_argument("--shard-size", type=int, default=100_000)
+    gen.add_argument("--chunk-size", type=int, default=1024)
+    gen.add_argument("--compression", type=int, default=6, help="zlib level; 0 stores raw bytes")
+    gen.add_argument("--workers", type=int)
+    gen.add_argument("--seed", type=int, default=0)
+    gen.add_argument("--obs-type", default="pixels", choices=["pixels", "features", "gray_stack"])
+    gen.add_argument("--renderer", default="numpy", choices=["pygame", "numpy"])
+    gen.add_argument("--discrete", action="store_true")
+    gen.add_argument("--n-cars", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    if args.command == "info":
+        data = OfflineDataset(args.folder)
+        index = data.index
+        print(json.dumps({k: index[k] for k in ("length", "chunk_size", "compression", "columns",
+                                                "env_kwargs", "policy")}, indent=2))
+        print(f"{len(index['shards'])} shards, {data.n_chunks()} chunks, "
+              f"{sum(s['episodes'] for s in index['shards'])} episodes")
+        return
+    result = generate(args.folder, args.transitions, args.policy, args.shard_size, args.chunk_size,
+                      args.workers, args.seed, args.epsilon, args.compression, args.model_path,
+                      args.model, obs_type=args.obs_type, renderer=args.renderer,
+                      continuous=not args.discrete, n_cars=args.n_cars)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
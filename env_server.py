@@ -0,0 +1,373 @@
+import argparse
+import asyncio
+import json
+import socket
+import struct
+import time
+
+import numpy as np
+from gymnasium import spaces
+
+
+# Every message is a header (opcode or status, payload length) and a payload
+HEADER = struct.Struct("<BI")
+STEP_RESULT = struct.Struct("<d??")   # reward, terminated, truncated; then the observation
+
+SPEC, RESET, STEP, STATS = range(4)
+OK, ERROR = 0, 1
+
+
+class EnvServer:
+    """
+    Serves the games of one `OneCarVectorEnv` to many clients over a local
+    socket, one game per connected client.
+
+    A client sends one request at a time: `SPEC` (JSON description of the
+    spaces), `RESET`, `STEP` (the action as int32 or float32 per car) or
+    `STATS`. Observations go back as their raw bytes. Step requests are not
+    run one by one: the batcher waits until every connected client has a
+    step pending, or `max_wait` seconds after the first one, and then steps
+    all of their games in a single `step_games` call. Finished games are
+    not reset, the client sends `RESET` like it would to `OneCarEnv`; a
+    `STEP` on a finished game is answered with an error until then, so it
+    never reaches the batch of the other clients. So does an action of the
+    wrong size or out of the action space. A game given to a new client is
+    reset first.
+
+    The games share the vector env's generator, seeded by `seed`, so a
+    client can't seed its own game.
+    """
+    def __init__(self, num_envs=64, max_wait=0.002, seed=None, **env_kwargs):
+        from vector_env import OneCarVectorEnv
+
+        self.envs = OneCarVectorEnv(num_envs, copy=False, **env_kwargs)
+        self.envs.reset(seed=seed)
+        self.max_wait = max_wait
+        self.free = list(range(num_envs))[::-1]
+        self.done = np.zeros(num_envs, dtype=bool)   # finished, waiting for a RESET
+        self.clients = 0
+        self.pending = []   # (game, action, future)
+        self.batches = 0
+        self.steps = 0
+        self._wake = None
+        obs_space = self.envs.single_observation_space
+        self.spec = {
+            "obs_shape": list(obs_space.shape),
+            "obs_dtype": obs_space.dtype.str,
+            "obs_low": float(obs_space.low.min()),
+            "obs_high": float(obs_space.high.max()),
+            "n_cars": self.envs.n_cars,
+            "continuous": self.envs.continuous,
+        }
+        self._action_dtype = np.float32 if self.envs.continuous else np.int32
+
+    async def serve(self, address):
+        """Serve forever on `address`: a (host, port) pair or a Unix socket path."""
+        self._wake = asyncio.Event()
+        if isinstance(address, str):
+            server = await asyncio.start_unix_server(self._handle, address)
+        else:
+            server = await asyncio.start_server(self._handle, *address)
+        async with server:
+            await asyncio.gather(server.serve_forever(), self._batcher())
+
+    async def _handle(self, reader, writer):
+        if not self.free:
+            await _send(writer, ERROR, b"no free game")
+            writer.close()
+            return
+        game = self.free.pop()
+        self.envs.reset_games([game])   # whatever the last client left
+        self.done[game] = False
+        self.clients += 1
+        try:
+            while True:
+                op, payload = await _receive(reader)
+                if op == STEP and self.done[game]:
+                    await _send(writer, ERROR, b"episode is over, send RESET")
+                elif op == STEP:
+                    try:
+                        action = self._action(payload)
+                    except ValueError as e:
+                        await _send(writer, ERROR, str(e).encode())
+                        continue
+                    future = asyncio.get_running_loop().create_future()
+                    self.pending.append((game, action, future))
+                    self._wake.set()
+                    try:
+                        await _send(writer, OK, await future)
+                    except Exception as e:
+                        await _send(writer, ERROR, str(e).encode())
+                elif op == RESET:
+                    obs = self.envs.reset_games([game])[0]
+                    self.done[game] = False
+                    await _send(writer, OK, obs.tobytes())
+                elif op == SPEC:
+                    await _send(writer, OK, json.dumps(self.spec).encode())
+                elif op == STATS:
+                    await _send(writer, OK, json.dumps(self.stats()).encode())
+                else:
+                    await _send(writer, ERROR, f"unknown opcode {op}".encode())
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.clients -= 1
+            # A step still pending must not land in the next client's game
+            self.pending = [p for p in self.pending if p[0] != game]
+            self.free.append(game)
+            writer.close()
+
+    def _action(self, payload):
+        n_cars = self.envs.n_cars
+        if len(payload) != n_cars * 4:
+            raise ValueError(f"expected {n_cars} actions of 4 bytes, got {len(payload)} bytes")
+        action = np.frombuffer(payload, self._action_dtype)
+        if self.envs.continuous:
+            if not (np.isfinite(action).all() and (np.abs(action) <= 1).all()):
+                raise ValueError(f"actions must be in [-1, 1], got {action.tolist()}")
+        elif ((action < 0) | (action > 2)).any():
+            raise ValueError(f"actions must be 0, 1 or 2, got {action.tolist()}")
+        return action
+
+    async def _batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wake.wait()
+            # Give the other clients a moment to send their steps too
+            deadline = loop.time() + self.max_wait
+            while len(self.pending) < self.clients:
+                self._wake.clear()
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._wake.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            self._wake.clear()
+            batch, self.pending = self.pending, []
+            if batch:
+                self._step(batch)
+
+    def _step(self, batch):
+        games, actions, futures = zip(*batch)
+        try:
+            obs, rewards, terminated, truncated = self.envs.step_games(
+                np.array(games), np.stack(actions))
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        self.done[list(games)] = terminated | truncated
+        self.batches += 1
+        self.steps += len(batch)
+        for i, future in enumerate(futures):
+            future.set_result(STEP_RESULT.pack(rewards[i], terminated[i], truncated[i])
+                              + obs[i].tobytes())
+
+    def stats(self):
+        return {"clients": self.clients, "batches": self.batches, "steps": self.steps,
+                "mean_batch": self.steps / max(self.batches, 1)}
+
+
+async def _receive(reader):
+    code, size = HEADER.unpack(await reader.readexactly(HEADER.size))
+    return code, await reader.readexactly(size)
+
+
+async def _send(writer, code, payload=b""):
+    writer.write(HEADER.pack(code, len(payload)) + payload)
+    await writer.drain()
+
+
+class _ClientBase:
+    # Packing shared by EnvClient and AsyncEnvClient
+
+    def _set_spec(self, payload):
+        from OneCar_v3 import car_action_space
+
+        spec = json.loads(payload)
+        self.n_cars = spec["n_cars"]
+        self.continuous = spec["continuous"]
+        self._obs_dtype = np.dtype(spec["obs_dtype"])
+        self._obs_shape = tuple(spec["obs_shape"])
+        self.observation_space = spaces.Box(spec["obs_low"], spec["obs_high"],
+                                            self._obs_shape, self._obs_dtype)
+        self.action_space = car_action_space(self.n_cars, self.continuous)
+
+    def _pack_action(self, action):
+        dtype = np.float32 if self.continuous else np.int32
+        return np.asarray(action, dtype=dtype).reshape(self.n_cars).tobytes()
+
+    def _obs(self, payload):
+        return np.frombuffer(payload, self._obs_dtype).reshape(self._obs_shape)
+
+    def _step_result(self, payload):
+        reward, terminated, truncated = STEP_RESULT.unpack_from(payload)
+        return (self._obs(payload[STEP_RESULT.size:]), reward,
+                terminated, truncated, {})
+
+
+def _check(code, payload):
+    if code == ERROR:
+        raise RuntimeError(f"env server: {payload.decode()}")
+    return payload
+
+
+class EnvClient(_ClientBase):
+    """
+    Blocking client of an `EnvServer`, with the `reset`/`step`/`close` of
+    `OneCarEnv`. `address` is a (host, port) pair or a Unix socket path.
+    """
+    def __init__(self, address):
+        if isinstance(address, str):
+            self.sock = socket.socket(socket.AF_UNIX)
+            self.sock.connect(address)
+        else:
+            self.sock = socket.create_connection(address)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self.sock.makefile("rb")
+        self._set_spec(self._request(SPEC))
+
+    def _request(self, op, payload=b""):
+        self.sock.sendall(HEADER.pack(op, len(payload)) + payload)
+        code, size = HEADER.unpack(self._file.read(HEADER.size))
+        return _check(code, self._file.read(size))
+
+    def reset(self, seed=None, options=None):
+        return self._obs(self._request(RESET)), {}
+
+    def step(self, action):
+        return self._step_result(self._request(STEP, self._pack_action(action)))
+
+    def stats(self):
+        return json.loads(self._request(STATS))
+
+    def close(self):
+        self._file.close()
+        self.sock.close()
+
+
+class AsyncEnvClient(_ClientBase):
+    """`EnvClient` for asyncio code: `await AsyncEnvClient.connect(address)`."""
+
+    @classmethod
+    async def connect(cls, address):
+        self = cls()
+        if isinstance(address, str):
+            self.reader, self.writer = await asyncio.open_unix_connection(address)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(*address)
+        self._set_spec(await self._request(SPEC))
+        return self
+
+    async def _request(self, op, payload=b""):
+        await _send(self.writer, op, payload)
+        return _check(*await _receive(self.reader))
+
+    async def reset(self, seed=None, options=None):
+        return self._obs(await self._request(RESET)), {}
+
+    async def step(self, action):
+        return self._step_result(await self._request(STEP, self._pack_action(action)))
+
+    async def stats(self):
+        return json.loads(await self._request(STATS))
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def load_test(address, clients=16, steps=1000, seed=0):
+    """
+    Run `clients` concurrent clients doing `steps` random steps each
+    against a server. Returns throughput, per-request latency percentiles
+    in microseconds and the server's batching stats.
+    """
+    async def run(i):
+        client = await AsyncEnvClient.connect(address)
+        client.action_space.seed(seed + i)
+        await client.reset()
+        ns = np.empty(steps, dtype=np.int64)
+        for j in range(steps):
+            start = time.perf_counter_ns()
+            _, _, terminated, truncated, _ = await client.step(client.action_space.sample())
+            ns[j] = time.perf_counter_ns() - start
+            if terminated or truncated:
+                await client.reset()
+        return client, ns
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(run(i) for i in range(clients)))
+    seconds = time.perf_counter() - start
+    stats = await results[0][0].stats()
+    for client, _ in results:
+        await client.close()
+
+    us = np.concatenate([ns for _, ns in results]) / 1e3
+    return {
+        "requests": int(us.size),
+        "seconds": seconds,
+        # includes the resets at the end of episodes
+        "steps_per_sec": us.size / seconds,
+        "latency_us": {f"p{q}": float(np.percentile(us, q)) for q in (50, 90, 99)}
+                      | {"mean": float(us.mean()), "max": float(us.max())},
+        "server": stats,
+    }
+
+
+def _serve(address, **kwargs):
+    asyncio.run(EnvServer(**kwargs).serve(address))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve OneCar games to many clients, or load-test a server.")
+    parser.add_argument("command", choices=["serve", "load"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5555)
+    parser.add_argument("--unix", metavar="PATH", help="Unix socket instead of TCP")
+    server = parser.add_argument_group("serve")
+    server.add_argument("--num-envs", type=int, default=64)
+    server.add_argument("--max-wait-ms", type=float, default=2.0)
+    server.add_argument("--obs-type", default="pixels", choices=["pixels", "features"])
+    server.add_argument("--discrete", action="store_true")
+    server.add_argument("--n-cars", type=int, default=1)
+    server.add_argument("--seed", type=int)
+    load = parser.add_argument_group("load")
+    load.add_argument("--clients", type=int, default=16)
+    load.add_argument("--steps", type=int, default=1000, help="steps per client")
+    load.add_argument("--spawn-server", action="store_true",
+                      help="start a server with the serve options in a subprocess")
+    args = parser.parse_args(argv)
+
+    address = args.unix or (args.host, args.port)
+    kwargs = dict(num_envs=args.num_envs, max_wait=args.max_wait_ms / 1e3, seed=args.seed,
+                  obs_type=args.obs_type, continuous=not args.discrete, n_cars=args.n_cars)
+    if args.command == "serve":
+        _serve(address, **kwargs)
+        return
+
+    process = None
+    if args.spawn_server:
+        import multiprocessing
+        process = multiprocessing.get_context("spawn").Process(
+            target=_serve, args=(address,), kwargs=kwargs, daemon=True)
+        process.start()
+        for _ in range(200):   # until the server listens
+            try:
+                EnvClient(address).close()
+                break
+            except OSError:
+                time.sleep(0.05)
+    try:
+        result = asyncio.run(load_test(address, args.clients, args.steps))
+    finally:
+        if process is not None:
+            process.terminate()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
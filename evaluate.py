@@ -0,0 +1,153 @@
+import time
+
+import numpy as np
+from gymnasium import spaces
+
+
+def q_policy(model, device="cpu"):
+    """Greedy policy of a Q-network: argmax over one forward pass per batch."""
+    import torch
+
+    @torch.no_grad()
+    def policy(obs):
+        q_values = model(torch.as_tensor(obs, device=device))
+        return torch.argmax(q_values, dim=1).cpu().numpy()
+    return policy
+
+
+def _stats(x):
+    if not x.size:
+        return dict.fromkeys(("mean", "std", "min", "p50", "max"), float("nan"))
+    return {"mean": float(x.mean()), "std": float(x.std()), "min": float(x.min()),
+            "p50": float(np.percentile(x, 50)), "max": float(x.max())}
+
+
+def _random_actions(space, rng, n):
+    # `n` samples of `space` from `rng`, so that a seed replays the evaluation
+    if isinstance(space, spaces.Box):
+        return rng.uniform(space.low, space.high, (n,) + space.shape).astype(space.dtype)
+    high = space.n if isinstance(space, spaces.Discrete) else space.nvec
+    return rng.integers(high, size=(n,) + space.shape)
+
+
+def evaluate(policy, episodes=1000, num_envs=256, epsilon=0.05, seed=0,
+             video_episodes=0, video_folder="videos/eval", **env_kwargs):
+    """
+    Play `episodes` episodes of `policy` on a `OneCarVectorEnv`, up to
+    `num_envs` at a time, and return the distribution of their returns and
+    lengths. `policy` maps a batch of observations to a batch of actions;
+    it is called once per step on the observations of all live games.
+    Actions are random with probability `epsilon`, per game, drawn from a
+    generator seeded by `seed`: a deterministic policy gives the same
+    results for the same seed.
+
+    Every game plays its share of the episodes and then drops out of the
+    batch, so long episodes are not under-counted. Nothing is rendered,
+    except `video_episodes` of the episodes, which are played on a
+    `OneCarEnv` recorded with `RecordVideo` into `video_folder`.
+    `env_kwargs` go to both envs (default: discrete actions and the
+    notebook's 4 stacked grayscale 84x84 frames).
+    """
+    from vector_env import OneCarVectorEnv
+
+    env_kwargs = {"continuous": False, "obs_type": "gray_stack"} | env_kwargs
+    rng = np.random.default_rng(seed)
+    returns, lengths = [], []
+
+    start = time.perf_counter()
+    if video_episodes:
+        _record(policy, min(video_episodes, episodes), epsilon, seed, video_folder,
+                env_kwargs, returns, lengths)
+
+    todo = episodes - len(returns)
+    num_envs = max(min(num_envs, todo), 1)
+    envs = OneCarVectorEnv(num_envs, copy=False, **env_kwargs)
+    envs.reset(seed=seed)
+    # Episodes left per game, after the current one
+    left = np.full(num_envs, todo // num_envs) - 1
+    left[:todo % num_envs] += 1
+    live = np.flatnonzero(left >= 0)
+    episode_return = np.zeros(num_envs)
+    episode_length = np.zeros(num_envs, dtype=np.int64)
+
+    while live.size:
+        actions = np.asarray(policy(envs.observations[live]))
+        explore = rng.random(live.size) < epsilon
+        if explore.any():
+            actions = actions.copy()
+            actions[explore] = _random_actions(envs.single_action_space, rng, explore.sum())
+        _, rewards, terminated, truncated = envs.step_games(live, actions)
+        episode_return[live] += rewards
+        episode_length[live] += 1
+
+        done = live[terminated | truncated]
+        if done.size:
+            returns.extend(episode_return[done])
+            lengths.extend(episode_length[done])
+            episode_return[done] = 0
+            episode_length[done] = 0
+            again = done[left[done] > 0]
+            left[done] -= 1
+            if again.size:
+                envs.reset_games(again)
+            live = np.flatnonzero(left >= 0)
+    envs.close()
+    seconds = time.perf_counter() - start
+
+    returns, lengths = np.array(returns), np.array(lengths)
+    return {
+        "episodes": returns.size,
+        "returns": returns,
+        "lengths": lengths,
+        "return": _stats(returns),
+        "length": _stats(lengths),
+        "seconds": seconds,
+        "episodes_per_sec": returns.size / seconds,
+        "steps_per_sec": float(lengths.sum() / seconds),
+    }
+
+
+def _record(policy, episodes, epsilon, seed, folder, env_kwargs, returns, lengths):
+    # Play `episodes` episodes one at a time on a rendered, recorded OneCarEnv
+    from gymnasium.wrappers import RecordVideo
+    from OneCar_v3 import OneCarEnv
+
+    kwargs = dict(env_kwargs)
+    if kwargs.get("obs_type") == "gray_stack":
+        kwargs.setdefault("renderer", "numpy")   # the vector env's frames
+    env = RecordVideo(OneCarEnv(render_mode="rgb_array", **kwargs), folder,
+                      episode_trigger=lambda _: True, disable_logger=True)
+    rng = np.random.default_rng(seed)
+    for i in range(episodes):
+        obs, _ = env.reset(seed=seed + i)
+        total, length, done = 0.0, 0, False
+        while not done:
+            if rng.random() < epsilon:
+                action = _random_actions(env.action_space, rng, 1)[0]
+            else:
+                action = np.asarray(policy(obs[None]))[0]
+            obs, reward, terminated, truncated, _ = env.step(action)
+            total += reward
+            length += 1
+            done = terminated or truncated
+        returns.append(total)
+        lengths.append(length)
+    env.close()
+
+
+def evaluate_checkpoint(model_path, Model, device="cpu", episodes=1000, **kwargs):
+    """
+    The notebook's `evaluate()`, batched: load `Model` weights from
+    `model_path` and `evaluate` its greedy policy. `Model` is built with
+    the vector env, like `QNetwork(envs)`.
+    """
+    import torch
+    from vector_env import OneCarVectorEnv
+
+    env_kwargs = {k: v for k, v in kwargs.items()
+                  if k in ("continuous", "obs_type", "n_nearest", "n_cars", "stack_frames")}
+    model = Model(OneCarVectorEnv(1, **({"continuous": False, "obs_type": "gray_stack"}
+                                        | env_kwargs))).to(device)
+    model.load_state_dict(torch.load(model_path, map_location=device))
+    model.eval()
+    return evaluate(q_policy(model, device), episodes, **kwargs)
@@ -0,0 +1,49 @@
+import numpy as np
+
+from gymnasium import spaces
+
+from objects_v3 import EMPTY, OBSTACLE, CIRCLE
+from OneCar_v3 import VIDEO_H, CAR_TOP, OBSTACLE_HEIGHT
+
+
+def feature_space(n_cars=1, n_nearest=2):
+    """
+    Box of the `obs_type="features"` observation:
+        [car lanes (n_cars),
+         (distance, kind) of the n_nearest objects of every lane (2*n_cars),
+         game speed]
+    """
+    size = n_cars + 2*n_cars * n_nearest * 2 + 1
+    return spaces.Box(low=-1, high=1, shape=(size,), dtype=np.float32)
+
+
+def encode_features(out, car_lane, obj_y, obj_lane, obj_kind, game_speed, n_nearest=2):
+    """
+    Fill `out` (N, size) with the features of a batch of games.
+    car_lane: (N, n_cars); obj_y, obj_lane, obj_kind: (N, max_objects)
+
+    car lane:  0 for the left lane of a car, 1 for the right one
+    distance:  rows between the bottom of the object and the top of the
+               car, over VIDEO_H. 1 when the slot is empty.
+    kind:      1 for an obstacle, -1 for a circle, 0 for an empty slot
+    """
+    n_games, n_cars = car_lane.shape
+    out[:, :n_cars] = car_lane - (2*np.arange(n_cars) + 1)
+
+    # Sort the objects of every lane, nearest (largest y) first
+    lanes = np.arange(1, 2*n_cars + 1)[None, :, None]
+    in_lane = (obj_kind[:, None, :] != EMPTY) & (obj_lane[:, None, :] == lanes)
+    key = np.where(in_lane, -obj_y[:, None, :], np.iinfo(np.int32).max)
+    nearest = np.argsort(key, axis=2, kind="stable")[:, :, :n_nearest]
+
+    found = np.take_along_axis(in_lane, nearest, axis=2)
+    y = np.take_along_axis(np.broadcast_to(obj_y[:, None, :], key.shape), nearest, axis=2)
+    kind = np.take_along_axis(np.broadcast_to(obj_kind[:, None, :], key.shape), nearest, axis=2)
+
+    distance = np.where(found, (CAR_TOP - OBSTACLE_HEIGHT - y) / VIDEO_H, 1)
+    kind = np.where(found, (kind == OBSTACLE) * 1.0 - (kind == CIRCLE) * 1.0, 0.0)
+    # Explicit width: a batch of no games can't infer it
+    out[:, n_cars:-1] = np.stack([distance, kind], axis=-1).reshape(
+        n_games, 2*n_cars*n_nearest*2)
+    out[:, -1] = game_speed / VIDEO_H
+    return out
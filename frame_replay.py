@@ -0,0 +1,154 @@
+import tempfile
+from collections import namedtuple
+
+import numpy as np
+
+
+# Same fields, in the same order, as stable-baselines3's ReplayBufferSamples
+Samples = namedtuple("Samples", ["observations", "actions", "next_observations",
+                                 "dones", "rewards"])
+
+
+class FrameReplayBuffer:
+    """
+    Replay buffer for stacked frames (the notebook's FrameStack(4) or
+    `obs_type="gray_stack"`) that stores every frame once.
+
+    Consecutive stacks of an env share all but one frame, so every `add`
+    only writes the newest frame of `next_obs` to a per-env frame ring,
+    plus the first frame when an episode starts. A transition keeps the id
+    of its newest frame and of its episode's first frame; stacks are
+    rebuilt from those at sample time, repeating the first frame at the
+    start of an episode like FrameStack does. That is about one frame per
+    transition instead of the four of stable-baselines3's ReplayBuffer with
+    optimize_memory_usage=True, but not quite a 4x cut: every episode start
+    takes a frame of its own and the rings keep a 1/16 margin for them, so
+    with 4 gray_stack envs a transition takes about 7.5 KB against 28.2 KB,
+    3.7x less.
+
+    An episode starts after every `done`, or `infos["_final_observation"]`
+    of a vector env, and whenever `obs` doesn't continue the last
+    `next_obs`. As the notebook's loop passes the autoreset observation as
+    `next_obs` of a terminated episode, the newest frame of an ended
+    episode is taken from `infos["final_observation"]` when it is there.
+
+    The frames live in a memory-mapped file (`path`, or an anonymous
+    temporary file), so large buffers are paged by the OS instead of
+    pinned in RAM. `add` and `sample` follow stable-baselines3's
+    ReplayBuffer; without a `device`, samples are NumPy arrays.
+    """
+    def __init__(self, buffer_size, observation_space, action_space, device=None,
+                 n_envs=1, path=None, seed=None):
+        self.n_envs = n_envs
+        self.device = device
+        self.stack, *self.frame_shape = observation_space.shape
+        self.buffer_size = max(buffer_size // n_envs, 1)   # transitions per env
+        self.pos = 0
+        self.full = False
+        self.adds = 0   # calls to add, for incremental checkpoints
+        self.rng = np.random.default_rng(seed)
+
+        # A frame per transition, plus one per episode start: OneCar
+        # episodes last well over 16 steps.
+        self.n_frames = self.buffer_size + self.buffer_size // 16 + self.stack
+        shape = (n_envs, self.n_frames, *self.frame_shape)
+        self._file = tempfile.TemporaryFile() if path is None else None
+        self.frames = np.memmap(self._file if path is None else path,
+                                dtype=observation_space.dtype, mode="w+", shape=shape)
+        self.frame_count = np.zeros(n_envs, dtype=np.int64)   # frames written per env
+
+        shape = (self.buffer_size, n_envs)
+        self.newest = np.zeros(shape, dtype=np.int64)   # id of next_obs's newest frame
+        self.start = np.zeros(shape, dtype=np.int64)    # id of the episode's first frame
+        action_shape = action_space.shape or (1,)
+        self.actions = np.zeros(shape + action_shape, dtype=action_space.dtype)
+        self.rewards = np.zeros(shape, dtype=np.float32)
+        self.dones = np.zeros(shape, dtype=np.float32)
+
+        self._last = np.zeros((n_envs,) + observation_space.shape, observation_space.dtype)
+        self._episode_start = np.full(n_envs, -1, dtype=np.int64)
+        self._ended = np.zeros(n_envs, dtype=bool)   # the last add ended the episode
+
+    def size(self):
+        return self.buffer_size if self.full else self.pos
+
+    def nbytes(self):
+        """Bytes of storage, frames included."""
+        return sum(a.nbytes for a in (self.frames, self.newest, self.start,
+                                      self.actions, self.rewards, self.dones))
+
+    def _write(self, envs, frames):
+        ids = self.frame_count[envs]
+        self.frames[envs, ids % self.n_frames] = frames
+        self.frame_count[envs] += 1
+        return ids
+
+    def add(self, obs, next_obs, action, reward, done, infos=None):
+        # A new episode after the end of one, or when obs doesn't continue
+        # from the last next_obs
+        fresh = np.flatnonzero(self._ended
+                               | (obs != self._last).reshape(self.n_envs, -1).any(axis=1))
+        if fresh.size:
+            first = obs[fresh, -1]
+            if (obs[fresh] != first[:, None]).any():
+                raise ValueError("An episode must start with its first frame repeated, "
+                                 "as FrameStack does")
+            self._episode_start[fresh] = self._write(fresh, first)
+
+        ended = np.asarray(done, dtype=bool).reshape(self.n_envs).copy()
+        newest = next_obs[:, -1]
+        if infos is not None and "_final_observation" in infos:
+            has_final = np.asarray(infos["_final_observation"], dtype=bool)
+            ended |= has_final
+            if "final_observation" in infos and has_final.any():
+                newest = newest.copy()
+                for i in np.flatnonzero(has_final):
+                    newest[i] = np.asarray(infos["final_observation"][i])[-1]
+
+        envs = np.arange(self.n_envs)
+        self.newest[self.pos] = self._write(envs, newest)
+        self.start[self.pos] = self._episode_start
+        self.actions[self.pos] = np.asarray(action).reshape(self.actions.shape[1:])
+        self.rewards[self.pos] = reward
+        self.dones[self.pos] = done
+        self._last[:] = next_obs
+        self._ended[:] = ended
+
+        self.adds += 1
+        self.pos += 1
+        if self.pos == self.buffer_size:
+            self.full, self.pos = True, 0
+
+    def _stacks(self, env, newest, start):
+        # (B, stack, *frame_shape) stacks ending with frame `newest`
+        ids = np.maximum(newest[:, None] + np.arange(1 - self.stack, 1), start[:, None])
+        return self.frames[env[:, None], ids % self.n_frames]
+
+    def sample(self, batch_size, env=None):
+        """
+        `batch_size` random transitions as (observations, actions,
+        next_observations, dones, rewards). `env` is unused; it is only there
+        for stable-baselines3's `ReplayBuffer.sample` signature.
+        """
+        index = self.rng.integers(self.size(), size=batch_size)
+        env_index = self.rng.integers(self.n_envs, size=batch_size)
+        # Transitions whose oldest frame was overwritten are drawn again
+        while True:
+            oldest = np.maximum(self.newest[index, env_index] - self.stack, self.start[index, env_index])
+            stale = np.flatnonzero(oldest < self.frame_count[env_index] - self.n_frames)
+            if stale.size == 0:
+                break
+            index[stale] = self.rng.integers(self.size(), size=stale.size)
+
+        newest, start = self.newest[index, env_index], self.start[index, env_index]
+        data = (
+            self._stacks(env_index, newest - 1, start),
+            self.actions[index, env_index],
+            self._stacks(env_index, newest, start),
+            self.dones[index, env_index].reshape(-1, 1),
+            self.rewards[index, env_index].reshape(-1, 1),
+        )
+        if self.device is not None:
+            import torch
+            data = tuple(torch.as_tensor(a, device=self.device) for a in data)
+        return Samples(*data)
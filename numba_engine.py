@@ -0,0 +1,137 @@
+"""
+The OneCar tick for one game, on flat arrays, compiled with Numba when it
+is installed (`OneCarEnv(engine="numba")`). Without Numba `tick` runs as
+plain Python, with the same results, only slower.
+"""
+from OneCar_v3 import (VIDEO_H, CAR_HEIGHT, CAR_TOP, CAR_BOTTOM, OBSTACLE_HEIGHT,
+                       SAFE_Y, SPAWN_GAPS, GAP_WEIGHTS, LANE_WEIGHTS, OBJECT_WEIGHTS)
+from objects_v3 import EMPTY, OBSTACLE, CIRCLE
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        return lambda f: f
+
+
+# Plain numbers, which Numba compiles in as constants
+SHORT_GAP, LONG_GAP = SPAWN_GAPS
+SHORT_GAP_P = GAP_WEIGHTS[0]
+SAME_LANE_P = LANE_WEIGHTS[0]
+OBSTACLE_P = OBJECT_WEIGHTS[0]
+KILL_Y = VIDEO_H - OBSTACLE_HEIGHT
+MISSED_Y = VIDEO_H - CAR_HEIGHT
+TOUCH_TOP = CAR_TOP - OBSTACLE_HEIGHT
+
+
+@njit(cache=True, nogil=True)
+def tick(actions, continuous, u, car_lane, spawn_lane, last_y, kind, lane, y, speed):
+    """
+    One tick of `OneCarEnv`, in place:
+        actions:    (n_cars,) float, as given to OneCarEnv.step
+        u:          (n_cars, 3) uniforms for the spawns (gap, lane, kind)
+        car_lane, spawn_lane, last_y: (n_cars,) as in OneCarVectorEnv
+        kind, lane, y: (max_objects,) object slots, as in OneCarVectorEnv
+    Returns (circles collected, terminated, checked); `checked` is False
+    when every object was still above the cars and nothing was checked.
+    """
+    n_cars = car_lane.shape[0]
+    n_slots = kind.shape[0]
+
+    # Move the cars
+    for i in range(n_cars):
+        start = 2*i + 1
+        a = actions[i]
+        if continuous:
+            right, left = a >= 0.25, a <= -0.25
+        else:
+            right, left = a == 2, a == 1
+        if right and car_lane[i] == start:
+            car_lane[i] = start + 1
+        elif left and car_lane[i] == start + 1:
+            car_lane[i] = start
+
+    # Introduce new non-car objects
+    for i in range(n_cars):
+        gap = SHORT_GAP if u[i, 0] < SHORT_GAP_P else LONG_GAP
+        if last_y[i] > gap:
+            if u[i, 1] >= SAME_LANE_P:
+                spawn_lane[i] = 4*i - spawn_lane[i] + 3
+            slot = 0
+            while slot < n_slots and kind[slot] != EMPTY:
+                slot += 1
+            if slot == n_slots:
+                raise RuntimeError("More objects on the field than object slots")
+            kind[slot] = OBSTACLE if u[i, 2] < OBSTACLE_P else CIRCLE
+            lane[slot] = spawn_lane[i]
+            y[slot] = -OBSTACLE_HEIGHT
+            last_y[i] = -OBSTACLE_HEIGHT
+
+    # Move the non-car objects
+    lowest = -OBSTACLE_HEIGHT
+    for s in range(n_slots):
+        if kind[s] != EMPTY:
+            y[s] += speed
+            lowest = max(lowest, y[s])
+    for i in range(n_cars):
+        last_y[i] += speed
+    if lowest <= SAFE_Y:
+        return 0, False, False
+
+    # Kill the obstacles we have dodged, check for collisions, missed
+    # circles and collected circles
+    terminated = False
+    collected = 0
+    for s in range(n_slots):
+        k = kind[s]
+        if k == EMPTY:
+            continue
+        if k == OBSTACLE and y[s] > KILL_Y:
+            kind[s] = EMPTY
+            continue
+        touching = (car_lane[(lane[s] - 1) // 2] == lane[s]
+                    and TOUCH_TOP < y[s] < CAR_BOTTOM)
+        if k == OBSTACLE:
+            terminated |= touching
+        else:
+            terminated |= y[s] > MISSED_Y
+            if touching:
+                kind[s] = EMPTY
+                collected += 1
+    return collected, terminated, True
+
+
+@njit(cache=True, nogil=True)
+def features(out, car_lane, kind, lane, y, speed, n_nearest):
+    """
+    The `obs_type="features"` observation of one game, written to `out`;
+    same layout and values as features.encode_features.
+    """
+    n_cars = car_lane.shape[0]
+    n_slots = kind.shape[0]
+    for i in range(n_cars):
+        out[i] = car_lane[i] - (2*i + 1)
+    for l in range(2*n_cars):
+        base = n_cars + 2*n_nearest*l
+        taken = 0
+        limit = 1 << 30   # y of the last object taken
+        while taken < n_nearest:
+            best = -1
+            for s in range(n_slots):
+                if (kind[s] != EMPTY and lane[s] == l + 1 and y[s] < limit
+                        and (best < 0 or y[s] > y[best])):
+                    best = s
+            if best < 0:
+                break
+            out[base + 2*taken] = (TOUCH_TOP - y[best]) / VIDEO_H
+            out[base + 2*taken + 1] = 1.0 if kind[best] == OBSTACLE else -1.0
+            limit = y[best]
+            taken += 1
+        for t in range(taken, n_nearest):
+            out[base + 2*t] = 1.0
+            out[base + 2*t + 1] = 0.0
+    out[out.shape[0] - 1] = speed / VIDEO_H
+    return out
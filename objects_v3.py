@@ -1,4 +1,4 @@
-import pygame
+from collections import deque
 
 # Define game params.
 SCREEN_WIDTH = 400
@@ -14,28 +14,45 @@ OBSTACLE_HEIGHT = SCREEN_WIDTH//20
 # Colors
 PURPLE = (28, 46, 121)
 
+# Object kinds, as stored by the array-backed engines
+EMPTY = 0
+OBSTACLE = 1
+CIRCLE = 2
+
 # Defining the objects
-class Car(pygame.sprite.Sprite):
-    def __init__(self, lane_start, lane_end, colour):
-        super().__init__()
-        self.image = pygame.Surface((CAR_WIDTH, CAR_HEIGHT))
-        self.image.fill(colour)
-        self.rect = self.image.get_rect()
+# pygame is only imported to draw them, so headless envs never load it.
+class Car:
+    def __init__(self, lane_start, lane_end, colour, lane_width=LANE_WIDTH):
+        self.colour = colour
         self.lane_start = lane_start
         self.lane_end = lane_end
-        self.rect.centerx = (2*lane_start - 1) * LANE_WIDTH // 2
-        self.rect.bottom = SCREEN_HEIGHT - 10
+        self.lane_width = lane_width
+        # Edges of the car, as its pygame rect
+        self.bottom = SCREEN_HEIGHT - 10
+        self.top = self.bottom - CAR_HEIGHT
+        self.set_lane(lane_start)
+        self._image = None
+
+    @property
+    def image(self):
+        if self._image is None:
+            import pygame
+            self._image = pygame.Surface((CAR_WIDTH, CAR_HEIGHT))
+            self._image.fill(self.colour)
+        return self._image
+
+    @property
+    def rect(self):
+        import pygame
+        return pygame.Rect(self.left, self.top, CAR_WIDTH, CAR_HEIGHT)
 
     def get_lane(self):
-        if (self.rect.centerx == (2*self.lane_end - 1) * LANE_WIDTH // 2):
-            return self.lane_end
-        # elif (self.rect.centerx == (2*self.lane_start - 1) * LANE_WIDTH // 2):
-        #     return self.lane_start
-        else:
-            return self.lane_start
+        return self.lane
 
     def set_lane(self, lane):
-        self.rect.centerx = (2*lane - 1) * LANE_WIDTH // 2
+        self.lane = lane
+        self.left = (2*lane - 1) * self.lane_width // 2 - CAR_WIDTH // 2
+        self.right = self.left + CAR_WIDTH
 
     def update(self, action, continuous):
         if continuous:
@@ -51,9 +68,9 @@ class Car(pygame.sprite.Sprite):
             elif action == 1 and self.get_lane() == self.lane_end:
                 self.set_lane(self.lane_start)
 
-class Obstacle(pygame.sprite.Sprite):
+class Obstacle:
     def __init__(self, lane, colour):
-        super().__init__()
+        import pygame
         self.image = pygame.Surface((OBSTACLE_WIDTH, OBSTACLE_HEIGHT))
         self.image.fill(colour)
         self.rect = self.image.get_rect()
@@ -63,9 +80,9 @@ class Obstacle(pygame.sprite.Sprite):
     def update(self, speed):
         self.rect.y += speed
 
-class Circle(pygame.sprite.Sprite):
+class Circle:
     def __init__(self, lane, colour):
-        super().__init__()
+        import pygame
         self.image = pygame.Surface((OBSTACLE_WIDTH, OBSTACLE_HEIGHT))
         self.image.fill(PURPLE)
         self.rect = self.image.get_rect()
@@ -77,4 +94,123 @@ class Circle(pygame.sprite.Sprite):
                             OBSTACLE_HEIGHT // 2)
 
     def update(self, speed):
-        self.rect.y += speed
\ No newline at end of file
+        self.rect.y += speed
+
+class ObjectPool:
+    """
+    Fixed-capacity store for the non-car objects of one game.
+
+    Instead of a Sprite (and a Surface) per spawn, an object is a slot in
+    a few parallel lists: kind (EMPTY, OBSTACLE or CIRCLE), lane, and
+    rect.x / rect.y. Freed slots are reused, and all the objects of a kind
+    in a car's lanes are drawn with one shared image, built on the first
+    draw; `colours` holds a {kind: colour} per car. With a
+    handful of slots, plain lists are quicker to scan than NumPy arrays.
+
+    Every lane also keeps a deque of its slots, lowest on the screen first.
+    Objects spawn at the top and all move at the same speed, so appending
+    on spawn keeps them sorted. The checks near the cars (`lowest`,
+    `colliding`, `below`) only look at the first objects of each lane,
+    however many objects are on the field.
+    """
+    __slots__ = ("capacity", "lane_width", "kind", "lane", "x", "y", "lanes",
+                 "colours", "images")
+
+    def __init__(self, capacity, colours, lane_width=LANE_WIDTH):
+        self.capacity = capacity
+        self.lane_width = lane_width
+        self.kind = [EMPTY] * capacity
+        self.lane = [1] * capacity
+        self.x = [0] * capacity
+        self.y = [0] * capacity
+        self.lanes = [deque() for _ in range(SCREEN_WIDTH // lane_width)]
+        self.colours = colours
+        self.images = None
+
+    def __iter__(self):
+        # (slot, kind) of the live objects
+        return ((i, kind) for i, kind in enumerate(self.kind) if kind != EMPTY)
+
+    def clear(self):
+        self.kind[:] = [EMPTY] * self.capacity
+        for queue in self.lanes:
+            queue.clear()
+
+    def spawn(self, kind, lane):
+        try:
+            slot = self.kind.index(EMPTY)
+        except ValueError:
+            raise RuntimeError(f"More than {self.capacity} objects on the field") from None
+        self.kind[slot] = kind
+        self.lane[slot] = lane
+        self.x[slot] = lane * self.lane_width - self.lane_width // 2 - OBSTACLE_WIDTH // 2
+        self.y[slot] = -OBSTACLE_HEIGHT
+        self.lanes[lane - 1].append(slot)
+        return slot
+
+    def kill(self, slot):
+        self.kind[slot] = EMPTY
+        queue = self.lanes[self.lane[slot] - 1]
+        if queue[0] == slot:   # nearly always the lowest of its lane
+            queue.popleft()
+        else:
+            queue.remove(slot)
+
+    def lowest(self):
+        # Largest rect.y of the live objects, -OBSTACLE_HEIGHT if there are none
+        y = self.y
+        return max((y[queue[0]] for queue in self.lanes if queue), default=-OBSTACLE_HEIGHT)
+
+    def load(self, kind, lane, y):
+        # Replace the objects with those of another engine's slot arrays
+        lane_width = self.lane_width
+        self.kind[:] = kind.tolist()
+        self.lane[:] = lane.tolist()
+        self.y[:] = y.tolist()
+        self.x[:] = [l * lane_width - lane_width // 2 - OBSTACLE_WIDTH // 2 for l in self.lane]
+        for queue in self.lanes:
+            queue.clear()
+        for y_i, i in sorted(((self.y[i], i) for i, _ in self), reverse=True):
+            self.lanes[self.lane[i] - 1].append(i)
+
+    def below(self, limit):
+        # Slots of the objects with rect.y > limit
+        y = self.y
+        slots = []
+        for queue in self.lanes:
+            for i in queue:
+                if y[i] <= limit:
+                    break
+                slots.append(i)
+        return slots
+
+    def update(self, speed):
+        y = self.y
+        for i, _ in self:
+            y[i] += speed
+
+    def colliding(self, car):
+        # Slots of the objects overlapping `car`, as Rect.colliderect: an
+        # object only overlaps a car in the same lane
+        top, bottom = car.top - OBSTACLE_HEIGHT, car.bottom
+        y = self.y
+        slots = []
+        for i in self.lanes[car.lane - 1]:
+            if y[i] <= top:
+                break
+            if y[i] < bottom:
+                slots.append(i)
+        return slots
+
+    def sprites(self):
+        # (image, (x, y)) of every live object, as Surface.blits takes them
+        if self.images is None:
+            per_car = [{OBSTACLE: Obstacle(1, colours[OBSTACLE]).image,
+                        CIRCLE: Circle(1, colours[CIRCLE]).image}
+                       for colours in self.colours]
+            self.images = [images for images in per_car for _ in range(2)]   # per lane
+        images, lane, x, y = self.images, self.lane, self.x, self.y
+        return [(images[lane[i] - 1][kind], (x[i], y[i])) for i, kind in self]
+
+    def draw(self, surface):
+        surface.blits(self.sprites(), doreturn=False)
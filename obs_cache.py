@@ -0,0 +1,45 @@
+from collections import OrderedDict
+
+
+class ObsCache:
+    """
+    Bounded LRU cache of observations, keyed on the game state they were
+    drawn from. Cached arrays are made read-only, so the same array can be
+    handed out for every hit without copying.
+    """
+    __slots__ = ("capacity", "hits", "misses", "_frames")
+
+    def __init__(self, capacity):
+        assert capacity > 0
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._frames = OrderedDict()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def get(self, key):
+        frame = self._frames.get(key)
+        if frame is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._frames.move_to_end(key)
+        return frame
+
+    def put(self, key, frame):
+        frame.flags.writeable = False
+        self._frames[key] = frame
+        if len(self._frames) > self.capacity:
+            self._frames.popitem(last=False)
+        return frame
+
+    def clear(self):
+        self._frames.clear()
+        self.hits = self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"size": len(self._frames), "capacity": self.capacity, "hits": self.hits,
+                "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
@@ -0,0 +1,69 @@
+from time import perf_counter
+
+
+class StageTimer:
+    """
+    Wall-clock time spent in each stage of `OneCarEnv.step`.
+
+    The env calls `start()` at the top of a step and `lap(stage)` at the end
+    of every stage; a lap is charged the time since the previous lap (or
+    `start`/`mark`). `skip(stage)` counts a call of no time, for stages a
+    step didn't need. `last` holds the times of the latest step, `totals`
+    and `calls` accumulate until `reset()`. Times are in seconds.
+    """
+    __slots__ = ("totals", "calls", "last", "_t")
+
+    def __init__(self):
+        self.totals = {}
+        self.calls = {}
+        self.last = {}
+        self._t = perf_counter()
+
+    def start(self):
+        self.last = {}
+        self._t = perf_counter()
+
+    def mark(self):
+        # Start timing without opening a new step, e.g. for env.render()
+        self._t = perf_counter()
+
+    def lap(self, stage):
+        now = perf_counter()
+        dt = now - self._t
+        self._t = now
+        self.last[stage] = self.last.get(stage, 0.0) + dt
+        self.totals[stage] = self.totals.get(stage, 0.0) + dt
+        self.calls[stage] = self.calls.get(stage, 0) + 1
+
+    def skip(self, *stages):
+        # Stages a step didn't need: a call that took no time, so that every
+        # stage of a step is counted the same number of times
+        for stage in stages:
+            self.last[stage] = self.last.get(stage, 0.0)
+            self.totals[stage] = self.totals.get(stage, 0.0)
+            self.calls[stage] = self.calls.get(stage, 0) + 1
+
+    def reset(self):
+        self.totals.clear()
+        self.calls.clear()
+        self.last = {}
+
+    def summary(self):
+        """{stage: {"calls", "total_s", "mean_us", "share"}}, slowest first."""
+        everything = sum(self.totals.values()) or 1.0
+        return {
+            stage: {
+                "calls": self.calls[stage],
+                "total_s": total,
+                "mean_us": total / self.calls[stage] * 1e6,
+                "share": total / everything,
+            }
+            for stage, total in sorted(self.totals.items(), key=lambda kv: -kv[1])
+        }
+
+    def __str__(self):
+        lines = [f"{'stage':<20}{'calls':>10}{'total s':>10}{'mean us':>10}{'share':>8}"]
+        for stage, s in self.summary().items():
+            lines.append(f"{stage:<20}{s['calls']:>10}{s['total_s']:>10.3f}"
+                         f"{s['mean_us']:>10.1f}{s['share']:>8.1%}")
+        return "\n".join(lines)
@@ -0,0 +1,183 @@
+import numpy as np
+import pygame
+
+from objects_v3 import Car, Obstacle, Circle, OBSTACLE, CIRCLE
+from OneCar_v3 import (STATE_W, STATE_H, VIDEO_W, VIDEO_H, SCORE_H,
+                       OBSTACLE_WIDTH, OBSTACLE_HEIGHT, GRAY_WEIGHTS,
+                       PURPLE, BLUE_VIOLET, colors, object_colours)
+
+
+def _area_weights(src, dst):
+    """
+    (dst, src) matrix that box-filters `src` pixels down to `dst` pixels,
+    i.e. the area averaging `pygame.transform.smoothscale` does when shrinking.
+    """
+    scale = src / dst
+    edges = np.arange(dst + 1) * scale
+    pix = np.arange(src)
+    overlap = (np.minimum(edges[1:, None], pix + 1)
+               - np.maximum(edges[:-1, None], pix))
+    return np.clip(overlap, 0, None) / scale
+
+
+def _pixels(surface):
+    # (H, W, 3) float copy of a pygame surface
+    return pygame.surfarray.array3d(surface).transpose(1, 0, 2).astype(np.float64)
+
+
+# Tables of every Rasterizer built so far, by (n_cars, size, grayscale);
+# they never change, so the envs of a process share them
+_TABLES = {}
+
+
+class Rasterizer:
+    """
+    Draws `state_pixels` frames of many OneCar games straight into uint8 arrays.
+
+    `_render` draws the full 400x600 canvas, crops the score off and
+    smoothscales it down. Smoothscale is a linear (area averaging) filter and
+    the objects never overlap each other, so the scaled frame is the scaled
+    background plus one small patch per object. All of these are precomputed
+    here once:
+        base:   scaled background, lane lines and cars, one per car layout
+        stamps: scaled patch of an object (in its car's colours, see
+                object_colours), per kind, lane, y and whether the
+                car is in that lane (the car shows through a circle's corners)
+    Drawing a frame is then one copy into `out` and one fancy-indexed store per
+    object.
+    With `grayscale=True` both are converted to luma before rounding, and
+    frames are (H, W) instead of (H, W, 3). The tables are built once per
+    process for every (n_cars, size, grayscale) and shared read-only.
+    """
+    def __init__(self, n_cars=1, size=(STATE_W, STATE_H), grayscale=False):
+        self.n_cars = n_cars
+        self.grayscale = grayscale
+        self.lane_width = VIDEO_W // (2*n_cars)
+        self.screen_w = 2 * self.lane_width * n_cars
+        self.out_w, self.out_h = size
+        self._bits = np.arange(n_cars)
+        self._lane_end = 2*self._bits + 2
+
+        key = (n_cars, tuple(size), grayscale)
+        if key not in _TABLES:
+            _TABLES[key] = self._tables()
+        vars(self).update(_TABLES[key])
+
+    def _tables(self):
+        n_cars = self.n_cars
+
+        src_h = VIDEO_H - SCORE_H
+        rx = _area_weights(self.screen_w, self.out_w)
+        ry = _area_weights(src_h, self.out_h)
+
+        # Scaled background for every car layout; bit c is set when car c
+        # is in its right (lane_end) lane.
+        canvases = []
+        for layout in range(2**n_cars):
+            lanes = [2*c + 1 + (layout >> c & 1) for c in range(n_cars)]
+            canvases.append(self._canvas(lanes))
+        scaled = np.stack([self._scale(c, ry, rx) for c in canvases])
+        base = np.ascontiguousarray(self._quantize(scaled))
+
+        # Footprint of an object in the scaled frame: fixed columns per lane
+        # and at most `stamp_h` rows starting at `r0[y]`.
+        sx = self.screen_w / self.out_w
+        sy = src_h / self.out_h
+        left = (np.arange(1, 2*n_cars + 1) * self.lane_width
+                - self.lane_width // 2 - OBSTACLE_WIDTH // 2)
+        c0 = np.floor(left / sx).astype(int)
+        c1 = np.ceil((left + OBSTACLE_WIDTH) / sx).astype(int)
+        stamp_w = int((c1 - c0).max())
+        c0 = np.minimum(c0, self.out_w - stamp_w)
+        stamp_h = int(np.ceil(OBSTACLE_HEIGHT / sy)) + 1
+
+        y_min = -OBSTACLE_HEIGHT
+        y_max = VIDEO_H   # fully below the frame
+        ys = np.arange(y_min, y_max + 1) - SCORE_H   # cropped coords
+        first = np.floor(np.clip(ys, 0, src_h) / sy).astype(int)
+        r0 = np.clip(first, 0, self.out_h - stamp_h)
+
+        # Pad the canvas rows so every object's rows can be gathered at once
+        pad = SCORE_H + OBSTACLE_HEIGHT
+        ry_pad = np.zeros((self.out_h, src_h + 2*pad))
+        ry_pad[:, pad:pad + src_h] = ry
+        rows = ys[:, None] + pad + np.arange(OBSTACLE_HEIGHT)   # (Y, OH)
+        out_rows = r0[:, None] + np.arange(stamp_h)   # (Y, R)
+        weights = ry_pad[out_rows[:, :, None], rows[:, None, :]]   # (Y, R, OH)
+
+        sprites = [{OBSTACLE: _pixels(Obstacle(1, colours[OBSTACLE]).image),
+                    CIRCLE: _pixels(Circle(1, colours[CIRCLE]).image)}
+                   for colours in object_colours(n_cars)]
+        stamps = np.empty((2, 2*n_cars, 2, ys.size, stamp_h, stamp_w) + base.shape[3:], np.uint8)
+        for lane in range(1, 2*n_cars + 1):
+            car = (lane - 1) // 2
+            x0 = left[lane - 1]
+            cols = slice(c0[lane - 1], c0[lane - 1] + stamp_w)
+            wx = rx[cols, x0:x0 + OBSTACLE_WIDTH]   # (W, OW)
+            for here in range(2):
+                layout = int((lane % 2 == 0) == bool(here)) << car
+                # Only the object's columns: gathering the rows of the full
+                # canvas would make a (Y, OH, screen_w, 3) float temporary
+                strip = np.pad(canvases[layout][:, x0:x0 + OBSTACLE_WIDTH],
+                               ((pad, pad), (0, 0), (0, 0)))
+                under = strip[rows]   # (Y, OH, OW, 3)
+                below = scaled[layout][:, cols][out_rows]   # (Y, R, W, 3)
+                for kind, sprite in sprites[car].items():
+                    delta = np.einsum("yrh,yhwc,xw->yrxc",
+                                      weights, sprite - under, wx, optimize=True)
+                    stamps[kind - 1, lane - 1, here] = self._quantize(below + delta)
+
+        tables = dict(base=base, stamps=stamps, c0=c0, r0=r0, stamp_w=stamp_w,
+                      stamp_h=stamp_h, y_min=y_min, y_max=y_max)
+        for v in tables.values():
+            if isinstance(v, np.ndarray):
+                v.flags.writeable = False
+        return tables
+
+    def _canvas(self, lanes):
+        # Cropped full-resolution background with the cars in `lanes`
+        surf = pygame.Surface((self.screen_w, VIDEO_H))
+        surf.fill(PURPLE)
+        for i, lane in enumerate(lanes):
+            car = Car(2*i + 1, 2*i + 2, colors[i], self.lane_width)
+            car.set_lane(lane)
+            surf.blit(car.image, (car.left, car.top))
+        for i in range(1, 2*self.n_cars):
+            pygame.draw.line(surf, BLUE_VIOLET,
+                             (self.lane_width * i, 0),
+                             (self.lane_width * i, VIDEO_H), 2)
+        return _pixels(surf)[SCORE_H:]
+
+    def _quantize(self, pixels):
+        # float RGB -> uint8 RGB, or uint8 luma when grayscale
+        if self.grayscale:
+            pixels = pixels @ GRAY_WEIGHTS
+        return np.clip(np.rint(pixels), 0, 255).astype(np.uint8)
+
+    @staticmethod
+    def _scale(canvas, ry, rx):
+        return np.einsum("yh,hwc,xw->yxc", ry, canvas, rx, optimize=True)
+
+    def draw(self, out, car_lane, obj_y, obj_lane, obj_kind):
+        """
+        Draw a batch of games into `out` (N, H, W, 3), or (N, H, W) when
+        grayscale, in place.
+        car_lane: (N, n_cars); obj_y, obj_lane, obj_kind: (N, max_objects)
+        """
+        layout = ((car_lane == self._lane_end) << self._bits).sum(axis=1)
+        # In place: out[...] = self.base[layout] would gather into a new
+        # batch of frames first. mode="raise" buffers `out` too.
+        np.take(self.base, layout, axis=0, out=out, mode="clip")
+
+        game, slot = np.nonzero(obj_kind)
+        if game.size == 0:
+            return out
+        lane = obj_lane[game, slot].astype(np.intp)
+        here = car_lane[game, (lane - 1) // 2] == lane
+        y = np.clip(obj_y[game, slot], self.y_min, self.y_max) - self.y_min
+        patches = self.stamps[obj_kind[game, slot] - 1, lane - 1,
+                              here.astype(np.intp), y]
+        rows = self.r0[y][:, None] + np.arange(self.stamp_h)
+        cols = self.c0[lane - 1][:, None] + np.arange(self.stamp_w)
+        out[game[:, None, None], rows[:, :, None], cols[:, None, :]] = patches
+        return out
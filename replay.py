@@ -0,0 +1,228 @@
+import argparse
+import json
+import os
+import queue
+import struct
+import threading
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+import gymnasium as gym
+
+
+# All that is needed to replay an episode of OneCarEnv: every spawn decision
+# comes from env.np_random, which reset(seed=seed) seeds.
+EpisodeLog = namedtuple("EpisodeLog", ["seed", "actions", "episode_return"])
+
+
+class RecordEpisodeLog(gym.Wrapper):
+    """
+    Keeps an `EpisodeLog` of every finished episode in `self.logs`, or
+    with `path` writes them to that file with an `EpisodeWriter` instead.
+    Resets without a seed get one drawn from a generator seeded with `seed`,
+    so every episode can be replayed.
+    """
+    def __init__(self, env, seed=None, path=None):
+        super().__init__(env)
+        self.logs = []
+        self.writer = None
+        if path is not None:
+            u = env.unwrapped
+            self.writer = EpisodeWriter(path, {"continuous": u.continuous, "n_cars": u.n_cars,
+                                               "frame_skip": u.frame_skip})
+        self._seeds = np.random.default_rng(seed)
+        self._seed = None
+        self._actions = []
+        self._return = 0.0
+
+    def reset(self, *, seed=None, options=None):
+        if seed is None:
+            seed = int(self._seeds.integers(2**31))
+        self._seed = seed
+        self._actions = []
+        self._return = 0.0
+        return self.env.reset(seed=seed, options=options)
+
+    def step(self, action):
+        obs, reward, terminated, truncated, info = self.env.step(action)
+        self._actions.append(np.array(action, copy=True))   # callers may reuse the array
+        self._return += reward
+        if terminated or truncated:
+            if self.writer is not None:
+                self.writer.write(EpisodeLog(self._seed, self._actions, self._return))
+            else:
+                self.logs.append(EpisodeLog(self._seed, np.array(self._actions), self._return))
+        return obs, reward, terminated, truncated, info
+
+    def close(self):
+        try:
+            if self.writer is not None:
+                self.writer.close()
+        finally:
+            super().close()
+
+
+def replay(env, log):
+    """
+    Replay `log` in `env`, yielding (observation, reward) for the reset and
+    then for every action. The env must be built with the same arguments
+    as the one that was recorded.
+    """
+    obs, _ = env.reset(seed=log.seed)
+    yield obs, 0
+    for action in log.actions:
+        obs, reward, terminated, truncated, _ = env.step(action)
+        yield obs, reward
+        if terminated or truncated:
+            break
+
+
+def save_logs(path, logs):
+    """Write episode logs to a compressed .npz file; `logs` may be empty."""
+    np.savez_compressed(
+        path,
+        seeds=np.array([log.seed for log in logs], dtype=np.int64),
+        lengths=np.array([len(log.actions) for log in logs], dtype=np.int64),
+        returns=np.array([log.episode_return for log in logs], dtype=np.float64),
+        actions=np.concatenate([log.actions for log in logs]) if logs else np.empty(0),
+    )
+
+
+def load_logs(path):
+    data = np.load(path)
+    actions = np.split(data["actions"], np.cumsum(data["lengths"])[:-1])
+    return [EpisodeLog(int(seed), a, float(ret))
+            for seed, a, ret in zip(data["seeds"], actions, data["returns"])]
+
+
+MAGIC = b"ONECAR-EPISODES\n"
+EPISODE = struct.Struct("<qdII")   # seed, return, steps, bytes of compressed actions
+
+
+class EpisodeWriter:
+    """
+    Appends episode logs to a binary file from a background thread, so
+    recording costs the training loop one list append per step and one
+    queue put per episode. The file is a header (`MAGIC`, then the
+    `OneCarEnv` arguments that the games depend on, as JSON) followed by
+    an `EPISODE` record and the zlib-compressed actions of every episode.
+    Actions are stored as one int8 per car and step; continuous actions as
+    the move they make (-1, 0 or 1), which replays the same.
+    """
+    def __init__(self, path, env_kwargs):
+        self.env_kwargs = env_kwargs
+        self.episodes = 0
+        self.file = open(path, "wb")
+        header = json.dumps(env_kwargs).encode()
+        self.file.write(MAGIC + struct.pack("<I", len(header)) + header)
+        self._queue = queue.Queue()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="EpisodeWriter", daemon=True)
+        self._thread.start()
+
+    def write(self, log):
+        self._check()
+        self._queue.put(log)
+
+    def _run(self):
+        # An exception ends the thread; write() and close() raise it
+        try:
+            while (log := self._queue.get()) is not None:
+                actions = np.asarray(log.actions)
+                if self.env_kwargs["continuous"]:
+                    actions = (actions >= 0.25).astype(np.int8) - (actions <= -0.25)
+                payload = zlib.compress(actions.astype(np.int8).tobytes())
+                self.file.write(EPISODE.pack(log.seed, log.episode_return, len(actions),
+                                             len(payload)) + payload)
+                self.episodes += 1
+        except BaseException as e:
+            self._error = e
+        finally:
+            self.file.close()
+
+    def _check(self):
+        if self._error is not None:
+            raise RuntimeError("EpisodeWriter thread failed") from self._error
+
+    def close(self):
+        """Write what is queued and close the file."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._check()
+
+
+def read_episodes(path):
+    """
+    The env arguments and the `EpisodeLog`s of a file written by
+    `EpisodeWriter`. An episode cut short by a crash is left out.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not an episode recording")
+        (size,) = struct.unpack("<I", f.read(4))
+        env_kwargs = json.loads(f.read(size))
+        n_cars, continuous = env_kwargs["n_cars"], env_kwargs["continuous"]
+        logs = []
+        while len(header := f.read(EPISODE.size)) == EPISODE.size:
+            seed, episode_return, steps, size = EPISODE.unpack(header)
+            payload = f.read(size)
+            if len(payload) < size:
+                break
+            actions = np.frombuffer(zlib.decompress(payload), np.int8).reshape(steps, n_cars)
+            if continuous:
+                actions = actions.astype(np.float32)
+            elif n_cars == 1:
+                actions = actions[:, 0].astype(np.int64)
+            else:
+                actions = actions.astype(np.int64)
+            logs.append(EpisodeLog(seed, actions, episode_return))
+    return env_kwargs, logs
+
+
+def render_episodes(path, out, episodes=None, images=False):
+    """
+    Replay the episodes of a recording (all, or those indexed by
+    `episodes`) and save each as a video in the folder `out`, or with
+    `images` as one PNG per frame. Videos need moviepy, like RecordVideo.
+    """
+    from OneCar_v3 import OneCarEnv
+
+    env_kwargs, logs = read_episodes(path)
+    env = OneCarEnv(render_mode="rgb_array", **env_kwargs)
+    os.makedirs(out, exist_ok=True)
+    for i in range(len(logs)) if episodes is None else episodes:
+        frames = [env.render() for _ in replay(env, logs[i])]
+        if images:
+            import pygame
+            for t, frame in enumerate(frames):
+                surface = pygame.surfarray.make_surface(frame.swapaxes(0, 1))
+                pygame.image.save(surface, os.path.join(out, f"episode-{i}-{t:05d}.png"))
+        else:
+            from gymnasium.utils.save_video import save_video
+            save_video(frames, out, episode_trigger=lambda _: True, name_prefix="episode",
+                       episode_index=i, fps=env.metadata["render_fps"])
+    env.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Turn an episode recording into videos or images.")
+    parser.add_argument("recording")
+    parser.add_argument("--out", default="videos/replay")
+    parser.add_argument("--episodes", type=int, nargs="*", help="indices (default: all)")
+    parser.add_argument("--images", action="store_true", help="PNG frames instead of videos")
+    parser.add_argument("--list", action="store_true", help="list the episodes and exit")
+    args = parser.parse_args(argv)
+    if args.list:
+        env_kwargs, logs = read_episodes(args.recording)
+        print(json.dumps(env_kwargs))
+        for i, log in enumerate(logs):
+            print(f"{i}\tseed={log.seed}\tsteps={len(log.actions)}\treturn={log.episode_return}")
+        return
+    render_episodes(args.recording, args.out, args.episodes, args.images)
+
+
+if __name__ == "__main__":
+    main()
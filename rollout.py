@@ -0,0 +1,255 @@
+import multiprocessing as mp
+import time
+import traceback
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from gymnasium import spaces
+from gymnasium.vector import VectorEnv
+
+from OneCar_v3 import OneCarEnv
+
+
+def _attach(shm, specs):
+    # numpy views of the shared buffers
+    return {k: np.ndarray(shape, dtype, buffer=shm[k].buf)
+            for k, (shape, dtype) in specs.items()}
+
+
+def _worker(index, pipe, names, specs, env_kwargs, first, n_envs):
+    shm = {k: shared_memory.SharedMemory(name=name) for k, name in names.items()}
+    buf = _attach(shm, specs)
+    obs, final_obs, actions = buf["obs"], buf["final_obs"], buf["actions"]
+    rewards, terminated, truncated = buf["rewards"], buf["terminated"], buf["truncated"]
+
+    envs = [OneCarEnv(**env_kwargs) for _ in range(n_envs)]
+    rows = range(first, first + n_envs)
+
+    try:
+        while True:
+            cmd, slot, data = pipe.recv()
+            start = time.perf_counter()
+            if cmd == "reset":
+                # data: a seed per env, or None to go on with their generators
+                for k, (i, env) in enumerate(zip(rows, envs)):
+                    seed_k = None if data is None else int(data[k])
+                    obs[slot, i], _ = env.reset(seed=seed_k)
+                    rewards[slot, i] = 0
+                    terminated[slot, i] = truncated[slot, i] = False
+            elif cmd == "step":
+                for i, env in zip(rows, envs):
+                    o, r, te, tr, _ = env.step(actions[i])
+                    if te or tr:
+                        final_obs[slot, i] = o
+                        o, _ = env.reset()
+                    obs[slot, i], rewards[slot, i] = o, r
+                    terminated[slot, i], truncated[slot, i] = te, tr
+            elif cmd == "close":
+                break
+            pipe.send(("ok", time.perf_counter() - start))
+    except (KeyboardInterrupt, EOFError):
+        pass
+    except Exception:
+        pipe.send(("error", traceback.format_exc()))
+    finally:
+        for s in shm.values():
+            s.close()
+        pipe.close()
+
+
+class RolloutFarm(VectorEnv):
+    """
+    OneCarEnv instances spread over `n_workers` processes, `envs_per_worker`
+    each. Workers write observations, rewards and dones into shared memory,
+    so frames are never pickled; only (command, slot) messages go through
+    the pipes.
+
+    The shared buffers form a ring of `ring_size` slots and every call uses
+    the next slot. The arrays returned by `reset` and `step` are views of
+    that slot: no copies are made, and they stay valid for the next
+    `ring_size - 1` steps. `infos["final_observation"]` is a view as well;
+    only its rows flagged in `infos["_final_observation"]` are meaningful.
+
+    Env i is reset with `seed + i` and then runs on its own generator, so
+    a farm replays identically for a given seed; later resets without a
+    seed go on with those generators. A worker that dies, noticed while
+    sending it a command or waiting for its reply, is restarted and its
+    envs are reset with new seeds drawn from a `SeedSequence` of `seed`;
+    they are reported as truncated in that step, the worker is listed in
+    `infos["crashed_workers"]` and `restarts[w]` is incremented. An
+    exception raised by an env is re-raised in the learner once every
+    worker has replied; its worker exits and is restarted at the next call.
+    """
+    def __init__(self, n_workers=2, envs_per_worker=4, ring_size=4, seed=0,
+                 env_kwargs=None, context=None):
+        self.n_workers = n_workers
+        self.envs_per_worker = envs_per_worker
+        self.ring_size = ring_size
+        self.seed = seed
+        self._seeded = False   # the first reset uses `seed` even when not given one
+        self._restart_seeds = np.random.SeedSequence(seed)
+        self.env_kwargs = env_kwargs or {}
+
+        probe = OneCarEnv(**self.env_kwargs)
+        super().__init__(n_workers * envs_per_worker,
+                         probe.observation_space, probe.action_space)
+        del probe
+
+        n, obs_space = self.num_envs, self.single_observation_space
+        act_dtype = np.int64 if isinstance(self.single_action_space, spaces.Discrete) \
+            else self.single_action_space.dtype
+        self._specs = {
+            "obs": ((ring_size, n) + obs_space.shape, obs_space.dtype),
+            "final_obs": ((ring_size, n) + obs_space.shape, obs_space.dtype),
+            "actions": ((n,) + self.single_action_space.shape, act_dtype),
+            "rewards": ((ring_size, n), np.float32),
+            "terminated": ((ring_size, n), np.bool_),
+            "truncated": ((ring_size, n), np.bool_),
+        }
+        self._shm = {
+            k: shared_memory.SharedMemory(
+                create=True, size=max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize))
+            for k, (shape, dtype) in self._specs.items()
+        }
+        self.buffers = _attach(self._shm, self._specs)
+
+        self._ctx = mp.get_context(context)
+        self._processes = [None] * n_workers
+        self._pipes = [None] * n_workers
+        self.restarts = np.zeros(n_workers, dtype=np.int64)
+        self.steps = np.zeros(n_workers, dtype=np.int64)   # env steps per worker
+        self.busy = np.zeros(n_workers)                    # seconds spent stepping
+        self._broken = set()   # workers whose pipe failed in _send
+        for w in range(n_workers):
+            self._start(w)
+        self.slot = 0
+
+    def _start(self, w):
+        parent, child = self._ctx.Pipe()
+        names = {k: s.name for k, s in self._shm.items()}
+        process = self._ctx.Process(
+            target=_worker, name=f"OneCarWorker-{w}", daemon=True,
+            args=(w, child, names, self._specs, self.env_kwargs,
+                  w * self.envs_per_worker, self.envs_per_worker),
+        )
+        process.start()
+        child.close()
+        self._processes[w], self._pipes[w] = process, parent
+
+    def _send(self, cmd, data=None):
+        # `data` is None or a list with one item per worker
+        for w, pipe in enumerate(self._pipes):
+            try:
+                pipe.send((cmd, self.slot, None if data is None else data[w]))
+            except (BrokenPipeError, OSError):
+                self._broken.add(w)   # died while idle; _wait restarts it
+
+    def _recv(self, w, timeout=None):
+        # (status, payload) of worker w's reply, or None if it died (or timed out)
+        process, pipe = self._processes[w], self._pipes[w]
+        start = time.monotonic()
+        while not pipe.poll(0.05):
+            if not process.is_alive():
+                return None
+            if timeout is not None and time.monotonic() - start > timeout:
+                return None
+        try:
+            return pipe.recv()
+        except (EOFError, OSError):
+            return None
+
+    def _wait(self, timeout=None):
+        """
+        Collect the replies, restarting the workers that died. An exception
+        of a worker is raised once every worker has replied, so that no
+        reply is left in a pipe for the next call.
+        """
+        crashed, errors = [], []
+        for w in range(self.n_workers):
+            if w in self._broken:
+                crashed.append(w)
+                continue
+            reply = self._recv(w, timeout)
+            if reply is None:
+                crashed.append(w)
+            elif reply[0] == "error":
+                # The worker exits; the next command finds it dead and restarts it
+                errors.append(f"Worker {w} raised an exception:\n{reply[1]}")
+            else:
+                self.busy[w] += reply[1]
+                self.steps[w] += self.envs_per_worker
+
+        self._broken.clear()
+        for w in crashed:
+            self._processes[w].kill()
+            self._processes[w].join()
+            self._pipes[w].close()
+            self.restarts[w] += 1
+            self._start(w)
+            seeds = self._restart_seeds.spawn(1)[0].generate_state(self.envs_per_worker)
+            self._pipes[w].send(("reset", self.slot, seeds.tolist()))
+            reply = self._recv(w)
+            if reply is None or reply[0] == "error":
+                raise RuntimeError(f"Worker {w} died again right after a restart")
+            # Its episodes were cut short
+            rows = slice(w * self.envs_per_worker, (w + 1) * self.envs_per_worker)
+            self.buffers["truncated"][self.slot, rows] = True
+            self.buffers["final_obs"][self.slot, rows] = self.buffers["obs"][self.slot, rows]
+        if errors:
+            raise RuntimeError("\n".join(errors))
+        return crashed
+
+    def worker_sps(self):
+        """Env steps per second of stepping time, for every worker."""
+        return self.steps / np.maximum(self.busy, 1e-9)
+
+    def _seeds(self, w):
+        first = w * self.envs_per_worker
+        return [self.seed + i for i in range(first, first + self.envs_per_worker)]
+
+    def reset_wait(self, seed=None, options=None):
+        if seed is not None:
+            self.seed = int(seed) if isinstance(seed, (int, np.integer)) else int(seed[0])
+            self._restart_seeds = np.random.SeedSequence(self.seed)
+        seeds = None
+        if seed is not None or (not self._seeded and self.seed is not None):
+            seeds = [self._seeds(w) for w in range(self.n_workers)]
+        self._seeded = True
+        self.slot = (self.slot + 1) % self.ring_size
+        self._send("reset", seeds)
+        self._wait()
+        self.steps[:] = 0
+        self.busy[:] = 0
+        return self.buffers["obs"][self.slot], {}
+
+    def step_async(self, actions):
+        self.buffers["actions"][:] = np.asarray(actions).reshape(self.buffers["actions"].shape)
+        self.slot = (self.slot + 1) % self.ring_size
+        self._send("step")
+
+    def step_wait(self, timeout=None):
+        crashed = self._wait(timeout)
+        b, s = self.buffers, self.slot
+        done = b["terminated"][s] | b["truncated"][s]
+        infos = {}
+        if done.any():
+            infos = {"final_observation": b["final_obs"][s], "_final_observation": done}
+        if crashed:
+            infos["crashed_workers"] = crashed
+        return b["obs"][s], b["rewards"][s], b["terminated"][s], b["truncated"][s], infos
+
+    def close_extras(self, **kwargs):
+        for w, (process, pipe) in enumerate(zip(self._processes, self._pipes)):
+            try:
+                pipe.send(("close", self.slot, None))
+            except (BrokenPipeError, OSError):
+                pass
+            process.join(timeout=1)
+            if process.is_alive():
+                process.kill()
+            pipe.close()
+        self.buffers = None
+        for s in self._shm.values():
+            s.close()
+            s.unlink()
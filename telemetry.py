@@ -0,0 +1,253 @@
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import gymnasium as gym
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+
+class Ring:
+    """
+    The last `size` values of a metric, plus the count and sum of all of
+    them. There is one writer and no lock: a reader may see a value that is
+    being replaced, which is fine for monitoring.
+    """
+    __slots__ = ("data", "count", "total")
+
+    def __init__(self, size):
+        self.data = np.zeros(size)
+        self.count = 0
+        self.total = 0.0
+
+    def push(self, value):
+        self.data[self.count % len(self.data)] = value
+        self.count += 1
+        self.total += value
+
+    def values(self):
+        return self.data[:min(self.count, len(self.data))].copy()
+
+
+def peak_rss_bytes():
+    """Peak resident memory of this process, None where `resource` is missing."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def rss_bytes():
+    """Resident memory of this process (peak RSS where /proc is missing)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return peak_rss_bytes() or 0
+
+
+class Telemetry:
+    """
+    Metrics of a training process, cheap enough to update on every step:
+        observe(name, x): a Ring of the last `window` values, exported as a
+                          summary (quantiles over the window, all-time sum
+                          and count)
+        inc(name, n):     a counter
+        set(name, x, **labels): a gauge
+    `prometheus()` renders them in the Prometheus text format; `write(path)`
+    writes that to a file (for node_exporter's textfile collector) and
+    `serve(port)` answers GET /metrics from a background thread (on 9464 by
+    default, as node_exporter has 9100).
+    """
+    QUANTILES = (0.5, 0.9, 0.99)
+
+    def __init__(self, window=1000, prefix="onecar"):
+        self.window = window
+        self.prefix = prefix
+        self.rings = {}
+        self.counters = {}
+        self.gauges = {}   # (name, labels) -> value
+        self.help = {}
+        self.marks = {}    # timestamps shared by the code feeding it
+        self.start = time.time()
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def observe(self, name, value):
+        ring = self.rings.get(name)
+        if ring is None:
+            ring = self.rings[name] = Ring(self.window)
+        ring.push(value)
+
+    def inc(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def set(self, name, value, **labels):
+        self.gauges[name, tuple(sorted(labels.items()))] = value
+
+    @contextmanager
+    def timer(self, name):
+        """Observe the seconds spent in a `with` block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def sample_process(self):
+        """Set the process gauges: resident memory and uptime."""
+        self.set("process_resident_memory_bytes", rss_bytes())
+        self.set("uptime_seconds", time.time() - self.start)
+
+    def prometheus(self):
+        # Copies, as the training thread may add metrics while a server thread renders
+        counters, rings, gauges = dict(self.counters), dict(self.rings), dict(self.gauges)
+        lines = []
+
+        def header(name, kind):
+            full = f"{self.prefix}_{name}"
+            if name in self.help:
+                lines.append(f"# HELP {full} {self.help[name]}")
+            lines.append(f"# TYPE {full} {kind}")
+            return full
+
+        for name, value in sorted(counters.items()):
+            full = header(name, "counter")
+            lines.append(f"{full} {value}")
+        for name, ring in sorted(rings.items()):
+            full = header(name, "summary")
+            values = ring.values()
+            if values.size:
+                for q, v in zip(self.QUANTILES, np.quantile(values, self.QUANTILES)):
+                    lines.append(f'{full}{{quantile="{q}"}} {v:.6g}')
+            lines.append(f"{full}_sum {ring.total:.6g}")
+            lines.append(f"{full}_count {ring.count}")
+        seen = set()
+        for (name, labels), value in sorted(gauges.items()):
+            if name not in seen:
+                full = header(name, "gauge")
+                seen.add(name)
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f"{self.prefix}_{name}{{{label_text}}} {value:.6g}" if labels
+                         else f"{self.prefix}_{name} {value:.6g}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(self.prometheus())
+        os.replace(tmp, path)
+
+    def serve(self, port=9464, host="127.0.0.1"):
+        """Serve /metrics on a daemon thread; returns the server (`.shutdown()` to stop)."""
+        telemetry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                telemetry.sample_process()
+                body = telemetry.prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="TelemetryServer", daemon=True).start()
+        return server
+
+
+class TelemetryWrapper(gym.Wrapper):
+    """
+    Feeds a `Telemetry` from a `OneCarEnv` without touching the training
+    loop: per step the seconds spent in the env (`step_seconds`), and in
+    total the seconds in env steps and outside them, in the policy, replay
+    buffer and learner; per episode its return and length. Every
+    `sample_every` steps of this env it sets the objects on its field and
+    its steps per second, labelled with `name`, the share of the wall
+    time spent in env steps since its last sample and the process memory.
+
+    The games of a vector env can share one `Telemetry`, with one wrapper
+    and `name` each: the counters and summaries add up all of them, and
+    the time outside env steps is only what passes between the end of one
+    game's step and the start of the next one's.
+    """
+    def __init__(self, env, telemetry=None, name="0", sample_every=1000):
+        super().__init__(env)
+        self.telemetry = telemetry or Telemetry()
+        self.name = name
+        self.sample_every = sample_every
+        self._return = 0.0
+        self._length = 0
+        self._steps = 0
+        t = self.telemetry
+        # This env's sampling window: its start and the shared time totals then
+        self._window_start = time.perf_counter()
+        self._window_env = t.counters.get("env_seconds_total", 0.0)
+        self._window_agent = t.counters.get("agent_seconds_total", 0.0)
+        t.describe("step_seconds", "Seconds per env step")
+        t.describe("env_seconds_total", "Seconds in env steps")
+        t.describe("agent_seconds_total", "Seconds between env steps")
+        t.describe("episode_return", "Return of finished episodes")
+        t.describe("episode_length", "Steps of finished episodes")
+        t.describe("steps_total", "Env steps")
+        t.describe("episodes_total", "Finished episodes")
+        t.describe("objects", "Non-car objects on the field")
+        t.describe("steps_per_second", "Env steps per second over the last sample_every steps")
+        t.describe("env_time_fraction", "Share of the wall time spent in env steps")
+
+    def reset(self, **kwargs):
+        self._return = 0.0
+        self._length = 0
+        return self.env.reset(**kwargs)
+
+    def step(self, action):
+        t = self.telemetry
+        start = time.perf_counter()
+        last = t.marks.get("step_end")   # of whichever env stepped last
+        if last is not None:
+            t.inc("agent_seconds_total", start - last)
+        result = self.env.step(action)
+        t.marks["step_end"] = end = time.perf_counter()
+        t.observe("step_seconds", end - start)
+        t.inc("env_seconds_total", end - start)
+        t.inc("steps_total")
+
+        self._return += result[1]
+        self._length += 1
+        if result[2] or result[3]:
+            t.observe("episode_return", self._return)
+            t.observe("episode_length", self._length)
+            t.inc("episodes_total")
+        self._steps += 1
+        if self._steps % self.sample_every == 0:
+            self._sample(end)
+        return result
+
+    def _sample(self, now):
+        t = self.telemetry
+        t.set("objects", self.env.unwrapped.object_count(), env=self.name)
+        t.set("steps_per_second", self.sample_every / (now - self._window_start), env=self.name)
+        env_seconds = t.counters["env_seconds_total"]
+        agent_seconds = t.counters.get("agent_seconds_total", 0.0)
+        in_env, outside = env_seconds - self._window_env, agent_seconds - self._window_agent
+        if in_env + outside > 0:
+            t.set("env_time_fraction", in_env / (in_env + outside))
+        self._window_start, self._window_env, self._window_agent = now, env_seconds, agent_seconds
+        t.sample_process()
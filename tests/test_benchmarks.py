@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+import benchmarks.__main__ as cli
+from benchmarks.env_bench import compare
+
+
+def _result(steps_per_sec, p50, p99):
+    return {"steps_per_sec": steps_per_sec, "step_us": {"p50": p50, "p99": p99},
+            "reset_us": {"p50": 100.0}, "step_alloc_kib": 0.0, "peak_rss_mib": None}
+
+
+BASELINE = {"a": _result(1000.0, 100.0, 200.0), "b": _result(1000.0, 100.0, 200.0),
+            "gone": _result(1000.0, 100.0, 200.0)}
+
+
+def test_compare_threshold():
+    results = {
+        # 5% fewer steps/s and 5% slower: within a 10% tolerance
+        "a": _result(950.0, 105.0, 210.0),
+        # 20% fewer steps/s and a 50% slower p99; a faster p50 is no regression
+        "b": _result(800.0, 50.0, 300.0),
+        "new": _result(1.0, 1.0, 1.0),
+        "skipped": {"skipped": "no numba"},
+    }
+    rows, regressed = compare(results, BASELINE, tolerance=0.1)
+    assert [(name, metric) for name, metric, *_ in rows] == [
+        (name, metric) for name in ("a", "b")
+        for metric in ("steps_per_sec", "step_us.p50", "step_us.p99")]
+    assert [(name, metric) for name, metric, *_ in regressed] == [
+        ("b", "steps_per_sec"), ("b", "step_us.p99")]
+    assert rows[3][4] == pytest.approx(-0.2)
+    # A looser tolerance lets the 20% drop through
+    assert [row[1] for row in compare(results, BASELINE, tolerance=0.3)[1]] == ["step_us.p99"]
+
+
+@pytest.mark.parametrize("steps_per_sec, status", [(1000.0, 0), (950.0, 0), (850.0, 1)])
+def test_cli_exit_status(tmp_path, monkeypatch, capsys, steps_per_sec, status):
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps({"results": BASELINE}))
+    monkeypatch.setattr(cli, "CONFIGS", {"a": {}, "b": {}})
+    monkeypatch.setattr(cli, "bench_config",
+                        lambda name, **kwargs: _result(steps_per_sec, 100.0, 200.0))
+    out = tmp_path / "out.json"
+    assert cli.main(["--in-process", "--baseline", str(baseline), "--out", str(out)]) == status
+    assert set(json.loads(out.read_text())["results"]) == {"a", "b"}
+    printed = capsys.readouterr().out
+    assert ("metric(s) regressed by more than 10%" in printed) == bool(status)
@@ -0,0 +1,101 @@
+import glob
+import os
+
+import numpy as np
+
+from checkpoint import REPLAY_ARRAYS, Checkpointer
+from frame_replay import FrameReplayBuffer
+from vector_env import OneCarVectorEnv
+
+N_ENVS = 2
+
+
+def _make():
+    envs = OneCarVectorEnv(N_ENVS, continuous=False, obs_type="gray_stack")
+    rb = FrameReplayBuffer(200, envs.single_observation_space, envs.single_action_space,
+                           n_envs=N_ENVS, seed=0)
+    return envs, rb
+
+
+def _play(envs, rb, rng, steps):
+    # The notebook's loop, as in test_frame_replay
+    obs = envs.observations.copy()
+    for _ in range(steps):
+        actions = rng.integers(3, size=N_ENVS)
+        next_obs, rewards, terminated, truncated, infos = envs.step(actions)
+        real_next_obs = next_obs.copy()
+        for i in np.flatnonzero(truncated):
+            real_next_obs[i] = infos["final_observation"][i]
+        rb.add(obs, real_next_obs, actions, rewards, terminated, infos)
+        obs = next_obs.copy()
+
+
+def _assert_same(a, b):
+    (envs_a, rb_a), (envs_b, rb_b) = a, b
+    for array in REPLAY_ARRAYS:
+        np.testing.assert_array_equal(getattr(rb_a, array), getattr(rb_b, array))
+    for k in ("frame_count", "_last", "_episode_start", "_ended"):
+        np.testing.assert_array_equal(getattr(rb_a, k), getattr(rb_b, k))
+    assert (rb_a.pos, rb_a.full, rb_a.adds) == (rb_b.pos, rb_b.full, rb_b.adds)
+    for k, v in envs_a.state_dict().items():
+        np.testing.assert_array_equal(v, envs_b.state_dict()[k])
+
+
+def _assert_same_future(a, b):
+    # The same samples, and the same games from here on
+    (envs_a, rb_a), (envs_b, rb_b) = a, b
+    for x, y in zip(rb_a.sample(256), rb_b.sample(256)):
+        np.testing.assert_array_equal(x, y)
+    actions = np.ones(N_ENVS, dtype=np.int64)
+    for _ in range(50):
+        for x, y in zip(envs_a.step(actions)[:4], envs_b.step(actions)[:4]):
+            np.testing.assert_array_equal(x, y)
+
+
+def _load(path):
+    restored = _make()
+    envs, rb = restored
+    ckpt = Checkpointer(path)
+    manifest = ckpt.load({"replay": rb}, {"envs": envs})
+    return restored, ckpt, manifest
+
+
+def test_incremental_saves_and_resume(tmp_path):
+    path = str(tmp_path / "ckpt")
+    rng = np.random.default_rng(0)
+    live = _make()
+    envs, rb = live
+    envs.reset(seed=0)
+    ckpt = Checkpointer(path)
+
+    _play(envs, rb, rng, 60)
+    ckpt.save(60, {"replay": rb}, {"envs": envs})   # everything
+    _play(envs, rb, rng, 250)   # both the rows and the frame rings wrap
+    assert rb.full and (rb.frame_count > rb.n_frames).all()
+    ckpt.save(310, {"replay": rb}, {"envs": envs}, extra={"epsilon": 0.5})   # the changes
+
+    # Only the small files of the last save are left
+    assert len(glob.glob(os.path.join(path, "envs-*.npz"))) == 1
+    assert len(glob.glob(os.path.join(path, "replay", "state-*.npz"))) == 1
+
+    resumed, resumed_ckpt, manifest = _load(path)
+    assert manifest["step"] == 310 and manifest["extra"] == {"epsilon": 0.5}
+    _assert_same(live, resumed)
+
+    # The resumed run writes into its copy-on-write maps, saves (which maps
+    # the files again), writes and saves once more
+    for steps, step in ((120, 430), (30, 460)):
+        _play(*live, np.random.default_rng(step), steps)
+        _play(*resumed, np.random.default_rng(step), steps)
+        written = {array: getattr(resumed[1], array) for array in REPLAY_ARRAYS}
+        resumed_ckpt.save(step, {"replay": resumed[1]}, {"envs": resumed[0]})
+        for array, data in written.items():
+            # A new map, without the private pages of the old one
+            remapped = getattr(resumed[1], array)
+            assert remapped is not data and remapped.mode == "c"
+    _assert_same(live, resumed)
+
+    again, _, manifest = _load(path)
+    assert manifest["step"] == 460
+    _assert_same(live, again)
+    _assert_same_future(live, again)
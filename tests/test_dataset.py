@@ -0,0 +1,44 @@
+import numpy as np
+
+from OneCar_v3 import OneCarEnv
+from dataset import OfflineDataset, generate
+
+
+def test_batches_skip_single_row_chunks(tmp_path):
+    # Every shard ends with a chunk of one row
+    generate(str(tmp_path), 2050, "random", shard_size=1025, chunk_size=512, workers=1,
+             obs_type="features", continuous=False)
+    data = OfflineDataset(str(tmp_path))
+    assert 1 in np.diff(data._starts)
+    batches = data.batches(64, chunks_in_memory=8, swap_every=1, seed=0)
+    for _ in range(50):
+        batch = next(batches)
+        assert batch.observations.shape[0] == 64
+
+
+def test_batches_use_final_observations(tmp_path):
+    generate(str(tmp_path), 1500, "random", shard_size=1500, chunk_size=256, workers=1,
+             compression=0, obs_type="features", continuous=False)
+    data = OfflineDataset(str(tmp_path))
+    rows = data.read(0, len(data))
+    assert rows["terminated"].sum() > 5
+
+    # Play the recorded actions again for every real (obs, next_obs) pair
+    env = OneCarEnv(obs_type="features", continuous=False)
+    env.reset(seed=0)
+    pairs = set()
+    for obs, action, terminated, truncated in zip(
+            rows["obs"], rows["action"], rows["terminated"], rows["truncated"]):
+        next_obs = env.step(int(action))[0]
+        pairs.add((obs.tobytes(), next_obs.tobytes()))
+        if terminated or truncated:
+            env.reset()
+
+    batches = data.batches(256, seed=0)
+    dones = 0
+    for _ in range(20):
+        batch = next(batches)
+        for obs, next_obs in zip(batch.observations, batch.next_observations):
+            assert (obs.tobytes(), next_obs.tobytes()) in pairs
+        dones += batch.dones.sum()
+    assert dones > 0
@@ -0,0 +1,96 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from env_server import STEP, AsyncEnvClient, EnvServer
+
+
+async def _play(address, keep_stepping):
+    # Step until the first episode ends; then step on (expecting errors) or reset
+    client = await AsyncEnvClient.connect(address)
+    await client.reset()
+    errors = 0
+    for _ in range(300):
+        try:
+            _, _, terminated, truncated, _ = await client.step(0)
+        except RuntimeError as e:
+            assert "RESET" in str(e)
+            errors += 1
+            continue
+        if (terminated or truncated) and not keep_stepping:
+            await client.reset()
+    await client.close()
+    return errors
+
+
+def _serving(tmp_path, play, **kwargs):
+    # Run `play(address)` against a server on a Unix socket
+    address = str(tmp_path / "env.sock")
+
+    async def main():
+        server = EnvServer(seed=0, obs_type="features", **kwargs)
+        serving = asyncio.ensure_future(server.serve(address))
+        while not (tmp_path / "env.sock").exists():
+            await asyncio.sleep(0.01)
+        try:
+            return await play(address)
+        finally:
+            serving.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await serving
+
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("continuous, bad", [
+    (False, np.int32([3]).tobytes()),
+    (False, np.int32([-1]).tobytes()),
+    (False, np.int32([0, 1]).tobytes()),
+    (True, np.float32([1.5]).tobytes()),
+    (True, np.float32([np.nan]).tobytes()),
+    (True, b"\0\0"),
+])
+def test_invalid_action_fails_only_that_client(tmp_path, continuous, bad):
+    async def play(address):
+        good, evil = [await AsyncEnvClient.connect(address) for _ in range(2)]
+        await good.reset()
+        await evil.reset()
+        results = await asyncio.gather(good.step(0), evil._request(STEP, bad),
+                                       return_exceptions=True)
+        assert not isinstance(results[0], Exception)
+        assert isinstance(results[1], RuntimeError)
+        await evil.step(0)   # the connection is still usable
+        for client in (good, evil):
+            await client.close()
+
+    _serving(tmp_path, play, num_envs=2, continuous=continuous)
+
+
+def test_new_client_gets_a_fresh_game(tmp_path):
+    async def play(address):
+        client = await AsyncEnvClient.connect(address)
+        await client.reset()
+        for _ in range(300):
+            _, _, terminated, truncated, _ = await client.step(0)
+            if terminated or truncated:
+                break
+        assert terminated or truncated
+        await client.close()   # leaves the finished game behind
+        await asyncio.sleep(0.05)
+
+        client = await AsyncEnvClient.connect(address)
+        _, _, terminated, truncated, _ = await client.step(0)   # no RESET needed
+        assert not (terminated or truncated)
+        await client.close()
+
+    _serving(tmp_path, play, num_envs=1, continuous=False)
+
+
+def test_step_on_finished_game_fails_only_that_client(tmp_path):
+    async def play(address):
+        return await asyncio.gather(_play(address, True), _play(address, False))
+
+    stubborn, resetting = _serving(tmp_path, play, num_envs=2, continuous=False)
+    assert stubborn > 0
+    assert resetting == 0
@@ -0,0 +1,27 @@
+import numpy as np
+
+from evaluate import evaluate
+
+
+def test_evaluate_features():
+    # More games than episodes per game: most games drop out early
+    result = evaluate(lambda obs: np.zeros(len(obs), dtype=np.int64), episodes=10,
+                      num_envs=4, seed=0, obs_type="features")
+    assert result["episodes"] == 10
+    assert (result["lengths"] > 0).all()
+
+
+def test_evaluate_is_reproducible_with_exploration():
+    def run(seed):
+        return evaluate(lambda obs: np.zeros(len(obs), dtype=np.int64), episodes=8,
+                        num_envs=4, epsilon=0.5, seed=seed, obs_type="features")["returns"]
+
+    assert np.array_equal(run(0), run(0))
+    assert not np.array_equal(run(0), run(1))
+
+
+def test_evaluate_no_episodes():
+    result = evaluate(lambda obs: np.zeros(len(obs), dtype=np.int64), episodes=0,
+                      obs_type="features")
+    assert result["episodes"] == 0
+    assert np.isnan(result["return"]["mean"])
@@ -0,0 +1,36 @@
+import numpy as np
+
+from frame_replay import FrameReplayBuffer
+from vector_env import OneCarVectorEnv
+
+
+def test_stacks_across_autoresets():
+    # The notebook's loop: the autoreset observation is the next_obs of a
+    # terminated episode, the final one that of a truncated one
+    envs = OneCarVectorEnv(4, continuous=False, obs_type="gray_stack")
+    rb = FrameReplayBuffer(4000, envs.single_observation_space, envs.single_action_space,
+                           n_envs=4, seed=0)
+    rng = np.random.default_rng(0)
+    expected = set()   # (obs, next_obs) bytes as FrameStack gave them
+    obs, _ = envs.reset(seed=0)
+    ended = 0
+    for _ in range(300):
+        actions = rng.integers(3, size=4)
+        next_obs, rewards, terminated, truncated, infos = envs.step(actions)
+        real_next_obs = next_obs.copy()
+        for i in np.flatnonzero(truncated):
+            real_next_obs[i] = infos["final_observation"][i]
+        rb.add(obs, real_next_obs, actions, rewards, terminated, infos)
+        for i in range(4):
+            final = terminated[i] or truncated[i]
+            true_next = infos["final_observation"][i] if final else next_obs[i]
+            expected.add((obs[i].tobytes(), true_next.tobytes()))
+        ended += (terminated | truncated).sum()
+        obs = next_obs.copy()
+    assert ended > 10
+
+    batch = rb.sample(3000)
+    for o, n in zip(batch.observations, batch.next_observations):
+        assert (o.tobytes(), n.tobytes()) in expected
+    assert len({(o.tobytes(), n.tobytes())
+                for o, n in zip(batch.observations, batch.next_observations)}) > 500
@@ -0,0 +1,62 @@
+import importlib
+import sys
+
+import numpy as np
+import pytest
+
+import numba_engine
+from OneCar_v3 import OneCarEnv
+
+
+def _trajectory(engine, seed, n_cars, continuous, obs_type, steps=150):
+    env = OneCarEnv(continuous=continuous, n_cars=n_cars, obs_type=obs_type, engine=engine)
+    rng = np.random.default_rng(seed)
+    obs, _ = env.reset(seed=seed)
+    observations, rewards, dones = [obs.copy()], [], []
+    for t in range(steps):
+        if continuous:
+            action = rng.uniform(-1, 1, size=n_cars).astype(np.float32)
+        else:
+            action = rng.integers(3, size=n_cars) if n_cars > 1 else int(rng.integers(3))
+        obs, reward, terminated, truncated, _ = env.step(action)
+        observations.append(obs.copy())
+        rewards.append(reward)
+        dones.append((terminated, truncated))
+        if terminated or truncated:
+            obs, _ = env.reset(seed=seed + t + 1)
+            observations.append(obs.copy())
+    env.close()
+    return np.array(observations), rewards, dones
+
+
+def _check_same(seed, n_cars, continuous, obs_type):
+    python = _trajectory("python", seed, n_cars, continuous, obs_type)
+    numba = _trajectory("numba", seed, n_cars, continuous, obs_type)
+    np.testing.assert_array_equal(numba[0], python[0])
+    assert numba[1] == python[1]
+    assert numba[2] == python[2]
+
+
+CASES = [(seed, n_cars, continuous, obs_type)
+         for seed in (0, 1, 2) for n_cars in (1, 2, 4) for continuous in (False, True)
+         for obs_type in ("pixels", "features", "gray_stack")]
+
+
+@pytest.mark.parametrize("seed, n_cars, continuous, obs_type", CASES)
+def test_same_as_python(seed, n_cars, continuous, obs_type):
+    # Compiled when Numba is installed, the plain Python kernels otherwise
+    _check_same(seed, n_cars, continuous, obs_type)
+
+
+@pytest.mark.parametrize("obs_type", ["pixels", "features", "gray_stack"])
+def test_same_as_python_without_numba(monkeypatch, obs_type):
+    monkeypatch.setitem(sys.modules, "numba", None)   # import numba raises ImportError
+    try:
+        importlib.reload(numba_engine)
+        assert not numba_engine.HAVE_NUMBA
+        for n_cars in (1, 2):
+            _check_same(0, n_cars, False, obs_type)
+            _check_same(1, n_cars, True, obs_type)
+    finally:
+        monkeypatch.undo()
+        importlib.reload(numba_engine)
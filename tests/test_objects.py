@@ -0,0 +1,28 @@
+import numpy as np
+
+import OneCar_v3
+import vector_env
+from OneCar_v3 import OneCarEnv
+from vector_env import OneCarVectorEnv
+
+
+def test_short_spawn_gap_fits_the_pool(monkeypatch):
+    monkeypatch.setattr(OneCar_v3, "SPAWN_GAPS", [25, 40])
+    monkeypatch.setattr(vector_env, "SPAWN_GAPS", [25, 40])
+    rng = np.random.default_rng(0)
+    for n_cars in (1, 2):
+        env = OneCarEnv(obs_type="features", continuous=False, n_cars=n_cars)
+        env.reset(seed=0)
+        most = 0
+        for _ in range(1000):
+            action = rng.integers(3, size=n_cars) if n_cars > 1 else int(rng.integers(3))
+            _, _, terminated, truncated, _ = env.step(action)
+            most = max(most, env.object_count())
+            if terminated or truncated:
+                env.reset()
+        assert most > 8 * n_cars   # more than the pool used to hold
+
+        envs = OneCarVectorEnv(8, continuous=False, obs_type="features", n_cars=n_cars)
+        envs.reset(seed=0)
+        for _ in range(1000):
+            envs.step(rng.integers(3, size=envs.action_space.shape))
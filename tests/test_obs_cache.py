@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from OneCar_v3 import OneCarEnv
+from obs_cache import ObsCache
+
+
+@pytest.mark.parametrize("renderer", ["pygame", "numpy"])
+def test_cached_frames_are_the_drawn_ones(renderer):
+    envs = [OneCarEnv(continuous=False, renderer=renderer, obs_cache=cache)
+            for cache in (0, 64)]
+    cached = envs[1]
+    rng = np.random.default_rng(0)
+    for env in envs:
+        env.reset(seed=0)
+    for _ in range(500):
+        action = int(rng.integers(3))
+        obs, reward, terminated, truncated, _ = envs[0].step(action)
+        hit_obs, *rest = cached.step(action)
+        np.testing.assert_array_equal(hit_obs, obs)
+        assert rest[:3] == [reward, terminated, truncated]
+        assert not hit_obs.flags.writeable
+        if terminated or truncated:
+            for env in envs:
+                env.reset()
+    stats = cached.obs_cache.stats()
+    assert stats["hits"] > 0 and stats["size"] == 64
+
+
+def test_lru_eviction_and_stats():
+    cache = ObsCache(2)
+    a, b, c = (np.full(3, i) for i in range(3))
+    cache.put("a", a)
+    cache.put("b", b)
+    assert not a.flags.writeable
+    assert cache.get("a") is a          # "b" is now the least recently used
+    cache.put("c", c)
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") is a and cache.get("c") is c
+    assert cache.stats() == {"size": 2, "capacity": 2, "hits": 3, "misses": 1,
+                             "hit_rate": 0.75}
+    cache.clear()
+    assert len(cache) == 0 and cache.stats()["hit_rate"] == 0.0
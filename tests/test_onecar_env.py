@@ -0,0 +1,173 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import OneCar_v3
+from OneCar_v3 import OneCarEnv
+
+
+def _skipped_steps(env, unit, k, action):
+    # frame_skip=k against k steps of the unit env, which stop with the episode
+    obs, reward, terminated, truncated, _ = env.step(action)
+    total, ticks = 0, 0
+    for _ in range(k):
+        unit_obs, unit_reward, unit_terminated, unit_truncated, _ = unit.step(action)
+        total += unit_reward
+        ticks += 1
+        if unit_terminated or unit_truncated:
+            break
+    np.testing.assert_array_equal(obs, unit_obs)
+    assert (reward, terminated, truncated) == (total, unit_terminated, unit_truncated)
+    return terminated or truncated, ticks
+
+
+@pytest.mark.parametrize("obs_type", ["features", "pixels"])
+@pytest.mark.parametrize("k", [2, 4, 10])
+def test_frame_skip_is_k_steps(k, obs_type):
+    env = OneCarEnv(continuous=False, obs_type=obs_type, frame_skip=k)
+    unit = OneCarEnv(continuous=False, obs_type=obs_type)
+    rng = np.random.default_rng(k)
+    obs, _ = env.reset(seed=k)
+    np.testing.assert_array_equal(obs, unit.reset(seed=k)[0])
+    episodes, mid_skip = 0, 0
+    while episodes < 8:
+        done, ticks = _skipped_steps(env, unit, k, int(rng.integers(3)))
+        if done:
+            episodes += 1
+            mid_skip += ticks < k
+            np.testing.assert_array_equal(env.reset()[0], unit.reset()[0])
+    # Some episodes ended before the k-th tick of their last step
+    assert mid_skip > 0
+
+
+def _trajectory(seed, n_cars, steps=600):
+    env = OneCarEnv(continuous=False, obs_type="features", n_cars=n_cars)
+    rng = np.random.default_rng(seed)
+    env.reset(seed=seed)
+    out = []
+    for _ in range(steps):
+        action = rng.integers(3, size=n_cars)
+        obs, reward, terminated, truncated, _ = env.step(action if n_cars > 1 else int(action[0]))
+        out.append((obs.tobytes(), reward, terminated, truncated))
+        if terminated or truncated:
+            env.reset()
+    return out
+
+
+@pytest.mark.parametrize("n_cars", [1, 2])
+def test_safe_y_skip_changes_nothing(monkeypatch, n_cars):
+    # Ticks whose objects are all above SAFE_Y skip the kill, collision and
+    # score checks; checking every tick must give the same games
+    skipping = _trajectory(n_cars, n_cars)
+    monkeypatch.setattr(OneCar_v3, "SAFE_Y", -10**9)
+    assert _trajectory(n_cars, n_cars) == skipping
+
+
+@pytest.mark.parametrize("n_cars", [1, 2, 3, 4])
+def test_incremental_drawing_matches_full_redraw(n_cars):
+    # The same game on a canvas drawn incrementally and on one drawn from
+    # scratch for every frame, at full resolution and as state_pixels
+    envs = [OneCarEnv(render_mode="rgb_array", continuous=False, n_cars=n_cars)
+            for _ in range(2)]
+    full = envs[1]
+    rng = np.random.default_rng(n_cars)
+    for env in envs:
+        env.reset(seed=n_cars)
+    resets = 0
+    for t in range(400):
+        action = rng.integers(3, size=n_cars)
+        action = action if n_cars > 1 else int(action[0])
+        incremental = envs[0].step(action)
+        full.surf = None
+        np.testing.assert_array_equal(full.step(action)[0], incremental[0])
+        if t % 5 == 0:
+            full.surf = None
+            np.testing.assert_array_equal(full.render(), envs[0].render())
+        if incremental[2] or incremental[3]:
+            resets += 1
+            for env in envs:
+                env.reset()
+    assert resets > 2
+
+
+def _run(code):
+    # Output of `code` in a fresh interpreter, so that the pygame modules
+    # (and the display) of this one are left alone
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True,
+                            text=True, check=True)
+    return result.stdout.strip()
+
+
+def test_features_never_import_pygame():
+    assert _run(
+        "import sys\n"
+        "from OneCar_v3 import OneCarEnv\n"
+        "env = OneCarEnv(obs_type='features', continuous=False)\n"
+        "env.reset(seed=0)\n"
+        "for _ in range(100):\n"
+        "    if env.step(0)[2]:\n"
+        "        env.reset()\n"
+        "env.close()\n"
+        "print('pygame' in sys.modules)\n") == "False"
+
+
+@pytest.mark.parametrize("render_mode", [None, "rgb_array", "state_pixels"])
+def test_no_display_unless_human(monkeypatch, render_mode):
+    import pygame
+
+    def no_display(*args, **kwargs):
+        raise AssertionError("a display was opened")
+
+    monkeypatch.setattr(pygame.display, "init", no_display)
+    monkeypatch.setattr(pygame.display, "set_mode", no_display)
+    env = OneCarEnv(render_mode=render_mode, continuous=False)
+    for seed in range(3):
+        env.reset(seed=seed)
+        for _ in range(5):
+            env.step(0)
+            if render_mode is not None:
+                env.render()
+    assert env.screen is None
+
+
+def test_human_mode_opens_the_display_once():
+    assert _run(
+        "import os\n"
+        "os.environ['SDL_VIDEODRIVER'] = 'dummy'\n"
+        "import pygame\n"
+        "calls = []\n"
+        "set_mode = pygame.display.set_mode\n"
+        "pygame.display.set_mode = lambda *a, **k: calls.append(a) or set_mode(*a, **k)\n"
+        "from OneCar_v3 import OneCarEnv\n"
+        "env = OneCarEnv(render_mode='human', continuous=False)\n"
+        "env.metadata = dict(env.metadata, render_fps=0)\n"
+        "for seed in range(4):\n"
+        "    env.reset(seed=seed)\n"
+        "    env.step(0)\n"
+        "env.close()\n"
+        "print(len(calls))\n") == "1"
+
+
+@pytest.mark.parametrize("engine", ["python", "numba"])
+@pytest.mark.parametrize("obs_type", ["pixels", "gray_stack"])
+def test_features_of_any_env(engine, obs_type):
+    # features() of an image env is the observation of a features env
+    env = OneCarEnv(continuous=False, n_cars=2, obs_type=obs_type, engine=engine)
+    twin = OneCarEnv(continuous=False, n_cars=2, obs_type="features", engine=engine)
+    rng = np.random.default_rng(0)
+    env.reset(seed=0)
+    obs, _ = twin.reset(seed=0)
+    for _ in range(100):
+        features = env.features()
+        assert features.shape == twin.observation_space.shape
+        np.testing.assert_array_equal(features, obs)
+        action = rng.integers(3, size=2)
+        env.step(action)
+        obs, _, terminated, truncated, _ = twin.step(action)
+        if terminated or truncated:
+            env.reset()
+            obs, _ = twin.reset()
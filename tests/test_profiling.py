@@ -0,0 +1,35 @@
+import pytest
+
+from OneCar_v3 import OneCarEnv
+
+TICK_STAGES = ("cars", "spawn", "move", "kill", "hit_obstacle", "missed_circles", "score")
+
+
+@pytest.mark.parametrize("obs_type", ["pixels", "features"])
+def test_stage_times_count_every_tick(obs_type):
+    env = OneCarEnv(continuous=False, obs_type=obs_type, profile=True)
+    env.reset(seed=0)
+    env.timer.reset()
+    steps = 0
+    for _ in range(60):
+        _, _, terminated, truncated, info = env.step(1)
+        steps += 1
+        assert set(TICK_STAGES) <= set(info["stage_times"])
+        if terminated or truncated:
+            break
+
+    summary = env.stage_times()
+    # The checks skipped while the objects are far away are zero-time calls
+    for stage in TICK_STAGES:
+        assert summary[stage]["calls"] == steps
+    assert summary["validate"]["calls"] == steps
+    assert sum(s["share"] for s in summary.values()) == pytest.approx(1)
+    assert list(summary) == sorted(summary, key=lambda stage: -summary[stage]["total_s"])
+
+
+def test_stage_times_needs_profile():
+    env = OneCarEnv(continuous=False, obs_type="features")
+    env.reset(seed=0)
+    assert env.step(0)[4] == {}
+    with pytest.raises(AssertionError):
+        env.stage_times()
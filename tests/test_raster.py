@@ -0,0 +1,86 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from OneCar_v3 import OneCarEnv
+
+
+@pytest.mark.parametrize("n_cars, obs_type", [
+    (1, "pixels"), (2, "pixels"), (4, "pixels"), (1, "gray_stack"), (2, "gray_stack")])
+def test_close_to_pygame(n_cars, obs_type):
+    # The same game drawn by pygame and by the Rasterizer, whose rounding
+    # differs from smoothscale's by a level or two
+    envs = [OneCarEnv(continuous=False, n_cars=n_cars, obs_type=obs_type, renderer=renderer)
+            for renderer in ("pygame", "numpy")]
+    rng = np.random.default_rng(n_cars)
+    observations = [env.reset(seed=n_cars)[0] for env in envs]
+    for _ in range(300):
+        diff = np.abs(observations[0].astype(int) - observations[1])
+        assert diff.max() <= 2
+        action = rng.integers(3, size=n_cars)
+        action = action if n_cars > 1 else int(action[0])
+        results = [env.step(action) for env in envs]
+        assert results[0][1:4] == results[1][1:4]
+        observations = [result[0] for result in results]
+        if results[0][2] or results[0][3]:
+            observations = [env.reset()[0] for env in envs]
+
+
+def _same_games(envs, steps=150, seed=0):
+    # Step the envs with the same actions; yields their observations
+    rng = np.random.default_rng(seed)
+    observations = [env.reset(seed=seed)[0] for env in envs]
+    for _ in range(steps):
+        yield observations
+        action = int(rng.integers(3))
+        results = [env.step(action) for env in envs]
+        observations = [result[0] for result in results]
+        if results[0][2] or results[0][3]:
+            observations = [env.reset()[0] for env in envs]
+
+
+@pytest.mark.parametrize("renderer", ["pygame", "numpy"])
+def test_channels_first(renderer):
+    env = OneCarEnv(continuous=False, renderer=renderer, channels_first=True)
+    last = OneCarEnv(continuous=False, renderer=renderer)
+    assert env.observation_space.shape == (3,) + last.observation_space.shape[:2]
+    for obs, obs_last in _same_games([env, last]):
+        assert obs.shape == env.observation_space.shape
+        assert env.observation_space.contains(obs)
+        np.testing.assert_array_equal(obs, obs_last.transpose(2, 0, 1))
+
+
+@pytest.mark.parametrize("renderer, obs_type", [
+    ("pygame", "pixels"), ("pygame", "gray_stack"), ("numpy", "pixels"), ("numpy", "gray_stack")])
+def test_obs_out_is_the_observation(renderer, obs_type):
+    # The observation is written into obs_out, and is the one drawn without it
+    env = OneCarEnv(continuous=False, renderer=renderer, obs_type=obs_type, obs_out=True)
+    fresh = OneCarEnv(continuous=False, renderer=renderer, obs_type=obs_type)
+    for obs, obs_fresh in _same_games([env, fresh]):
+        assert obs is env.obs_out
+        np.testing.assert_array_equal(obs, obs_fresh)
+
+
+@pytest.mark.parametrize("obs_type", ["pixels", "gray_stack"])
+def test_obs_out_draws_in_place(obs_type):
+    env = OneCarEnv(continuous=False, renderer="numpy", obs_type=obs_type, obs_out=True)
+    obs, _ = env.reset(seed=0)
+    assert obs is env.obs_out
+    for _ in range(20):
+        env.step(0)
+
+    tracemalloc.start()
+    try:
+        for _ in range(50):
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            obs, _, terminated, truncated, _ = env.step(0)
+            peak = tracemalloc.get_traced_memory()[1] - current
+            assert obs is env.obs_out
+            # The object patches, but no copy of the observation
+            assert peak < obs.nbytes
+            if terminated or truncated:
+                break
+    finally:
+        tracemalloc.stop()
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from OneCar_v3 import OneCarEnv
+from replay import EpisodeLog, EpisodeWriter, RecordEpisodeLog, load_logs, replay, save_logs
+
+
+def play(env, action, rng, episodes):
+    # Like OneCar_v3's __main__: one action array, changed in place
+    env.reset()
+    observations, rewards = [], []
+    while len(env.logs) < episodes:
+        action[:] = rng.choice([-1.0, 0.0, 1.0], size=action.shape)
+        obs, reward, terminated, truncated, _ = env.step(action)
+        observations.append(obs.copy())
+        rewards.append(reward)
+        if terminated or truncated:
+            env.reset()
+    return observations, rewards
+
+
+def test_replay_with_action_mutated_in_place():
+    env = RecordEpisodeLog(OneCarEnv(obs_type="features"), seed=0)
+    rng = np.random.default_rng(1)
+    observations, rewards = play(env, np.zeros(1), rng, episodes=3)
+
+    assert len({tuple(np.ravel(log.actions)) for log in env.logs}) > 1
+    replayed_obs, replayed_rewards = [], []
+    for log in env.logs:
+        assert len(np.unique(log.actions)) > 1
+        steps = list(replay(OneCarEnv(obs_type="features"), log))[1:]
+        assert len(steps) == len(log.actions)
+        replayed_obs += [obs for obs, _ in steps]
+        replayed_rewards += [reward for _, reward in steps]
+    np.testing.assert_array_equal(replayed_obs, observations)
+    assert replayed_rewards == rewards
+
+
+def test_writer_thread_error_is_raised(tmp_path):
+    writer = EpisodeWriter(str(tmp_path / "episodes.bin"), {"continuous": False})
+    writer.write(EpisodeLog(0, [0, 1, 2], 1.0))
+    writer.write(EpisodeLog("not a seed", [0], 0.0))   # EPISODE.pack fails
+    writer._thread.join(timeout=5)
+    assert writer.file.closed
+    with pytest.raises(RuntimeError, match="EpisodeWriter"):
+        writer.write(EpisodeLog(1, [0], 0.0))
+    with pytest.raises(RuntimeError, match="EpisodeWriter"):
+        writer.close()
+
+
+def test_save_and_load_logs(tmp_path):
+    path = str(tmp_path / "logs.npz")
+    save_logs(path, [])
+    assert load_logs(path) == []
+
+    logs = [EpisodeLog(3, np.array([0, 2, 1]), 1.5), EpisodeLog(4, np.array([1]), 0.0)]
+    save_logs(path, logs)
+    loaded = load_logs(path)
+    assert [(log.seed, log.actions.tolist(), log.episode_return) for log in loaded] \
+        == [(3, [0, 2, 1], 1.5), (4, [1], 0.0)]
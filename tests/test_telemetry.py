@@ -0,0 +1,81 @@
+import threading
+import time
+
+import numpy as np
+
+from OneCar_v3 import OneCarEnv
+from telemetry import Telemetry, TelemetryWrapper
+from trainer import _record_chunk
+
+
+def test_shared_telemetry_samples_every_env():
+    telemetry = Telemetry()
+    envs = [TelemetryWrapper(OneCarEnv(obs_type="features", continuous=False), telemetry,
+                             name=str(i), sample_every=50) for i in range(4)]
+    for i, env in enumerate(envs):
+        env.reset(seed=i)
+    start = time.perf_counter()
+    for _ in range(100):
+        for env in envs:
+            _, _, terminated, truncated, _ = env.step(0)
+            if terminated or truncated:
+                env.reset()
+        time.sleep(0.002)   # the policy
+    seconds = time.perf_counter() - start
+
+    gauges = telemetry.gauges
+    assert {labels for name, labels in gauges if name == "steps_per_second"} == {
+        (("env", str(i)),) for i in range(4)}
+    for i in range(4):
+        # one env's rate, not the total of the four
+        assert gauges["steps_per_second", (("env", str(i)),)] < 1.5 * 100 / seconds
+    assert 0 < gauges["env_time_fraction", ()] < 0.5
+    assert telemetry.counters["steps_total"] == 400
+    text = telemetry.prometheus()
+    assert 'onecar_objects{env="3"}' in text and 'onecar_objects{env="0"}' in text
+
+
+def test_prometheus_while_metrics_are_added():
+    telemetry = Telemetry(window=10)
+    stop = threading.Event()
+
+    def train():
+        # New names keep being added for a while, from a fixed set
+        i = 0
+        while not stop.is_set():
+            telemetry.inc(f"c{i % 50}_total")
+            telemetry.observe(f"s{i % 50}", i)
+            telemetry.set("g", i, worker=i % 50)
+            i += 1
+
+    thread = threading.Thread(target=train)
+    thread.start()
+    try:
+        for _ in range(200):
+            text = telemetry.prometheus()
+    finally:
+        stop.set()
+        thread.join()
+    for line in text.splitlines():
+        if not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            assert name.startswith("onecar_")
+            float(value)
+
+
+def test_trainer_and_wrapper_count_apart():
+    telemetry = Telemetry()
+    env = TelemetryWrapper(OneCarEnv(obs_type="features", continuous=False), telemetry)
+    env.reset(seed=0)
+    for _ in range(10):
+        env.step(0)
+    chunk = {"actions": np.zeros((4, 8)), "env_seconds": 1.0, "policy_seconds": 0.5,
+             "episodes": [(2.0, 30), (1.0, 20)]}
+    _record_chunk(telemetry, 0, chunk, 0.01)
+
+    counters = telemetry.counters
+    assert counters["steps_total"] == 10 and counters["actor_env_steps_total"] == 32
+    assert counters["actor_episodes_total"] == 2
+    assert counters.get("episodes_total", 0) == 0
+    assert counters["env_seconds_total"] < 1.0 == counters["actor_env_seconds_total"]
+    assert telemetry.rings["actor_episode_length"].count == 2
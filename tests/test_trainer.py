@@ -0,0 +1,154 @@
+import multiprocessing as mp
+import queue
+
+import numpy as np
+import pytest
+
+from trainer import TrainArgs, _add_chunk, _learn
+
+
+class FakeBuffer:
+    # Records the transitions added to it
+    def __init__(self):
+        self.added = []
+
+    def add(self, obs, next_obs, action, reward, done, infos=None):
+        self.added.append((obs.copy(), next_obs.copy(), done.copy(), infos))
+
+
+class DeadProcess:
+    name = "OneCarActor-0"
+
+    def is_alive(self):
+        return False
+
+
+def _chunk(T=4, N=3, finals=(), seed=0):
+    rng = np.random.default_rng(seed)
+    return {
+        "obs": rng.integers(255, size=(T + 1, N, 4, 8, 8), dtype=np.uint8),
+        "actions": rng.integers(3, size=(T, N)),
+        "rewards": np.ones((T, N), np.float32),
+        "terminated": np.zeros((T, N), np.bool_),
+        "finals": [(t, i, np.full((4, 8, 8), 7, np.uint8)) for t, i in finals],
+        "episodes": [(1.0, 10)] * len(finals),
+        "env_seconds": 0.0,
+        "policy_seconds": 0.0,
+    }
+
+
+def test_add_chunk_final_observation_only_for_finished_envs():
+    chunk = _chunk(finals=[(1, 2), (3, 0)])
+    obs = chunk["obs"].copy()
+    buffer = FakeBuffer()
+    _add_chunk(buffer, chunk)
+
+    assert len(buffer.added) == 4
+    for t, (o, next_obs, _, infos) in enumerate(buffer.added):
+        assert np.array_equal(o, obs[t])
+        for i in range(3):
+            final = (t, i) in [(1, 2), (3, 0)]
+            expected = 7 if final else obs[t + 1, i]
+            assert np.array_equal(next_obs[i], np.broadcast_to(expected, next_obs[i].shape))
+            assert final == (infos is not None and infos["_final_observation"][i])
+    assert np.array_equal(chunk["obs"], obs)   # the chunk itself is untouched
+
+
+def test_learn_keeps_the_replay_ratio():
+    args = TrainArgs(total_timesteps=600, learning_starts=120, replay_ratio=0.25,
+                     target_network_sync=50, weight_sync=10)
+    chunks = queue.Queue()
+    for k in range(50):   # 12 env steps each
+        chunks.put(("chunk", k % 2, _chunk(seed=k)))
+    stats = {"episodes": [], "env_steps": 0, "updates": 0}
+    calls = {"update": 0, "publish": 0, "sync_target": 0}
+
+    def update(i):
+        # Never ahead of the ratio
+        assert i < args.replay_ratio * (stats["env_steps"] - args.learning_starts)
+        assert i == calls["update"]
+        calls["update"] += 1
+
+    def count(name):
+        return lambda: calls.__setitem__(name, calls[name] + 1)
+
+    _learn(args, chunks, [FakeBuffer(), FakeBuffer()], update, count("sync_target"),
+           count("publish"), [], stats)
+    assert stats["env_steps"] == 600
+    due = args.replay_ratio * (600 - args.learning_starts)
+    # Up to one chunk behind
+    assert due - args.replay_ratio * 12 <= stats["updates"] == calls["update"] <= due
+    assert calls["publish"] == stats["updates"] // args.weight_sync
+    # Once past learning_starts (at 132 steps), then every 50 steps up to 600
+    assert calls["sync_target"] == 1 + 600 // 50 - 132 // 50
+
+
+def test_learn_reraises_actor_errors():
+    chunks = queue.Queue()
+    chunks.put(("chunk", 0, _chunk()))
+    chunks.put(("error", 1, "Traceback (most recent call last):\nValueError: boom"))
+    stats = {"episodes": [], "env_steps": 0, "updates": 0}
+    with pytest.raises(RuntimeError, match="Actor 1 raised(.|\n)*boom"):
+        _learn(TrainArgs(total_timesteps=1000), chunks, [FakeBuffer(), FakeBuffer()],
+               None, None, None, [], stats)
+    assert stats["env_steps"] == 12
+
+
+def test_learn_notices_dead_actors():
+    stats = {"episodes": [], "env_steps": 0, "updates": 0}
+    with pytest.raises(RuntimeError, match="OneCarActor-0 exited"):
+        _learn(TrainArgs(total_timesteps=1000), queue.Queue(), [FakeBuffer()],
+               None, None, None, [DeadProcess()], stats)
+
+
+def _tiny_q():
+    torch = pytest.importorskip("torch")
+    if "fork" not in mp.get_all_start_methods():
+        pytest.skip("needs fork: the model class is local")
+
+    class TinyQ(torch.nn.Module):
+        def __init__(self, envs):
+            super().__init__()
+            size = int(np.prod(envs.single_observation_space.shape))
+            self.net = torch.nn.Linear(size, envs.single_action_space.n)
+
+        def forward(self, x):
+            return self.net(x.flatten(1).float() / 255)
+
+    return TinyQ
+
+
+def _tiny_args(**kwargs):
+    return TrainArgs(learning_starts=256, buffer_size=1024, batch_size=8, n_actors=1,
+                     envs_per_actor=4, chunk_steps=8, weight_sync=10,
+                     target_network_sync=128, **kwargs)
+
+
+def test_train_short_run():
+    TinyQ = _tiny_q()
+    from trainer import train
+
+    args = _tiny_args(total_timesteps=1024)
+    _, stats = train(TinyQ, args, context="fork")
+    assert stats["env_steps"] >= 1024
+    assert stats["updates"] > 0
+    assert stats["replay_ratio"] <= args.replay_ratio
+
+
+def test_train_resumes_from_checkpoint(tmp_path):
+    TinyQ = _tiny_q()
+    from checkpoint import Checkpointer
+    from trainer import train
+
+    path = str(tmp_path / "run")
+    _, first = train(TinyQ, _tiny_args(total_timesteps=1024, checkpoint_dir=path),
+                     context="fork")
+    saved = Checkpointer(path).load()
+    assert saved["step"] == first["env_steps"]
+    assert saved["extra"]["updates"] == first["updates"]
+
+    _, second = train(TinyQ, _tiny_args(total_timesteps=2048, checkpoint_dir=path),
+                      context="fork")
+    assert second["env_steps"] >= 2048 and second["updates"] > first["updates"]
+    # Counted from the resume, not from zero
+    assert second["steps_per_sec"] * second["seconds"] < second["env_steps"]
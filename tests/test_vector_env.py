@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from OneCar_v3 import OneCarEnv
+from vector_env import OneCarVectorEnv
+
+
+CASES = [(seed, n_cars, continuous, obs_type)
+         for seed in (0, 1, 2) for n_cars in (1, 2) for continuous in (False, True)
+         for obs_type in ("features", "pixels", "gray_stack")]
+
+
+def _actions(rng, n_cars, continuous):
+    # An action of OneCarEnv and the same one as a batch of one
+    if continuous:
+        action = rng.uniform(-1, 1, size=n_cars).astype(np.float32)
+        return action, action[None]
+    action = rng.integers(3, size=n_cars)
+    return (action if n_cars > 1 else int(action[0])), action[None]
+
+
+@pytest.mark.parametrize("seed, n_cars, continuous, obs_type", CASES)
+def test_same_games_as_onecar_env(seed, n_cars, continuous, obs_type):
+    # With one game and the same seed both draw the same random numbers,
+    # across the vector env's autoresets too
+    env = OneCarEnv(continuous=continuous, n_cars=n_cars, obs_type=obs_type, renderer="numpy")
+    envs = OneCarVectorEnv(1, continuous=continuous, n_cars=n_cars, obs_type=obs_type)
+    rng = np.random.default_rng(seed)
+    obs, _ = env.reset(seed=seed)
+    vec_obs, _ = envs.reset(seed=seed)
+    np.testing.assert_array_equal(vec_obs[0], obs)
+
+    episodes = 0
+    for _ in range(3000):
+        action, batch = _actions(rng, n_cars, continuous)
+        obs, reward, terminated, truncated, _ = env.step(action)
+        vec_obs, rewards, terminateds, truncateds, infos = envs.step(batch)
+        assert (rewards[0], terminateds[0], truncateds[0]) == (reward, terminated, truncated)
+        if terminated or truncated:
+            np.testing.assert_array_equal(infos["final_observation"][0], obs)
+            obs, _ = env.reset()
+            episodes += 1
+            if episodes == 5:
+                break
+        np.testing.assert_array_equal(vec_obs[0], obs)
+    assert episodes == 5
+
+
+def test_numpy_integer_seed():
+    envs = OneCarVectorEnv(4, continuous=False, obs_type="features")
+    first, _ = envs.reset(seed=7)
+    second, _ = envs.reset(seed=np.int64(7))
+    np.testing.assert_array_equal(first, second)
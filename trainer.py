@@ -0,0 +1,365 @@
+import multiprocessing as mp
+import os
+import queue
+import time
+import traceback
+from dataclasses import dataclass
+
+import numpy as np
+
+from frame_replay import FrameReplayBuffer, Samples
+
+
+@dataclass
+class TrainArgs:
+    """The notebook's DQN arguments, plus those of the actors."""
+    seed: int = 42867294
+    total_timesteps: int = 200000
+    learning_rate: float = 1e-4
+    buffer_size: int = 40000
+    gamma: float = 0.99
+    tau: float = 1.0
+    target_network_sync: int = 1000   # env steps between target network syncs
+    batch_size: int = 32
+    start_eps: float = 1.0
+    end_eps: float = 0.01
+    exploration_frac: float = 0.50
+    learning_starts: int = 25000
+    replay_ratio: float = 0.25   # updates per env step; the notebook's 1 / train_freq
+
+    n_actors: int = 0            # actor processes; 0 for one per core but the learner's
+    envs_per_actor: int = 8      # games of every actor's OneCarVectorEnv
+    chunk_steps: int = 16        # vector steps per chunk of transitions sent to the learner
+    queue_size: int = 8          # chunks in flight; actors wait when it is full
+    weight_sync: int = 100       # updates between publishing the weights to the actors
+
+    checkpoint_dir: str = None   # save the full state there, and resume from it
+    checkpoint_every: int = 0    # env steps between checkpoints; 0 for only at the end
+
+
+def linear_schedule(start_eps, end_eps, duration, t):
+    slope = (end_eps - start_eps) / duration
+    return max(slope * t + start_eps, end_eps)
+
+
+def _make_envs(n):
+    from vector_env import OneCarVectorEnv
+    return OneCarVectorEnv(n, continuous=False, obs_type="gray_stack", copy=False)
+
+
+def _actor_loop(index, envs, policy, sync, args, steps, chunks, stop):
+    # Play epsilon-greedy on `envs` and send chunks of `chunk_steps` vector
+    # steps to the learner, syncing the policy's weights between chunks
+    T, N = args.chunk_steps, envs.num_envs
+    n_actions = envs.single_action_space.n
+    duration = args.exploration_frac * args.total_timesteps
+    # A resumed actor goes on with new episodes and random numbers
+    rng = np.random.default_rng([args.seed, index, steps[index]])
+    obs, _ = envs.reset(seed=int(rng.integers(2**31)))
+    episode_return = np.zeros(N)
+    episode_length = np.zeros(N, dtype=np.int64)
+
+    while not stop.is_set():
+        sync()
+        chunk = {
+            "obs": np.empty((T + 1,) + obs.shape, obs.dtype),
+            "actions": np.empty((T, N), np.int64),
+            "rewards": np.empty((T, N), np.float32),
+            "terminated": np.empty((T, N), np.bool_),
+            "finals": [],     # (t, game, last observation) of the episodes that ended
+            "episodes": [],   # (return, length) of the episodes that ended
+            "env_seconds": 0.0,      # in envs.step
+            "policy_seconds": 0.0,   # choosing the actions
+        }
+        chunk["obs"][0] = obs
+        for t in range(T):
+            start = time.perf_counter()
+            epsilon = linear_schedule(args.start_eps, args.end_eps, duration, sum(steps))
+            actions = chunk["actions"][t]
+            explore = rng.random(N) < epsilon
+            actions[:] = rng.integers(n_actions, size=N) if explore.all() else policy(obs)
+            actions[explore] = rng.integers(n_actions, size=explore.sum())
+
+            stepped = time.perf_counter()
+            obs, rewards, terminated, truncated, infos = envs.step(actions)
+            chunk["env_seconds"] += time.perf_counter() - stepped
+            chunk["policy_seconds"] += stepped - start
+            chunk["obs"][t + 1] = obs
+            chunk["rewards"][t] = rewards
+            chunk["terminated"][t] = terminated
+            episode_return += rewards
+            episode_length += 1
+            for i in np.flatnonzero(terminated | truncated):
+                chunk["finals"].append((t, i, infos["final_observation"][i].copy()))
+                chunk["episodes"].append((episode_return[i], int(episode_length[i])))
+                episode_return[i] = episode_length[i] = 0
+            steps[index] += N
+
+        while not stop.is_set():
+            try:
+                chunks.put(("chunk", index, chunk), timeout=0.1)
+                break
+            except queue.Full:
+                pass
+
+
+def _actor(index, Model, args, weights, version, steps, chunks, stop):
+    try:
+        import torch
+        torch.set_num_threads(1)
+        envs = _make_envs(args.envs_per_actor)
+        model = Model(envs)
+        params = list(model.parameters())
+        seen = -1
+
+        def sync():
+            nonlocal seen
+            if version.value == seen:
+                return
+            with version.get_lock():
+                seen = version.value
+                flat = torch.from_numpy(np.frombuffer(weights, np.float32).copy())
+            torch.nn.utils.vector_to_parameters(flat, params)
+
+        @torch.no_grad()
+        def policy(obs):
+            return torch.argmax(model(torch.as_tensor(obs)), dim=1).numpy()
+
+        _actor_loop(index, envs, policy, sync, args, steps, chunks, stop)
+    except KeyboardInterrupt:
+        pass
+    except Exception:
+        chunks.put(("error", index, traceback.format_exc()))
+
+
+def _add_chunk(buffer, chunk):
+    # The transitions of a chunk, with the last observation of the episodes
+    # that ended as their next_obs, and those episodes marked as ended
+    obs = chunk["obs"]
+    finals = {}
+    for t, i, final in chunk["finals"]:
+        finals.setdefault(t, []).append((i, final))
+    for t in range(len(chunk["actions"])):
+        next_obs, infos = obs[t + 1], None
+        if t in finals:
+            next_obs = next_obs.copy()
+            infos = {"_final_observation": np.zeros(len(next_obs), dtype=bool)}
+            for i, final in finals[t]:
+                next_obs[i] = final
+                infos["_final_observation"][i] = True   # truncated ones too
+        buffer.add(obs[t], next_obs, chunk["actions"][t], chunk["rewards"][t],
+                   chunk["terminated"][t], infos)
+
+
+def _sample(buffers, batch_size, rng):
+    # A batch drawn from all the actors' buffers, in proportion to their sizes
+    sizes = np.array([b.size() for b in buffers], dtype=np.float64)
+    counts = rng.multinomial(batch_size, sizes / sizes.sum())
+    parts = [b.sample(c) for b, c in zip(buffers, counts) if c]
+    return Samples(*(np.concatenate(field) for field in zip(*parts)))
+
+
+def _learn(args, chunks, buffers, update, sync_target, publish, processes, stats,
+           checkpoint=None, telemetry=None):
+    # Add the actors' chunks to the buffers and run `update` whenever the
+    # updates fall behind replay_ratio * (env steps after learning_starts).
+    # A chunk is only taken when the learner is not behind, so a slow
+    # learner makes the queue fill up and the actors wait.
+    clock = time.perf_counter
+    env_steps, updates = stats["env_steps"], stats["updates"]
+    target_syncs = env_steps // args.target_network_sync
+    checkpoints = env_steps // args.checkpoint_every if args.checkpoint_every else 0
+    while env_steps < args.total_timesteps:
+        due = args.replay_ratio * (env_steps - args.learning_starts)
+        if updates < due:
+            start = clock()
+            update(updates)
+            updates += 1
+            if telemetry is not None:
+                telemetry.observe("update_seconds", clock() - start)
+                telemetry.inc("updates_total")
+            if updates % args.weight_sync == 0:
+                publish()
+        else:
+            start = clock()
+            try:
+                kind, index, chunk = chunks.get(timeout=0.1)
+            except queue.Empty:
+                if telemetry is not None:
+                    telemetry.observe("learner_wait_seconds", clock() - start)
+                dead = [p.name for p in processes if not p.is_alive()]
+                if dead:
+                    raise RuntimeError(f"{', '.join(dead)} exited")
+                continue
+            if kind == "error":
+                raise RuntimeError(f"Actor {index} raised an exception:\n{chunk}")
+            _add_chunk(buffers[index], chunk)
+            env_steps += chunk["actions"].size
+            stats["episodes"].extend(chunk["episodes"])
+            if telemetry is not None:
+                _record_chunk(telemetry, index, chunk, clock() - start)
+
+        if env_steps > args.learning_starts and env_steps // args.target_network_sync > target_syncs:
+            target_syncs = env_steps // args.target_network_sync
+            sync_target()
+        stats["env_steps"], stats["updates"] = env_steps, updates
+        if checkpoint and args.checkpoint_every and env_steps // args.checkpoint_every > checkpoints:
+            checkpoints = env_steps // args.checkpoint_every
+            checkpoint()
+
+
+def _record_chunk(telemetry, index, chunk, seconds):
+    # The learner's wait for the chunk and the actor's time split in it. The
+    # actor_ names keep these apart from a TelemetryWrapper's env metrics.
+    telemetry.observe("learner_wait_seconds", seconds)
+    telemetry.inc("actor_env_steps_total", chunk["actions"].size)
+    telemetry.inc("actor_env_seconds_total", chunk["env_seconds"])
+    telemetry.inc("actor_policy_seconds_total", chunk["policy_seconds"])
+    telemetry.set("actor_env_time_fraction", chunk["env_seconds"]
+                  / max(chunk["env_seconds"] + chunk["policy_seconds"], 1e-9), actor=index)
+    for episode_return, length in chunk["episodes"]:
+        telemetry.observe("actor_episode_return", episode_return)
+        telemetry.observe("actor_episode_length", length)
+        telemetry.inc("actor_episodes_total")
+
+
+def train(Model, args=None, device="cpu", writer=None, context=None, telemetry=None):
+    """
+    The notebook's DQN training, with acting and learning overlapped.
+    `args.n_actors` processes each play `envs_per_actor` games of a
+    `OneCarVectorEnv` (the notebook's 4 stacked grayscale 84x84 frames)
+    epsilon-greedy with their own CPU copy of the Q-network, and send
+    their transitions in chunks through a bounded queue. The learner adds
+    them to one `FrameReplayBuffer` per actor and runs `replay_ratio`
+    updates per env step, while the actors keep playing. Every
+    `weight_sync` updates it publishes the weights in shared memory, and
+    the actors load them before their next chunk.
+
+    With `args.checkpoint_dir`, the buffers, networks, optimizer, counters
+    and RNGs are saved there every `checkpoint_every` env steps and at the
+    end (see checkpoint.py), and a run with a checkpoint there resumes
+    from it; the actors start new episodes.
+
+    `Model` is built as `Model(envs)`, like the notebook's `QNetwork`; with
+    the "spawn" `context` it must be importable. `writer` is an optional
+    `SummaryWriter` and `telemetry` an optional `telemetry.Telemetry`, fed
+    the episodes, the actors' env/policy time split and the learner's
+    update and wait times. Returns the trained Q-network and the run's stats.
+    """
+    import torch
+    from torch import nn, optim
+
+    args = args or TrainArgs()
+    cores = os.cpu_count() or 1
+    n_actors = args.n_actors or max(cores - 1, 1)
+    torch.manual_seed(args.seed)
+    torch.set_num_threads(max(cores - n_actors, 1))
+
+    probe = _make_envs(1)
+    q_network = Model(probe).to(device)
+    target_network = Model(probe).to(device)
+    target_network.load_state_dict(q_network.state_dict())
+    optimizer = optim.Adam(q_network.parameters(), lr=args.learning_rate)
+    mse_loss = nn.MSELoss()
+    buffers = [FrameReplayBuffer(max(args.buffer_size // n_actors, 1), probe.single_observation_space,
+                                 probe.single_action_space, n_envs=args.envs_per_actor,
+                                 seed=[args.seed, i])
+               for i in range(n_actors)]
+    rng = np.random.default_rng(args.seed)
+
+    ctx = mp.get_context(context)
+    params = list(q_network.parameters())
+    weights = ctx.RawArray("f", sum(p.numel() for p in params))
+    version = ctx.Value("q", 0)
+    steps = ctx.RawArray("q", n_actors)   # env steps of every actor, for epsilon
+    chunks = ctx.Queue(args.queue_size)
+    stop = ctx.Event()
+
+    def publish():
+        flat = torch.nn.utils.parameters_to_vector(params).detach().cpu().numpy()
+        with version.get_lock():
+            np.frombuffer(weights, np.float32)[:] = flat
+            version.value += 1
+
+    stats = {"episodes": [], "env_steps": 0, "updates": 0}
+    checkpointer = None
+    if args.checkpoint_dir:
+        from checkpoint import Checkpointer
+        checkpointer = Checkpointer(args.checkpoint_dir)
+    state = {
+        "buffers": {f"replay{i}": b for i, b in enumerate(buffers)},
+        "modules": {"q_network": q_network, "target_network": target_network,
+                    "optimizer": optimizer},
+    }
+
+    def checkpoint():
+        checkpointer.save(stats["env_steps"], **state, extra={
+            "env_steps": stats["env_steps"], "updates": stats["updates"],
+            "actor_steps": list(steps), "rng": rng.bit_generator.state})
+
+    if checkpointer is not None and checkpointer.exists():
+        extra = checkpointer.load(**state, map_location=device)["extra"]
+        stats["env_steps"], stats["updates"] = extra["env_steps"], extra["updates"]
+        steps[:] = extra["actor_steps"]
+        rng.bit_generator.state = extra["rng"]
+    first_steps, first_updates = stats["env_steps"], stats["updates"]
+    start = time.perf_counter()
+
+    def update(i):
+        data = Samples(*(torch.as_tensor(a, device=device)
+                         for a in _sample(buffers, args.batch_size, rng)))
+        with torch.no_grad():
+            target_max, _ = target_network(data.next_observations).max(dim=1)
+            td_target = data.rewards.flatten() + args.gamma * target_max * (1 - data.dones.flatten())
+        old_val = q_network(data.observations).gather(1, data.actions).squeeze()
+        loss = mse_loss(td_target, old_val)
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+
+        if writer is not None and i % 100 == 0:
+            seconds = time.perf_counter() - start
+            writer.add_scalar("losses/td_loss", loss, stats["env_steps"])
+            writer.add_scalar("losses/q_values", old_val.mean().item(), stats["env_steps"])
+            writer.add_scalar("charts/SPS", int((stats["env_steps"] - first_steps) / seconds),
+                              stats["env_steps"])
+            writer.add_scalar("charts/updates_per_sec", (i - first_updates) / seconds,
+                              stats["env_steps"])
+            for episode_return, length in stats["episodes"][stats.get("logged", 0):]:
+                writer.add_scalar("charts/episodic_return", episode_return, stats["env_steps"])
+                writer.add_scalar("charts/episodic_length", length, stats["env_steps"])
+            stats["logged"] = len(stats["episodes"])
+
+    @torch.no_grad()
+    def sync_target():
+        for target_param, param in zip(target_network.parameters(), q_network.parameters()):
+            target_param.copy_(args.tau * param + (1.0 - args.tau) * target_param)
+
+    publish()
+    processes = [ctx.Process(target=_actor, name=f"OneCarActor-{i}", daemon=True,
+                             args=(i, Model, args, weights, version, steps, chunks, stop))
+                 for i in range(n_actors)]
+    for process in processes:
+        process.start()
+    try:
+        _learn(args, chunks, buffers, update, sync_target, publish, processes, stats,
+               checkpoint if checkpointer is not None else None, telemetry)
+    finally:
+        stop.set()
+        for process in processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+        chunks.cancel_join_thread()
+    if checkpointer is not None:
+        checkpoint()
+
+    seconds = time.perf_counter() - start
+    stats.pop("logged", None)
+    stats |= {
+        "seconds": seconds,
+        "steps_per_sec": (stats["env_steps"] - first_steps) / seconds,
+        "updates_per_sec": (stats["updates"] - first_updates) / seconds,
+        "replay_ratio": stats["updates"] / max(stats["env_steps"] - args.learning_starts, 1),
+    }
+    return q_network, stats
@@ -0,0 +1,278 @@
+import json
+
+import numpy as np
+
+from gymnasium import spaces
+from gymnasium.error import InvalidAction
+from gymnasium.utils import seeding
+from gymnasium.vector import VectorEnv
+
+from objects_v3 import EMPTY, OBSTACLE, CIRCLE
+from OneCar_v3 import (STATE_W, STATE_H, STACK_W, STACK_H, VIDEO_H, CAR_HEIGHT, CAR_TOP, CAR_BOTTOM,
+                       OBSTACLE_HEIGHT, GAME_SPEED, MAX_SCORE, SPAWN_GAPS,
+                       GAP_WEIGHTS, LANE_WEIGHTS, OBJECT_WEIGHTS, start_lane, object_slots,
+                       car_action_space)
+from features import feature_space, encode_features
+
+
+class OneCarVectorEnv(VectorEnv):
+    """
+    N OneCar games stepped together with NumPy, following the rules of
+    `OneCarEnv` exactly. Instead of one Sprite per object, every game owns
+    `max_objects` slots in a few (N, max_objects) arrays:
+        obj_kind: EMPTY, OBSTACLE or CIRCLE
+        obj_lane: lane of the object (1-based, as in objects_v3)
+        obj_y:    rect.y of the object
+    Observations are drawn with the `Rasterizer`, or encoded by
+    `encode_features` when `obs_type="features"`; `obs_type="gray_stack"`
+    keeps the last `stack_frames` grayscale 84x84 frames of every game, as
+    `OneCarEnv(obs_type="gray_stack", renderer="numpy")` does. Games that end are reset
+    in the same `step` and their last observation and info are returned in
+    `infos["final_observation"]` and `infos["final_info"]`, like
+    `gym.vector.SyncVectorEnv` does. `n_cars` and the action spaces are
+    those of `OneCarEnv`.
+    """
+    # Arrays that make up the games, see state_dict
+    _STATE = ("car_lane", "spawn_lane", "last_y", "obj_kind", "obj_lane", "obj_y",
+              "score", "observations")
+
+    def __init__(self, num_envs, continuous=True, obs_type="pixels", n_nearest=2,
+                 max_objects=None, copy=True, n_cars=1, stack_frames=4):
+        assert obs_type in ["pixels", "features", "gray_stack"]
+        self.n_cars = n_cars
+        self.continuous = continuous
+        self.obs_type = obs_type
+        self.n_nearest = n_nearest
+        self.max_objects = max_objects = max_objects or object_slots(n_cars)
+        self.copy = copy
+
+        if self.obs_type == "features":
+            observation_space = feature_space(self.n_cars, n_nearest)
+        elif self.obs_type == "gray_stack":
+            observation_space = spaces.Box(
+                low=0, high=255, shape=(stack_frames, STACK_H, STACK_W), dtype=np.uint8
+                )
+        else:
+            observation_space = spaces.Box(
+                low=0, high=255, shape=(STATE_H, STATE_W, 3), dtype=np.uint8
+                )
+        super().__init__(num_envs, observation_space, car_action_space(n_cars, continuous))
+
+        self._np_random, _ = seeding.np_random()
+        self.game_speed = GAME_SPEED
+
+        shape = (num_envs, self.n_cars)
+        self.car_lane = np.zeros(shape, dtype=np.int32)
+        self.spawn_lane = np.zeros(shape, dtype=np.int32)  # lane of the next object
+        self.last_y = np.zeros(shape, dtype=np.int32)      # y of the last object introduced
+
+        shape = (num_envs, max_objects)
+        self.obj_kind = np.zeros(shape, dtype=np.int8)
+        self.obj_lane = np.ones(shape, dtype=np.int32)
+        self.obj_y = np.zeros(shape, dtype=np.int32)
+        self.score = np.zeros(num_envs, dtype=np.int64)
+
+        self._lane_start = 2*np.arange(self.n_cars) + 1
+        self._lane_end = self._lane_start + 1
+        self._start_lane = [start_lane(i) for i in range(self.n_cars)]
+
+        self.rasterizer = None
+        if self.obs_type == "pixels":
+            from raster import Rasterizer
+            self.rasterizer = Rasterizer(self.n_cars)
+        elif self.obs_type == "gray_stack":
+            from raster import Rasterizer
+            self.rasterizer = Rasterizer(self.n_cars, (STACK_W, STACK_H), grayscale=True)
+        self.observations = np.zeros(
+            (num_envs,) + observation_space.shape, dtype=observation_space.dtype
+            )
+
+    @property
+    def np_random(self):
+        return self._np_random
+
+    def reset_wait(self, seed=None, options=None):
+        if seed is not None:
+            # One generator drives all the games
+            self._np_random, _ = seeding.np_random(
+                int(seed) if isinstance(seed, (int, np.integer)) else int(seed[0])
+                )
+        self._reset_games(np.arange(self.num_envs))
+        return self._observations(), {}
+
+    def _reset_games(self, games):
+        n = len(games)
+        self.car_lane[games] = self._start_lane   # car.set_lane(start_lane(i))
+        self.obj_kind[games] = EMPTY
+        self.score[games] = 0
+        self.last_y[games] = VIDEO_H   # as if the last object had left the field
+        self.spawn_lane[games] = self._lane_start + (self.np_random.random((n, self.n_cars)) < 0.5)
+
+        # OneCarEnv.reset takes a do-nothing step
+        noop = np.zeros((n, self.n_cars), dtype=bool)
+        self._tick(games, noop, noop)
+        self.observations[games] = self._observe(
+            np.empty_like(self.observations[games]), games, fresh=True
+            )
+
+    def step_async(self, actions):
+        self._actions = np.asarray(actions)
+
+    def _moves(self, actions, n):
+        # (go_left, go_right) masks of shape (n, n_cars) for a batch of actions
+        if self.continuous:
+            actions = actions.reshape(n, self.n_cars)
+            return actions <= -0.25, actions >= 0.25
+        if not (actions.size == n * self.n_cars and actions.dtype.kind in "iu"
+                and ((0 <= actions) & (actions < 3)).all()):
+            raise InvalidAction(
+                f"You passed the invalid action `{actions}`. "
+                f"The supported action_space is `{self.action_space}`"
+            )
+        actions = actions.reshape(n, self.n_cars)
+        return actions == 1, actions == 2
+
+    def step_wait(self):
+        go_left, go_right = self._moves(self._actions, self.num_envs)
+        rewards, terminated, truncated = self._tick(slice(None), go_left, go_right)
+        self._observe(self.observations, slice(None))
+
+        infos = {}
+        done = terminated | truncated
+        if done.any():
+            games = np.flatnonzero(done)
+            final_observation = np.full(self.num_envs, None, dtype=object)
+            final_info = np.full(self.num_envs, None, dtype=object)
+            for i in games:
+                final_observation[i] = self.observations[i].copy()
+                final_info[i] = {}
+            infos = {
+                "final_observation": final_observation,
+                "_final_observation": done.copy(),
+                "final_info": final_info,
+                "_final_info": done.copy(),
+            }
+            self._reset_games(games)
+
+        return (self._observations(), rewards.astype(np.float64),
+                terminated, truncated, infos)
+
+    def reset_games(self, games):
+        """Reset only `games` (an index array); returns their observations."""
+        games = np.asarray(games)
+        self._reset_games(games)
+        return self.observations[games]
+
+    def step_games(self, games, actions):
+        """
+        Step only `games` (an index array, no repeats) with one action each.
+        Unlike `step`, finished games are not reset: call `reset_games`.
+        Returns (observations, rewards, terminated, truncated) for `games`.
+        """
+        games = np.asarray(games)
+        go_left, go_right = self._moves(np.asarray(actions), len(games))
+        rewards, terminated, truncated = self._tick(games, go_left, go_right)
+        obs = self._observe(np.empty_like(self.observations[games]), games)
+        self.observations[games] = obs
+        return obs, rewards.astype(np.float64), terminated, truncated
+
+    def state_dict(self):
+        """The games and the generator, as NumPy arrays, for checkpoints."""
+        state = {k: getattr(self, k).copy() for k in self._STATE}
+        state["np_random"] = np.array(json.dumps(self.np_random.bit_generator.state))
+        return state
+
+    def load_state_dict(self, state):
+        for k in self._STATE:
+            getattr(self, k)[...] = state[k]
+        self._np_random, _ = seeding.np_random()
+        self._np_random.bit_generator.state = json.loads(str(state["np_random"]))
+
+    def _observe(self, out, games, fresh=False):
+        state = (self.car_lane[games], self.obj_y[games],
+                 self.obj_lane[games], self.obj_kind[games])
+        if self.obs_type == "features":
+            return encode_features(out, *state, self.game_speed, self.n_nearest)
+        if self.obs_type == "gray_stack":
+            # Shift the stacks by one frame; a fresh game repeats its first frame
+            frames = self.rasterizer.draw(np.empty((len(out),) + out.shape[2:], np.uint8),
+                                          *state)
+            if fresh:
+                out[:] = frames[:, None]
+            else:
+                out[:, :-1] = self.observations[games, 1:]
+                out[:, -1] = frames
+            return out
+        return self.rasterizer.draw(out, *state)
+
+    def _observations(self):
+        return self.observations.copy() if self.copy else self.observations
+
+    def _tick(self, games, go_left, go_right):
+        """
+        One step of `OneCarEnv.step` for `games` (index array or slice):
+        move the cars, spawn, move and kill objects, check for collisions
+        or missed circles and update the score.
+        """
+        # Move the cars
+        lane = self.car_lane[games]
+        lane = np.where(go_right & (lane == self._lane_start), self._lane_end, lane)
+        lane = np.where(go_left & (lane == self._lane_end), self._lane_start, lane)
+        self.car_lane[games] = lane
+
+        kind = self.obj_kind[games]
+        obj_lane = self.obj_lane[games]
+        y = self.obj_y[games]
+        last_y = self.last_y[games]
+        spawn_lane = self.spawn_lane[games]
+
+        # Introduce new non-car objects
+        u = self.np_random.random((len(kind), self.n_cars, 3))
+        for i in range(self.n_cars):
+            gap = np.where(u[:, i, 0] < GAP_WEIGHTS[0], SPAWN_GAPS[0], SPAWN_GAPS[1])
+            new = np.flatnonzero(last_y[:, i] > gap)
+            if new.size == 0:
+                continue
+            spawn_lane[new, i] = np.where(u[new, i, 1] < LANE_WEIGHTS[0],
+                                          spawn_lane[new, i],
+                                          4*i - spawn_lane[new, i] + 3)
+            slot = np.argmin(kind[new] != EMPTY, axis=1)   # first free slot
+            if (kind[new, slot] != EMPTY).any():
+                raise RuntimeError(
+                    f"More than max_objects={self.max_objects} objects on the field"
+                )
+            kind[new, slot] = np.where(u[new, i, 2] < OBJECT_WEIGHTS[0], OBSTACLE, CIRCLE)
+            obj_lane[new, slot] = spawn_lane[new, i]
+            y[new, slot] = -OBSTACLE_HEIGHT
+            last_y[new, i] = -OBSTACLE_HEIGHT
+
+        # Move the non-car objects
+        np.add(y, self.game_speed, out=y, where=kind != EMPTY)
+        last_y += self.game_speed
+
+        # Kill the obstacles we have dodged
+        kind[(kind == OBSTACLE) & (y > VIDEO_H - OBSTACLE_HEIGHT)] = EMPTY
+
+        # Objects touching a car: same lane and overlapping rows
+        car = np.take_along_axis(lane, (obj_lane - 1) // 2, axis=1)
+        touching = (car == obj_lane) & (y > CAR_TOP - OBSTACLE_HEIGHT) & (y < CAR_BOTTOM)
+
+        # Check for collisions or missed circles
+        hit = ((kind == OBSTACLE) & touching).any(axis=1)
+        missed = ((kind == CIRCLE) & (y > VIDEO_H - CAR_HEIGHT)).any(axis=1)
+        terminated = hit | missed
+
+        # Update the score
+        collected = (kind == CIRCLE) & touching
+        kind[collected] = EMPTY
+        step_reward = collected.sum(axis=1)
+        score = self.score[games] + step_reward
+        truncated = score >= MAX_SCORE
+
+        self.obj_kind[games] = kind
+        self.obj_lane[games] = obj_lane
+        self.obj_y[games] = y
+        self.last_y[games] = last_y
+        self.spawn_lane[games] = spawn_lane
+        self.score[games] = score
+        return step_reward, terminated, truncated